@@ -14,9 +14,6 @@ import sys
 from psec import __version__
 from psec.app import PythonSecretsApp
 
-# Register handlers to ensure parser arguments are available.
-from psec.secrets_environment.handlers import *  # noqa  pylint: disable=wildcard-import, unused-wildcard-import
-
 
 def main(argv=None):
     """
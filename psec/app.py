@@ -196,6 +196,16 @@ class PythonSecretsApp(App):
             default=False,
             help='Ensure the directory for holding secrets is initialized'
         )
+        parser.add_argument(
+            '--check-basedir-perms',
+            action='store_true',
+            dest='check_basedir_perms',
+            default=False,
+            help=(
+                'Check permissions throughout the secrets base directory '
+                '(not just the environment)'
+            )
+        )
         parser.add_argument(
             '--umask',
             metavar='<umask>',
@@ -320,22 +330,43 @@ class PythonSecretsApp(App):
             ):
                 os.environ['D2_SECRETS_BASEDIR'] = str(self.secrets_basedir)
             self.secrets_file = self.options.secrets_file
-            self.secrets = SecretsEnvironment(
-                environment=self.environment,
-                create_root=False,
+            self.secrets = self.get_secrets_environment(
                 secrets_basedir=self.secrets_basedir,
-                secrets_file=self.secrets_file,
-                export_env_vars=self.options.export_env_vars,
-                preserve_existing=self.options.preserve_existing,
-                verbose_level=self.options.verbose_level,
-                env_var_prefix=self.options.env_var_prefix,
             )
             permissions_check(
                 str(self.secrets_basedir),
                 verbose_level=self.options.verbose_level,
+                environment=(
+                    None if self.options.check_basedir_perms
+                    else self.environment
+                ),
             )
         self.logger.debug("[*] running command '%s'", cmd.cmd_name)
 
+    def get_secrets_environment(self, secrets_basedir=None):
+        """
+        Return a ``SecretsEnvironment`` for the selected environment that
+        uses the global options (secrets file, exporting environment
+        variables, etc.).
+
+        Commands that don't get ``self.secrets`` set up for them (e.g.,
+        ``utils`` commands) can use this to get an environment that
+        behaves the same as the one other commands use.
+        """
+        return SecretsEnvironment(
+            environment=self.options.environment,
+            create_root=False,
+            secrets_basedir=(
+                self.options.secrets_basedir if secrets_basedir is None
+                else secrets_basedir
+            ),
+            secrets_file=self.options.secrets_file,
+            export_env_vars=self.options.export_env_vars,
+            preserve_existing=self.options.preserve_existing,
+            verbose_level=self.options.verbose_level,
+            env_var_prefix=self.options.env_var_prefix,
+        )
+
     def clean_up(self, cmd, result, err):
         self.logger.debug("[-] clean_up command '%s'", cmd.cmd_name)
         if err:
@@ -0,0 +1,325 @@
+# -*- coding: utf-8 -*-
+
+"""
+Catalog of secrets backups.
+
+Records, for each snapshot in the backup store and each older ``.tgz``
+backup in the ``backups`` directory, when it was made, the names of the
+variables in its secrets file, and the hash and size of each file it
+holds. Listing backups, comparing them with the current files, and
+finding the backups that define a variable are answered from the
+catalog, without reading snapshot objects or decompressing tarballs.
+
+The catalog is kept in ``backups/.catalog.json`` (mode ``0600``). A
+backup is read only the first time it is seen (or when a tarball
+changes), and backups that no longer exist are dropped.
+"""
+
+# Standard imports
+import datetime
+import hashlib
+import json
+import logging
+import os
+import tarfile
+
+from fnmatch import fnmatchcase
+from pathlib import Path
+
+# Local imports
+from psec.backup_store import file_sha256
+from psec.utils import (
+    atomic_write,
+    DEFAULT_MODE,
+)
+
+
+logger = logging.getLogger(__name__)
+
+CATALOG_FILE = '.catalog.json'
+CATALOG_VERSION = 1
+TARBALL_SUFFIX = '.tgz'
+# Only these members of tarballs are ever restored. See warning re:
+# Tarfile.extractall() in https://docs.python.org/3/library/tarfile.html
+TARBALL_PREFIXES = ['secrets.json', 'secrets.d/']
+
+
+def get_variables(data):
+    """Return the variable names in the contents of a secrets file."""
+    try:
+        secrets = json.loads(data)
+    except ValueError:
+        return []
+    return sorted(secrets) if isinstance(secrets, dict) else []
+
+
+def is_restorable(name):
+    """Return True if tarball member ``name`` may be restored."""
+    return (
+        '..' not in Path(name).parts
+        and not name.startswith('/')
+        and any(name.startswith(prefix) for prefix in TARBALL_PREFIXES)
+    )
+
+
+class BackupCatalog:
+    """
+    Catalog of the backups for an environment.
+
+      Typical usage example::
+
+          from psec.backup_catalog import BackupCatalog
+
+          catalog = BackupCatalog(
+              store,
+              paths=['secrets.json', 'secrets.d'],
+          ).refresh()
+          for entry in catalog.find_variable('myapp_*'):
+              print(entry['name'])
+    """
+
+    def __init__(self, store, paths):
+        self.store = store
+        # The backed up paths, starting with the secrets file.
+        self.paths = paths
+        self.secrets_file = paths[0]
+        self.backups_path = store.path.parent
+        self.path = self.backups_path / CATALOG_FILE
+        self._entries = {}
+
+    def read(self):
+        """Load the saved catalog, if it is present and usable."""
+        try:
+            catalog = json.loads(self.path.read_text())
+        except (OSError, ValueError):
+            return {}
+        if (
+            not isinstance(catalog, dict)
+            or catalog.get('version') != CATALOG_VERSION
+        ):
+            return {}
+        return catalog.get('backups', {})
+
+    def write(self):
+        """Save the catalog with mode ``0600``."""
+        atomic_write(
+            self.path,
+            json.dumps({
+                'version': CATALOG_VERSION,
+                'backups': self._entries,
+            }),
+            fsync=False,
+        )
+
+    def list_tarballs(self):
+        """Return the ``os.DirEntry`` for each ``.tgz`` backup."""
+        try:
+            return [
+                entry for entry in os.scandir(self.backups_path)
+                if entry.name.endswith(TARBALL_SUFFIX) and entry.is_file()
+            ]
+        except FileNotFoundError:
+            return []
+
+    def catalog_snapshot(self, snapshot_id):
+        """Return the catalog entry for a snapshot."""
+        snapshot = self.store.read_snapshot(snapshot_id)
+        variables = []
+        for entry in snapshot['files']:
+            if entry['path'] == self.secrets_file:
+                variables = get_variables(
+                    self.store.read_file(snapshot_id, entry)
+                )
+        return {
+            'name': snapshot_id,
+            'kind': 'snapshot',
+            'created': snapshot['created'],
+            'files': {
+                entry['path']: [entry['sha256'], entry['size']]
+                for entry in snapshot['files']
+            },
+            'variables': variables,
+        }
+
+    def catalog_tarball(self, path):
+        """Return the catalog entry for a ``.tgz`` backup."""
+        files = {}
+        variables = []
+        with tarfile.open(path, 'r:gz') as tf:
+            for member in tf:
+                if not (member.isfile() and is_restorable(member.name)):
+                    continue
+                data = tf.extractfile(member).read()
+                files[member.name] = [
+                    hashlib.sha256(data).hexdigest(),
+                    len(data),
+                ]
+                if member.name == self.secrets_file:
+                    variables = get_variables(data)
+        st = os.stat(path)
+        return {
+            'name': path.name,
+            'kind': 'tarball',
+            'created': datetime.datetime.fromtimestamp(
+                st.st_mtime, tz=datetime.timezone.utc).isoformat(),
+            'files': files,
+            'variables': variables,
+            'signature': [st.st_size, st.st_mtime_ns],
+        }
+
+    def refresh(self):
+        """
+        Bring the catalog up to date, reading only backups that are
+        not already in it.
+        """
+        saved = self.read()
+        entries = {}
+        for snapshot_id in self.store.list_snapshots():
+            entry = saved.get(snapshot_id)
+            if entry is None or entry['kind'] != 'snapshot':
+                logger.debug("[+] cataloging snapshot '%s'", snapshot_id)
+                entry = self.catalog_snapshot(snapshot_id)
+            entries[snapshot_id] = entry
+        for tarball in self.list_tarballs():
+            st = tarball.stat()
+            entry = saved.get(tarball.name)
+            if (
+                entry is None
+                or entry.get('signature') != [st.st_size, st.st_mtime_ns]
+            ):
+                logger.debug("[+] cataloging backup '%s'", tarball.name)
+                try:
+                    entry = self.catalog_tarball(Path(tarball.path))
+                except (OSError, tarfile.TarError) as err:
+                    logger.warning(
+                        "[-] can't read backup '%s': %s", tarball.name, err
+                    )
+                    continue
+            entries[tarball.name] = entry
+        self._entries = entries
+        if entries != saved:
+            try:
+                self.write()
+            except OSError as err:
+                logger.debug("[-] could not write backup catalog: %s", err)
+        return self
+
+    def entries(self):
+        """Return the catalog entries, newest first."""
+        return sorted(
+            self._entries.values(),
+            key=lambda entry: entry['created'],
+            reverse=True,
+        )
+
+    def get(self, name):
+        """Return the catalog entry for backup ``name``."""
+        try:
+            return self._entries[name]
+        except KeyError:
+            raise RuntimeError(f"[-] backup '{name}' not found")
+
+    def find_variable(self, pattern):
+        """
+        Return the entries (newest first) for the backups with a
+        variable matching ``pattern``.
+        """
+        return [
+            entry for entry in self.entries()
+            if any(fnmatchcase(v, pattern) for v in entry['variables'])
+        ]
+
+    def get_current(self):
+        """
+        Return the current hash and size of the files in the backed up
+        paths, keyed by path.
+        """
+        current = {}
+        for relpath in self.store.iter_files(self.paths):
+            path = self.store.env_path / relpath
+            current[Path(relpath).as_posix()] = [
+                file_sha256(path),
+                path.stat().st_size,
+            ]
+        return current
+
+    def diff(self, name):
+        """
+        Compare backup ``name`` with the current files.
+
+        Returns a list of ``[status, path]`` pairs describing what
+        restoring the backup would do, where ``status`` is ``+`` (file
+        restored), ``-`` (file removed, only for snapshots), or ``M``
+        (file replaced), followed by ``[status, variable]`` pairs for
+        variables that restoring would add or remove.
+        """
+        entry = self.get(name)
+        current = self.get_current()
+        changes = []
+        for path, (sha256, _) in sorted(entry['files'].items()):
+            if path not in current:
+                changes.append(['+', path])
+            elif current[path][0] != sha256:
+                changes.append(['M', path])
+        if entry['kind'] == 'snapshot':
+            changes.extend(
+                ['-', path]
+                for path in sorted(current)
+                if path not in entry['files']
+            )
+        try:
+            current_variables = set(get_variables(
+                (self.store.env_path / self.secrets_file).read_bytes()
+            ))
+        except FileNotFoundError:
+            current_variables = set()
+        variables = set(entry['variables'])
+        changes.extend(
+            ['+', f'variable {v}']
+            for v in sorted(variables - current_variables)
+        )
+        changes.extend(
+            ['-', f'variable {v}']
+            for v in sorted(current_variables - variables)
+        )
+        return changes
+
+    def restore_tarball(self, name):
+        """
+        Restore the files in a ``.tgz`` backup, extracting only the
+        members that differ from the current files.
+
+        Returns the paths of the files that were restored.
+        """
+        entry = self.get(name)
+        current = self.get_current()
+        needed = {
+            path for path, (sha256, _) in entry['files'].items()
+            if current.get(path, [None])[0] != sha256
+        }
+        restored = []
+        if not needed:
+            return restored
+        env_path = self.store.env_path
+        with tarfile.open(self.backups_path / name, 'r:gz') as tf:
+            for member in tf:
+                if member.name not in needed or not member.isfile():
+                    continue
+                path = env_path / member.name
+                path.parent.mkdir(
+                    parents=True, exist_ok=True, mode=DEFAULT_MODE)
+                # Never restore permissions for "other".
+                atomic_write(
+                    path,
+                    tf.extractfile(member).read(),
+                    mode=member.mode & ~0o007,
+                )
+                restored.append(member.name)
+                needed.discard(member.name)
+                if not needed:
+                    # The rest of the archive need not be decompressed.
+                    break
+        return restored
+
+
+# vim: set fileencoding=utf-8 ts=4 sw=4 tw=0 et :
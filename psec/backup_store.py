@@ -0,0 +1,393 @@
+# -*- coding: utf-8 -*-
+
+"""
+Content-addressed, deduplicating store for secrets backups.
+
+Each backup is a snapshot: a small JSON manifest listing the files that
+were backed up (path, mode, size, SHA-256 hash) and the hashes of the
+chunks that hold their contents. Chunks are stored compressed, once per
+unique content, under ``objects/`` and named by the SHA-256 hash of
+their uncompressed data, so backing up an unchanged environment only
+adds a new manifest.
+
+The store lives in ``backups/secrets/`` in the environment directory::
+
+    backups/secrets/
+    ├── objects
+    │   └── 3f
+    │       └── 3fa1...c2
+    └── snapshots
+        └── myenv_2024-10-17T061116.572992+0000.json
+
+Snapshots can be pruned with ``keep_last`` and ``keep_daily`` retention
+policies; chunks no longer referenced by any snapshot are then removed.
+"""
+
+# Standard imports
+import datetime
+import hashlib
+import json
+import logging
+import os
+import stat
+import zlib
+
+from pathlib import Path
+
+# Local imports
+from psec.utils import (
+    atomic_write,
+    file_lock,
+    DEFAULT_MODE,
+)
+
+
+logger = logging.getLogger(__name__)
+
+BACKUPS_DIR = 'backups'
+STORE_DIR = 'secrets'
+OBJECTS_DIR = 'objects'
+SNAPSHOTS_DIR = 'snapshots'
+STORE_LOCK_FILE = '.lock'
+SNAPSHOT_VERSION = 1
+CHUNK_SIZE = 64 * 1024
+
+
+def get_snapshot_id(environment, created):
+    """
+    Return the identifier for a snapshot of ``environment`` taken at
+    ``created`` (an aware ``datetime``).
+    """
+    # '2020-03-01T06:11:16.572992+00:00' -> '2020-03-01T061116.572992+0000'
+    return f"{environment}_{created.isoformat().replace(':', '')}"
+
+
+def file_sha256(path):
+    """
+    Return the SHA-256 hash of the file at ``path``, or ``None`` if it
+    does not exist.
+    """
+    file_hash = hashlib.sha256()
+    try:
+        with open(path, 'rb') as f:
+            for data in iter(lambda: f.read(CHUNK_SIZE), b''):
+                file_hash.update(data)
+    except FileNotFoundError:
+        return None
+    return file_hash.hexdigest()
+
+
+class BackupStore:
+    """
+    Deduplicating snapshot store for the files in an environment.
+
+      Typical usage example::
+
+          from psec.backup_store import BackupStore
+
+          store = BackupStore(env_path)
+          snapshot, _ = store.create_snapshot(
+              environment='myenv',
+              paths=['secrets.json', 'secrets.d'],
+          )
+          store.prune(keep_last=10, keep_daily=7)
+          store.restore_snapshot(snapshot['id'])
+    """
+
+    def __init__(self, env_path, exclude=None):
+        self.env_path = Path(env_path)
+        self.path = self.env_path / BACKUPS_DIR / STORE_DIR
+        self.objects_path = self.path / OBJECTS_DIR
+        self.snapshots_path = self.path / SNAPSHOTS_DIR
+        # File names never backed up or removed on restore.
+        self.exclude = set(exclude or [])
+
+    def create(self):
+        """Create the store directories (mode ``0700``) if necessary."""
+        for path in [self.objects_path, self.snapshots_path]:
+            path.mkdir(parents=True, exist_ok=True, mode=DEFAULT_MODE)
+
+    def lock(self):
+        """Return a context manager holding the store's lock."""
+        self.create()
+        return file_lock(self.path / STORE_LOCK_FILE)
+
+    def get_object_path(self, digest):
+        """Return the path to the chunk with hash ``digest``."""
+        return self.objects_path / digest[:2] / digest
+
+    def put_object(self, data):
+        """
+        Store a chunk (if it is not already stored) and return its hash
+        and whether it was added.
+        """
+        digest = hashlib.sha256(data).hexdigest()
+        object_path = self.get_object_path(digest)
+        if object_path.exists():
+            return digest, False
+        object_path.parent.mkdir(exist_ok=True, mode=DEFAULT_MODE)
+        atomic_write(object_path, zlib.compress(data))
+        return digest, True
+
+    def get_object(self, digest):
+        """Return the contents of the chunk with hash ``digest``."""
+        try:
+            data = zlib.decompress(self.get_object_path(digest).read_bytes())
+        except FileNotFoundError:
+            raise RuntimeError(f"[-] backup object '{digest}' is missing")
+        except zlib.error:
+            data = None
+        if data is None or hashlib.sha256(data).hexdigest() != digest:
+            raise RuntimeError(f"[-] backup object '{digest}' is corrupt")
+        return data
+
+    def iter_files(self, paths):
+        """
+        Yield the paths (relative to the environment directory) of the
+        regular files in ``paths``, descending into directories.
+        """
+        stack = list(reversed(paths))
+        while stack:
+            relpath = stack.pop()
+            path = self.env_path / relpath
+            if path.name in self.exclude or path.is_symlink():
+                continue
+            if path.is_dir():
+                stack.extend(
+                    str(Path(relpath) / name)
+                    for name in sorted(os.listdir(path), reverse=True)
+                )
+            elif path.is_file():
+                yield relpath
+
+    def backup_file(self, relpath):
+        """
+        Store the chunks of a file and return its manifest entry and
+        the number of chunks added.
+        """
+        path = self.env_path / relpath
+        file_hash = hashlib.sha256()
+        chunks = []
+        added = 0
+        with open(path, 'rb') as f:
+            mode = stat.S_IMODE(os.fstat(f.fileno()).st_mode)
+            size = 0
+            while True:
+                data = f.read(CHUNK_SIZE)
+                if not data:
+                    break
+                size += len(data)
+                file_hash.update(data)
+                digest, new = self.put_object(data)
+                chunks.append(digest)
+                added += new
+        entry = {
+            'path': Path(relpath).as_posix(),
+            'mode': mode,
+            'size': size,
+            'sha256': file_hash.hexdigest(),
+            'chunks': chunks,
+        }
+        return entry, added
+
+    def create_snapshot(self, environment, paths, created=None):
+        """
+        Back up the files in ``paths`` (relative to the environment
+        directory).
+
+        Returns the new snapshot's manifest and the number of objects
+        that were added to the store.
+        """
+        if created is None:
+            created = datetime.datetime.now(datetime.timezone.utc)
+        snapshot_id = get_snapshot_id(environment, created)
+        with self.lock():
+            snapshot_path = self.get_snapshot_path(snapshot_id)
+            if snapshot_path.exists():
+                raise RuntimeError(
+                    f"[-] snapshot '{snapshot_id}' already exists"
+                )
+            files = []
+            added = 0
+            for relpath in self.iter_files(paths):
+                entry, new = self.backup_file(relpath)
+                files.append(entry)
+                added += new
+            snapshot = {
+                'version': SNAPSHOT_VERSION,
+                'id': snapshot_id,
+                'environment': environment,
+                'created': created.isoformat(),
+                'paths': [Path(p).as_posix() for p in paths],
+                'files': files,
+            }
+            atomic_write(snapshot_path, json.dumps(snapshot, indent=2))
+        logger.debug(
+            "[+] snapshot '%s': %d files, %d new objects",
+            snapshot_id, len(files), added,
+        )
+        return snapshot, added
+
+    def get_snapshot_path(self, snapshot_id):
+        """Return the path to the manifest for ``snapshot_id``."""
+        if Path(snapshot_id).name != snapshot_id:
+            raise RuntimeError(f"[-] invalid snapshot '{snapshot_id}'")
+        return self.snapshots_path / f'{snapshot_id}.json'
+
+    def list_snapshots(self):
+        """Return the identifiers of all snapshots, oldest first."""
+        try:
+            names = os.listdir(self.snapshots_path)
+        except FileNotFoundError:
+            return []
+        # Identifiers end with a UTC timestamp, so they sort by age.
+        return sorted(
+            name[:-len('.json')]
+            for name in names
+            if name.endswith('.json') and not name.startswith('.')
+        )
+
+    def read_snapshot(self, snapshot_id):
+        """Return the manifest for ``snapshot_id``."""
+        try:
+            snapshot = json.loads(
+                self.get_snapshot_path(snapshot_id).read_text()
+            )
+        except FileNotFoundError:
+            raise RuntimeError(f"[-] snapshot '{snapshot_id}' not found")
+        if snapshot.get('version') != SNAPSHOT_VERSION:
+            raise RuntimeError(
+                f"[-] snapshot '{snapshot_id}' has unsupported version "
+                f"{snapshot.get('version')}"
+            )
+        return snapshot
+
+    def read_file(self, snapshot_id, entry):
+        """
+        Return the contents of the file described by manifest ``entry``
+        in snapshot ``snapshot_id``.
+        """
+        data = b''.join(self.get_object(d) for d in entry['chunks'])
+        if hashlib.sha256(data).hexdigest() != entry['sha256']:
+            raise RuntimeError(
+                f"[-] backup of '{entry['path']}' in snapshot "
+                f"'{snapshot_id}' is corrupt"
+            )
+        return data
+
+    def restore_snapshot(self, snapshot_id, dest=None):
+        """
+        Make the backed up paths in ``dest`` (default: the environment
+        directory) match snapshot ``snapshot_id``, removing files in
+        backed up directories that are not in the snapshot. Files that
+        already match the snapshot are left alone.
+
+        Returns the restored snapshot's manifest.
+        """
+        dest = self.env_path if dest is None else Path(dest)
+        snapshot = self.read_snapshot(snapshot_id)
+        contents = {}
+        for entry in snapshot['files']:
+            relpath = Path(entry['path'])
+            if relpath.is_absolute() or '..' in relpath.parts:
+                raise RuntimeError(
+                    f"[-] snapshot '{snapshot_id}' has invalid path "
+                    f"'{entry['path']}'"
+                )
+            if file_sha256(dest / relpath) == entry['sha256']:
+                contents[entry['path']] = None
+                continue
+            contents[entry['path']] = (
+                self.read_file(snapshot_id, entry),
+                entry['mode'],
+            )
+        # Everything has been read and verified before touching ``dest``.
+        restore = BackupStore(dest, exclude=self.exclude)
+        for relpath in restore.iter_files(snapshot['paths']):
+            if Path(relpath).as_posix() not in contents:
+                logger.debug("[-] removing '%s'", relpath)
+                (dest / relpath).unlink()
+        for relpath, content in contents.items():
+            if content is None:
+                continue
+            data, mode = content
+            path = dest / relpath
+            path.parent.mkdir(parents=True, exist_ok=True, mode=DEFAULT_MODE)
+            # Never restore permissions for "other".
+            atomic_write(path, data, mode=mode & ~0o007)
+        return snapshot
+
+    def select_snapshots(self, keep_last=None, keep_daily=None):
+        """
+        Return the identifiers of the snapshots retained by the
+        ``keep_last`` (most recent snapshots) and ``keep_daily`` (most
+        recent snapshot on each of the most recent days with snapshots)
+        policies.
+        """
+        snapshots = [
+            self.read_snapshot(snapshot_id)
+            for snapshot_id in reversed(self.list_snapshots())
+        ]
+        keep = set()
+        if keep_last:
+            keep.update(s['id'] for s in snapshots[:keep_last])
+        if keep_daily:
+            days = set()
+            for snapshot in snapshots:
+                day = datetime.datetime.fromisoformat(
+                    snapshot['created']
+                ).astimezone(datetime.timezone.utc).date()
+                if day in days:
+                    continue
+                if len(days) == keep_daily:
+                    break
+                days.add(day)
+                keep.add(snapshot['id'])
+        return keep
+
+    def prune(self, keep_last=None, keep_daily=None):
+        """
+        Remove the snapshots not retained by the ``keep_last`` and
+        ``keep_daily`` policies, then the objects no longer referenced
+        by any snapshot.
+
+        Returns the identifiers of the removed snapshots and the number
+        of objects removed.
+        """
+        if not (keep_last or keep_daily):
+            raise RuntimeError('[-] no retention policy specified')
+        with self.lock():
+            keep = self.select_snapshots(
+                keep_last=keep_last,
+                keep_daily=keep_daily,
+            )
+            removed = [s for s in self.list_snapshots() if s not in keep]
+            for snapshot_id in removed:
+                logger.debug("[-] removing snapshot '%s'", snapshot_id)
+                self.get_snapshot_path(snapshot_id).unlink()
+            objects_removed = self.collect_garbage()
+        return removed, objects_removed
+
+    def collect_garbage(self):
+        """
+        Remove objects not referenced by any snapshot (with the store's
+        lock held) and return the number removed.
+        """
+        referenced = set()
+        for snapshot_id in self.list_snapshots():
+            for entry in self.read_snapshot(snapshot_id)['files']:
+                referenced.update(entry['chunks'])
+        removed = 0
+        if not self.objects_path.exists():
+            return removed
+        for prefix in os.scandir(self.objects_path):
+            if not prefix.is_dir(follow_symlinks=False):
+                continue
+            for entry in os.scandir(prefix.path):
+                if entry.name not in referenced:
+                    os.unlink(entry.path)
+                    removed += 1
+        return removed
+
+
+# vim: set fileencoding=utf-8 ts=4 sw=4 tw=0 et :
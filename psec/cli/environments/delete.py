@@ -16,10 +16,8 @@ except ModuleNotFoundError:
 
 from cliff.command import Command
 from psec.secrets_environment import SecretsEnvironment
-from psec.utils import (
-    get_environment_paths,
-    atree,
-)
+from psec.utils import discover_environments
+from psec.utils.tree import atree
 
 
 class EnvironmentsDelete(Command):
@@ -89,10 +87,14 @@ class EnvironmentsDelete(Command):
             choice = parsed_args.environment
         elif stdin.isatty() and 'Bullet' in globals():
             # Give user a chance to choose.
+            # Include environments that need conversion, which can
+            # be deleted even though they can't be used.
             environments = [
-                fpath.name for fpath in get_environment_paths(
+                info.path.name
+                for info in discover_environments(
                     basedir=self.app.secrets_basedir
                 )
+                if info.valid or info.needs_conversion
             ]
             choices = ['<CANCEL>'] + sorted(environments)
             cli = Bullet(prompt="\nSelect environment to delete:",
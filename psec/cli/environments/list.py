@@ -1,14 +1,13 @@
 # -*- coding: utf-8 -*-
 
 import logging
-import os
 import sys
 
 from cliff.lister import Lister
 from psec.utils import (
+    discover_environments,
     get_default_environment,
-    get_environment_paths,
-    is_valid_environment,
+    report_environment,
 )
 
 
@@ -85,23 +84,17 @@ class EnvironmentsList(Lister):
         if parsed_args.aliasing:
             columns.append('AliasFor')
         data = list()
-        for env_path in get_environment_paths(basedir=self.app.secrets_basedir):  # noqa
-            if is_valid_environment(
-                env_path,
-                self.app_args.verbose_level,
-            ):
+        for info in discover_environments(basedir=self.app.secrets_basedir):
+            report_environment(info, self.app_args.verbose_level)
+            if info.valid:
                 is_default = (
-                    "Yes" if env_path.name == default_env
+                    "Yes" if info.path.name == default_env
                     else "No"
                 )
                 if not parsed_args.aliasing:
-                    item = (env_path.name, is_default)
+                    item = (info.path.name, is_default)
                 else:
-                    try:
-                        alias_for = os.path.basename(os.readlink(env_path))
-                    except OSError:
-                        alias_for = ''
-                    item = (env_path.name, is_default, alias_for)
+                    item = (info.path.name, is_default, info.alias_for or '')
                 data.append(item)
         if len(data) == 0:
             sys.exit(1)
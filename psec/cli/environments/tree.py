@@ -5,7 +5,7 @@ import sys
 
 from cliff.command import Command
 from psec.secrets_environment import SecretsEnvironment
-from psec.utils import atree
+from psec.utils.tree import atree
 
 
 class EnvironmentsTree(Command):
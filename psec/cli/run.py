@@ -1,27 +1,38 @@
 # -*- coding: utf-8 -*-
 
 """
-Run a command line as a sub-shell.
+Run a command line with secrets exported to its environment.
 """
 
 import logging
-import shlex
+import os
+import sys
+
 from subprocess import call  # nosec
 
 from cliff.command import Command
 
 # NOTE: Calling subprocess.call() with shell=True can have security
-# implications. To prevent user-supplied data from injecting commands
-# into shell command lines, pass arguments as a list and ensure they
-# are properly quoted.
+# implications. It is only done with ``--shell``, where the arguments
+# are the command line the user wants the shell to interpret.
 
 
 class Run(Command):
     """
-    Run a command line as a sub-shell.
+    Run a command line with secrets exported to its environment.
+
+    The ``run`` subcommand replaces the ``psec`` process with the program
+    named by the first argument (found using ``PATH``), passing it the
+    remaining arguments. No intermediate shell or ``psec`` parent process is
+    left running. To run the command line in a sub-shell instead (e.g., to
+    use a shell builtin like ``umask``, or pipes and variable expansion),
+    use the ``--shell`` option. The arguments are joined with spaces (without
+    quoting) and passed to ``/bin/sh -c``::
 
-    The ``run`` subcommand is used to run a command line in a sub-shell similar
-    to using ``bash -c``.
+        $ psec --umask 0o007 run --shell umask
+        0007
+        $ psec -E run --shell -- 'echo $PYTHON_SECRETS_ENVIRONMENT | tr a-z A-Z'
+        PYTHON_SECRETS
 
     When used with the ``--elapsed`` option, you get more readable elapsed time
     information than with the ``time`` command::
@@ -76,7 +87,9 @@ class Run(Command):
 
     You may use ``--elapsed`` without an environment if you do not need to
     export variables, but when the ``-e`` option is present an environment must
-    exist or you will get an error.
+    exist or you will get an error. (Because ``psec`` must wait for the command
+    to report the elapsed time, it runs the command as a child process when
+    ``--elapsed`` is used.)
 
     If no arguments are specified, this ``--help`` text is output.
     """  # noqa
@@ -85,6 +98,13 @@ class Run(Command):
 
     def get_parser(self, prog_name):
         parser = super().get_parser(prog_name)
+        parser.add_argument(
+            '--shell',
+            action='store_true',
+            dest='shell',
+            default=False,
+            help='Run the command line in a sub-shell'
+        )
         parser.add_argument(
             'arg',
             nargs='*',
@@ -92,18 +112,53 @@ class Run(Command):
             default=['psec', 'run', '--help'])
         return parser
 
+    def get_environment(self, se):
+        """
+        Return the process environment with the environment's secrets
+        exported under their names and export names.
+        """
+        exports = se.get_exported_variables()
+        if se.preserve_existing:
+            for name in exports:
+                if bool(os.getenv(name)):
+                    raise RuntimeError(
+                        "[-] refusing to overwrite environment "
+                        f"variable '{name}'")
+        env = dict(os.environ)
+        env.update(exports)
+        return env
+
     def take_action(self, parsed_args):
         se = self.app.secrets
-        cmd = " ".join(
-            [
-                shlex.quote(a.encode('unicode-escape').decode())
-                for a in parsed_args.arg
-            ]
-        )
+        env = None
         if self.app_args.export_env_vars:
             se.requires_environment()
+            # Build the exported environment once below, rather than
+            # exporting each secret as it is read.
+            se.export_env_vars = False
             se.read_secrets_and_descriptions()
-        return call(cmd, shell=True)  # nosec
+            env = self.get_environment(se)
+        if parsed_args.shell:
+            cmd = " ".join(parsed_args.arg)
+            return call(cmd, shell=True, env=env)  # nosec
+        if self.app_args.elapsed:
+            return call(parsed_args.arg, env=env)  # nosec
+        # The command replaces this process, so nothing after this
+        # point (including the app's clean up) runs.
+        if se is not None and se.changed():
+            se.write_secrets()
+        sys.stdout.flush()
+        sys.stderr.flush()
+        try:
+            os.execvpe(
+                parsed_args.arg[0],
+                parsed_args.arg,
+                env if env is not None else os.environ,
+            )
+        except OSError as err:
+            raise RuntimeError(
+                f"[-] can't run '{parsed_args.arg[0]}': {err.strerror}"
+            )
 
 
 # vim: set fileencoding=utf-8 ts=4 sw=4 tw=0 et :
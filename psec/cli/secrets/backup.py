@@ -4,69 +4,110 @@
 Back up just secrets and descriptions.
 """
 
-import contextlib
-import datetime
 import logging
-import os
-import tarfile
 
 from cliff.command import Command
 
+from psec.backup_store import BackupStore
+from psec.secrets_environment import DESCRIPTIONS_CACHE_FILE
 
-@contextlib.contextmanager
-def cd(path):
-    """Change directory."""
-    old_path = os.getcwd()
-    os.chdir(path)
-    try:
-        yield
-    finally:
-        os.chdir(old_path)
+
+def get_backup_store(se):
+    """Return the ``BackupStore`` for a secrets environment."""
+    return BackupStore(
+        se.get_environment_path(),
+        exclude=[DESCRIPTIONS_CACHE_FILE],
+    )
+
+
+def get_backup_paths(se):
+    """
+    Return the paths (relative to the environment directory) of the
+    secrets file and descriptions directory.
+    """
+    env_path = se.get_environment_path()
+    return [
+        str(se.get_secrets_file_path().relative_to(env_path)),
+        str(se.get_descriptions_path().relative_to(env_path)),
+    ]
 
 
 class SecretsBackup(Command):
     """
     Back up just secrets and descriptions.
 
-    Creates a backup (``tar`` format) of the secrets.json file
-    and all description files.
-    """
+    Creates a snapshot of the secrets.json file and all description
+    files in a deduplicating backup store in the environment's
+    ``backups/secrets`` directory. Files are split into chunks that are
+    stored (compressed) only once no matter how many snapshots contain
+    them, so taking a snapshot of an unchanged environment only adds a
+    small manifest file::
+
+        $ psec secrets backup
+        [+] created snapshot 'myenv_2024-10-17T061116.572992+0000' (8 files, 0 new objects)
+
+    Use ``--keep-last`` and/or ``--keep-daily`` to remove snapshots
+    other than the specified number of most recent snapshots and/or the
+    most recent snapshot on each of the specified number of most recent
+    days with snapshots. Objects no longer used by any snapshot are
+    removed at the same time::
+
+        $ psec secrets backup --keep-last 10 --keep-daily 7
+
+    Use ``secrets restore`` to restore a snapshot.
+    """  # noqa
 
     logger = logging.getLogger(__name__)
 
-    # def get_parser(self, prog_name):
-    #     parser = super().get_parser(prog_name)
-    #     return parser
+    def get_parser(self, prog_name):
+        parser = super().get_parser(prog_name)
+        parser.add_argument(
+            '--keep-last',
+            action='store',
+            type=int,
+            dest='keep_last',
+            metavar='<count>',
+            default=None,
+            help='Keep only the most recent <count> snapshots'
+        )
+        parser.add_argument(
+            '--keep-daily',
+            action='store',
+            type=int,
+            dest='keep_daily',
+            metavar='<days>',
+            default=None,
+            help='Keep the most recent snapshot for each of <days> days'
+        )
+        return parser
 
     def take_action(self, parsed_args):
-        secrets = self.app.secrets
-        secrets.requires_environment()
-        backups_dir = os.path.join(
-            secrets.get_environment_path(),
-            "backups")
-        if not os.path.exists(backups_dir):
-            os.mkdir(backups_dir, mode=0o700)
-        elif not os.path.isdir(backups_dir):
-            raise RuntimeError(f"[-] {backups_dir} is not a directory")
-
-        # '2020-03-01T06:11:16.572992+00:00'
-        iso8601_string = datetime.datetime.utcnow().replace(
-                tzinfo=datetime.timezone.utc).isoformat().replace(":", "")
-        backup_name = f"{secrets.environment}_{iso8601_string}.tgz"
-        backup_path = os.path.join(backups_dir, backup_name)
-
-        # Change directory to allow relative paths in tar file,
-        # then force relative paths (there has to be a better way...
-        # just not right now.)
-        env_path = secrets.get_environment_path() + os.path.sep
-        with cd(env_path):
-            with tarfile.open(backup_path, "w:gz") as tf:
-                tf.add(
-                    secrets.get_secrets_file_path().replace(env_path, "", 1))
-                tf.add(
-                    secrets.get_descriptions_path().replace(env_path, "", 1))
-
-        self.logger.info("[+] created backup '%s'", backup_path)
+        se = self.app.secrets
+        se.requires_environment()
+        for option in ['keep_last', 'keep_daily']:
+            value = getattr(parsed_args, option)
+            if value is not None and value < 1:
+                raise RuntimeError(
+                    f"[-] --{option.replace('_', '-')} must be at least 1"
+                )
+        store = get_backup_store(se)
+        snapshot, added = store.create_snapshot(
+            environment=str(se),
+            paths=get_backup_paths(se),
+        )
+        self.logger.info(
+            "[+] created snapshot '%s' (%d files, %d new objects)",
+            snapshot['id'], len(snapshot['files']), added,
+        )
+        if parsed_args.keep_last or parsed_args.keep_daily:
+            removed, objects_removed = store.prune(
+                keep_last=parsed_args.keep_last,
+                keep_daily=parsed_args.keep_daily,
+            )
+            self.logger.info(
+                "[+] removed %d snapshots and %d objects",
+                len(removed), objects_removed,
+            )
 
 
 # vim: set fileencoding=utf-8 ts=4 sw=4 tw=0 et :
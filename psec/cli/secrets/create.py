@@ -25,12 +25,10 @@ from cliff.command import Command
 from prettytable import PrettyTable
 
 # Local imports
-from psec.secrets_environment import (
-    BOOLEAN_OPTIONS,
-    SECRET_TYPES,
-)
-from psec.utils import (
-    find,
+from psec.secrets_environment import BOOLEAN_OPTIONS
+from psec.secrets_environment.factory import SecretFactory
+from psec.utils import find
+from psec.utils.prompts import (
     prompt_options_dict,
     prompt_options_list,
 )
@@ -55,7 +53,7 @@ def get_description(name=None, defaults=None):
     new_description['Type'] = prompt_options_list(
         prompt=f"Variable type{type_hint}: ",
         default=original_type,
-        options=[item['Type'] for item in SECRET_TYPES]
+        options=SecretFactory.get_secret_types()
     )
     # Prompt (also serves as description) is required
     prompt = ("Descriptive string to prompt user when "
@@ -7,7 +7,7 @@ Describe supported secret types.
 import logging
 
 from cliff.lister import Lister
-from psec.secrets_environment import SECRET_TYPES
+from psec.secrets_environment.factory import SecretFactory
 
 
 class SecretsDescribe(Lister):
@@ -70,8 +70,9 @@ class SecretsDescribe(Lister):
     def take_action(self, parsed_args):
         se = self.app.secrets
         if parsed_args.types:
-            columns = [k.title() for k in SECRET_TYPES[0].keys()]
-            data = [[v for k, v in i.items()] for i in SECRET_TYPES]
+            secret_types = SecretFactory.describe_secret_classes()
+            columns = [k.title() for k in secret_types[0].keys()]
+            data = [[v for k, v in i.items()] for i in secret_types]
         else:
             se.requires_environment()
             se.read_secrets_and_descriptions()
@@ -93,6 +94,7 @@ class SecretsDescribe(Lister):
                 variables = parsed_args.arg \
                     if len(parsed_args.arg) > 0 \
                     else [k for k, v in se.items()]
+            selected = set(variables)
             columns = (
                 'Variable', 'Group', 'Type', 'Prompt', 'Options', 'Help'
             )
@@ -107,7 +109,7 @@ class SecretsDescribe(Lister):
                         se.get_help(k)
                     )
                     for k, v in se.items()
-                    if (k in variables and
+                    if (k in selected and
                         (not parsed_args.undefined or
                          (parsed_args.undefined and v in [None, ''])))
                 ]
@@ -8,14 +8,11 @@ Find defined secrets in environments.
 import logging
 import sys
 
-from pathlib import Path
-
 # External imports
 from cliff.lister import Lister
 
 # Local imports
-from psec.secrets_environment import SecretsEnvironment
-from psec.utils import get_environment_paths
+from psec.secrets_index import SecretsIndex
 
 
 class SecretsFind(Lister):
@@ -40,6 +37,9 @@ class SecretsFind(Lister):
         | tztest      | tanzanite | tanzanite_admin_password   |
         +-------------+-----------+----------------------------+
 
+    Searches use an index kept in the secrets base directory, which is
+    updated for any environments that changed since the last search.
+    Values are not stored in the index, only keyed hashes of them.
     """
 
     logger = logging.getLogger(__name__)
@@ -67,36 +67,22 @@ class SecretsFind(Lister):
         return parser
 
     def take_action(self, parsed_args):
-        data = list()
         columns = ['Environment', 'Group', 'Variable']
         self.logger.info(
             '[+] searching secrets base directory %s',
             self.app.secrets_basedir
         )
-        for env_path in get_environment_paths(
-            basedir=self.app.secrets_basedir,
-        ):
-            environment = Path(env_path).name
-            se = SecretsEnvironment(
-                environment=environment,
-                secrets_basedir=self.app.secrets_basedir,
+        index = SecretsIndex(self.app.secrets_basedir).refresh()
+        if parsed_args.value:
+            data = index.find_values(
+                parsed_args.arg,
+                group=parsed_args.group,
+            )
+        else:
+            data = index.find_names(
+                parsed_args.arg,
+                group=parsed_args.group,
             )
-            se.read_secrets_and_descriptions(ignore_errors=True)
-            matching = list()
-            if parsed_args.value:
-                matching = [
-                    key for key, value in se.Variable.items()
-                    for arg in parsed_args.arg
-                    if arg == value
-                ]
-            else:
-                matching = [
-                    key for key, value in se.Variable.items()
-                    for arg in parsed_args.arg
-                    if arg in key
-                ]
-            for match in matching:
-                data.append([environment, se.Group.get(match), match])
         if len(data) < 1:
             args = ','.join([f"'{arg}'" for arg in parsed_args.arg])
             something_something = (
@@ -6,12 +6,11 @@ Generate values for secrets.
 
 import logging
 
+from collections import OrderedDict
+
 from cliff.command import Command
 
-# Register handlers to ensure parser arguments are available.
-# FIXME: Doing this to enable 'make docs' to work properly.
 from psec.secrets_environment.factory import SecretFactory
-from psec.secrets_environment.handlers import *  # noqa
 
 
 class SecretsGenerate(Command):
@@ -70,7 +69,7 @@ class SecretsGenerate(Command):
         to_change = parsed_args.arg \
             if len(parsed_args.arg) > 0 \
             else [k for k, v in se.items()]
-        cached_result = {}
+        to_generate = OrderedDict()
         for secret in to_change:
             secret_type = se.get_secret_type(secret)
             # >> Issue: [B105:hardcoded_password_string] Possible hardcoded password: 'string'  # noqa
@@ -84,21 +83,20 @@ class SecretsGenerate(Command):
                     "has no type definition")
             default_value = se.get_default_value(secret)
             if parsed_args.from_options and default_value:
-                value = default_value
+                se.set_secret(secret, default_value)
             else:
-                handler = self.app.secret_factory.get_handler(secret_type)
-                value = cached_result.get(
-                    secret_type,
-                    handler.generate_secret(
-                        **dict(parsed_args._get_kwargs())
-                    )
-                )
-                if not parsed_args.unique and handler.is_generable():
-                    cached_result[secret_type] = value
-            if value is not None:
-                self.logger.debug(
-                    "[+] generated %s for %s", secret_type, secret)
-                se.set_secret(secret, value)
+                to_generate[secret] = secret_type
+        kwargs = dict(parsed_args._get_kwargs())
+        unique = kwargs.pop('unique')
+        generated = self.app.secret_factory.generate_secrets(
+            to_generate,
+            unique=unique,
+            **kwargs,
+        )
+        for secret, value in generated.items():
+            self.logger.debug(
+                "[+] generated %s for %s", to_generate[secret], secret)
+            se.set_secret(secret, value)
 
 
 # vim: set fileencoding=utf-8 ts=4 sw=4 tw=0 et :
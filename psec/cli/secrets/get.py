@@ -4,11 +4,78 @@
 Get value associated with a secret.
 """
 
+import json
 import logging
 import os
+import shlex
+import sys
+
+from collections import OrderedDict
+from fnmatch import fnmatchcase
 
 from cliff.command import Command
 
+from psec.daemon import (
+    get_socket_path,
+    psecd_request,
+)
+from psec.exceptions import (
+    PsecdUnavailableError,
+    SecretNotFoundError,
+)
+
+
+OUTPUT_FORMATS = ['value', 'export', 'dotenv', 'json', 'nul']
+
+
+def is_pattern(name):
+    """Return True if ``name`` is a glob pattern."""
+    return any(c in name for c in '*?[')
+
+
+def dotenv_quote(value):
+    """Quote a value for a ``.env`` file."""
+    for char, escaped in [
+        ('\\', '\\\\'),
+        ('"', '\\"'),
+        ('$', '\\$'),
+        ('\n', '\\n'),
+    ]:
+        value = value.replace(char, escaped)
+    return f'"{value}"'
+
+
+def format_values(values, output_format):
+    """
+    Return the text to output for ``values`` (an ordered mapping of
+    variable names to values) in ``output_format``.
+    """
+    if output_format == 'json':
+        return json.dumps(values, indent=2) + '\n'
+    if output_format == 'nul':
+        return ''.join(
+            f"{name}={'' if value is None else value}\0"
+            for name, value in values.items()
+        )
+    lines = []
+    for name, value in values.items():
+        value = '' if value is None else str(value)
+        if output_format == 'export':
+            lines.append(f'export {name}={shlex.quote(value)}')
+        elif output_format == 'dotenv':
+            lines.append(f'{name}={dotenv_quote(value)}')
+        else:
+            lines.append(value)
+    return ''.join(f'{line}\n' for line in lines)
+
+
+def get_content(value):
+    """Return the content of the file at path ``value``, if it exists."""
+    if value is None or not os.path.exists(value):
+        return None
+    with open(value, 'r') as f:
+        return f.read().replace('\n', '')
+
 
 class SecretsGet(Command):
     """
@@ -19,9 +86,23 @@ class SecretsGet(Command):
         $ echo "Jenkins admin password: $(psec secrets get jenkins_admin_password)"
         Jenkins admin password: OZONE.negate.TIPTOP.ocean
 
-    To get values for more than one secret, use `secrets show`
-    with one of the formatting options allowing you to parse
-    the results or otherwise use them as a group.
+    To get values for more than one secret in a single invocation,
+    specify several names, glob patterns (quoted to protect them from
+    the shell), and/or groups with ``--group``, and select an output
+    format with ``--format``::
+
+        $ eval "$(psec secrets get --format export --group jenkins 'consul_*')"
+        $ psec secrets get --format dotenv myapp_pi_password myapp_pi_user > .env
+        $ psec secrets get --format nul --group myapp | xargs -0 -n 1 echo
+
+    The ``export`` and ``dotenv`` formats produce lines setting variables
+    named after the secrets, ``json`` produces an object mapping names to
+    values, and ``nul`` produces ``name=value`` items terminated by NUL
+    characters. The default ``value`` format prints one value per line.
+
+    If the ``psecd`` secrets daemon is running for the secrets base
+    directory, values for secrets specified by name are obtained from it
+    instead of reading the environment's files.
     """  # noqa
 
     logger = logging.getLogger(__name__)
@@ -35,27 +116,120 @@ class SecretsGet(Command):
             default=False,
             help='Get content if secret is a file path'
         )
+        parser.add_argument(
+            '-g', '--group',
+            action='append',
+            dest='groups',
+            metavar='<group>',
+            default=[],
+            help='Get all secrets in group (may be repeated)'
+        )
+        parser.add_argument(
+            '--format',
+            dest='output_format',
+            choices=OUTPUT_FORMATS,
+            default=None,
+            help=f'Output format (choices: {", ".join(OUTPUT_FORMATS)})'
+        )
         parser.add_argument(
             'secret',
-            nargs=1,
+            nargs='*',
             default=None
         )
         return parser
 
-    def take_action(self, parsed_args):
+    def get_values(self, names, groups=None, strict=True):
+        """
+        Get the values of the secrets selected by ``names`` (which may
+        include glob patterns) and ``groups``, preferring ``psecd`` if it
+        is running and only literal names were given.
+
+        Returns an ``OrderedDict`` mapping variable names to values. When
+        ``strict`` is True, names that are not defined raise an exception.
+        """
+        groups = groups or []
+        literal = not groups and not any(is_pattern(n) for n in names)
+        if literal and self.app.secrets_file is None:
+            try:
+                result = psecd_request(
+                    'show' if strict else 'get',
+                    socket_path=get_socket_path(
+                        basedir=self.app.secrets_basedir
+                    ),
+                    environment=str(self.app.secrets),
+                    variables=names,
+                )
+                if strict:
+                    return OrderedDict(
+                        (variable, value) for variable, value, _ in result
+                    )
+                return OrderedDict((n, result.get(n)) for n in names)
+            except PsecdUnavailableError:
+                self.logger.debug('[-] psecd not available')
         se = self.app.secrets
         se.requires_environment()
         se.read_secrets_and_descriptions()
-        if parsed_args.secret is not None:
-            value = se.get_secret(
-                parsed_args.secret.pop(), allow_none=True)
+        if literal and not strict:
+            selected = names
+        else:
+            selected = self.select_variables(se, names, groups)
+        return OrderedDict(
+            (variable, se.get_secret(variable, allow_none=True))
+            for variable in selected
+        )
+
+    @staticmethod
+    def select_variables(se, names, groups):
+        """
+        Return the (unique) variables in ``se`` selected by ``names``
+        and ``groups``, in the order they were selected.
+        """
+        all_items = list(se.keys())
+        known = set(all_items)
+        selected = []
+        for name in names:
+            if is_pattern(name):
+                matches = [i for i in all_items if fnmatchcase(i, name)]
+                if not matches:
+                    raise RuntimeError(f"[-] no secrets match '{name}'")
+                selected.extend(matches)
+            elif name not in known:
+                raise SecretNotFoundError(secret=name)
+            else:
+                selected.append(name)
+        existing_groups = set(se.get_groups())
+        for group in groups:
+            if group not in existing_groups:
+                raise RuntimeError(f"[-] group '{group}' does not exist")
+            selected.extend(se.get_items_from_group(group))
+        return list(OrderedDict.fromkeys(selected))
+
+    def take_action(self, parsed_args):
+        names = parsed_args.secret or []
+        groups = parsed_args.groups
+        if not names and not groups:
+            raise RuntimeError('[-] no secrets specified')
+        if (
+            len(names) == 1
+            and not groups
+            and parsed_args.output_format is None
+            and not is_pattern(names[0])
+        ):
+            value = self.get_values(names, strict=False)[names[0]]
             if not parsed_args.content:
                 print(value)
             else:
-                if os.path.exists(value):
-                    with open(value, 'r') as f:
-                        content = f.read().replace('\n', '')
+                content = get_content(value)
+                if content is not None:
                     print(content)
+            return
+        values = self.get_values(names, groups)
+        if parsed_args.content:
+            for variable, value in values.items():
+                values[variable] = get_content(value)
+        sys.stdout.write(
+            format_values(values, parsed_args.output_format or 'value')
+        )
 
 
 # vim: set fileencoding=utf-8 ts=4 sw=4 tw=0 et :
@@ -1,12 +1,10 @@
 # -*- coding: utf-8 -*-
 
 """
-Restore secrets and descriptions from a backup file.
+Restore secrets and descriptions from a backup.
 """
 
 import logging
-import os
-import tarfile
 
 from sys import stdin
 
@@ -18,18 +16,80 @@ try:
 except ModuleNotFoundError:
     pass
 
+from psec.backup_catalog import BackupCatalog
+from psec.cli.secrets.backup import (
+    get_backup_paths,
+    get_backup_store,
+)
+from psec.utils import file_lock
+
+
+def format_backup_entry(entry):
+    """Return the line listing a backup catalog entry."""
+    size = sum(size for _, size in entry['files'].values())
+    return (
+        f"{entry['name']}  {entry['created']}  "
+        f"{len(entry['files'])} files  {size} bytes  "
+        f"{len(entry['variables'])} variables"
+    )
+
 
 class SecretsRestore(Command):
     """
-    Restore secrets and descriptions from a backup file.
-    """
+    Restore secrets and descriptions from a backup.
+
+    Restores the secrets.json file and description files to their state
+    in a snapshot created by ``secrets backup``. Description files that
+    were not in the snapshot are removed, and files that already match
+    the snapshot are left alone. If no backup is specified, you will be
+    prompted to choose one.
+
+    Backups in the older ``.tgz`` format in the ``backups`` directory
+    can also be restored by specifying their file name. Only the members
+    that differ from the current files are extracted.
+
+    Backups are looked up in a catalog (``backups/.catalog.json``) that
+    records the files and variable names in each backup, so they can be
+    listed, compared with the current files, and searched without being
+    opened. Use ``--list`` to list backups (newest first), ``--variable``
+    to list only backups with variables matching a (glob) pattern, and
+    ``--diff`` to show what restoring a backup would change without
+    restoring it::
 
-    # TODO(dittrich): Finish documenting command.
+        $ psec secrets restore --list --variable 'myapp_*'
+        myenv_2024-10-17T061116.572992+0000  2024-10-17T06:11:16.572992+00:00  8 files  10273 bytes  31 variables
+        $ psec secrets restore --diff myenv_2024-10-17T061116.572992+0000
+        M secrets.json
+        - secrets.d/extra.json
+        + variable myapp_pi_password
+    """  # noqa
 
     logger = logging.getLogger(__name__)
 
     def get_parser(self, prog_name):
         parser = super().get_parser(prog_name)
+        parser.add_argument(
+            '--list',
+            action='store_true',
+            dest='list',
+            default=False,
+            help='List backups'
+        )
+        parser.add_argument(
+            '--variable',
+            action='store',
+            dest='variable',
+            metavar='<pattern>',
+            default=None,
+            help='List backups with variables matching <pattern>'
+        )
+        parser.add_argument(
+            '--diff',
+            action='store_true',
+            dest='diff',
+            default=False,
+            help='Show what restoring the backup would change'
+        )
         parser.add_argument(
             'backup',
             nargs='?',
@@ -38,22 +98,31 @@ class SecretsRestore(Command):
         return parser
 
     def take_action(self, parsed_args):
-        secrets = self.app.secrets
-        secrets.requires_environment()
-        backups_dir = os.path.join(
-            secrets.get_environment_path(),
-            "backups")
-        backups = [fn for fn in
-                   os.listdir(backups_dir)
-                   if fn.endswith('.tgz')]
+        se = self.app.secrets
+        se.requires_environment()
+        catalog = BackupCatalog(
+            get_backup_store(se),
+            paths=get_backup_paths(se),
+        ).refresh()
+        if parsed_args.list or parsed_args.variable is not None:
+            if parsed_args.variable is not None:
+                entries = catalog.find_variable(parsed_args.variable)
+            else:
+                entries = catalog.entries()
+            for entry in entries:
+                print(format_backup_entry(entry), file=self.app.stdout)
+            return
         if parsed_args.backup is not None:
             choice = parsed_args.backup
         elif not (stdin.isatty() and 'Bullet' in globals()):
             # Can't involve user in getting a choice.
-            raise RuntimeError('[-] no backup specified for restore')
+            raise RuntimeError('[-] no backup specified')
         else:
             # Give user a chance to choose.
-            choices = ['<CANCEL>'] + sorted(backups)
+            choices = (
+                ['<CANCEL>']
+                + [entry['name'] for entry in catalog.entries()]
+            )
             cli = Bullet(prompt="\nSelect a backup from which to restore:",
                          choices=choices,
                          indent=0,
@@ -66,20 +135,18 @@ class SecretsRestore(Command):
             if choice == "<CANCEL>":
                 self.logger.info('cancelled restoring from backup')
                 return
-        backup_path = os.path.join(backups_dir, choice)
-        with tarfile.open(backup_path, "r:gz") as tf:
-            # Only select intended files. See warning re: Tarfile.extractall()
-            # in https://docs.python.org/3/library/tarfile.html
-            allowed_prefixes = ['secrets.json', 'secrets.d/']
-            names = [fn for fn in tf.getnames()
-                     if any(fn.startswith(prefix)
-                            for prefix in allowed_prefixes
-                            if '../' not in fn)
-                     ]
-            env_path = secrets.get_environment_path()
-            for name in names:
-                tf.extract(name, path=env_path)
-        self.logger.info('[+] restored backup %s to %s', backup_path, env_path)
+        entry = catalog.get(choice)
+        if parsed_args.diff:
+            for status, path in catalog.diff(choice):
+                print(f'{status} {path}', file=self.app.stdout)
+            return
+        env_path = se.get_environment_path()
+        with file_lock(se.get_secrets_lock_path()):
+            if entry['kind'] == 'tarball':
+                catalog.restore_tarball(choice)
+            else:
+                catalog.store.restore_snapshot(choice)
+        self.logger.info('[+] restored backup %s to %s', choice, env_path)
 
 
 # vim: set fileencoding=utf-8 ts=4 sw=4 tw=0 et :
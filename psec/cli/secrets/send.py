@@ -13,7 +13,11 @@ from cliff.command import Command
 
 # Local imports
 from psec import __version__
-from psec.google_oauth2 import GoogleSMTP
+from psec.google_oauth2 import (
+    GoogleSMTP,
+    GOOGLE_SMTP_HOST,
+    GOOGLE_SMTP_PORT,
+)
 
 
 class SecretsSend(Command):
@@ -22,6 +26,10 @@ class SecretsSend(Command):
 
     Recipients for the secrets are specified as ``USERNAME@EMAIL.ADDRESS``
     strings and/or ``VARIABLE`` references.
+
+    The messages for all recipients are GPG encrypted before any are sent
+    (so a missing key stops the command before anything is sent), then
+    sent over a single authenticated SMTP session.
     """
 
     logger = logging.getLogger(__name__)
@@ -47,9 +55,17 @@ class SecretsSend(Command):
             '-H', '--smtp-host',
             action='store',
             dest='smtp_host',
-            default='localhost',
+            default=GOOGLE_SMTP_HOST,
             help='SMTP host'
         )
+        parser.add_argument(
+            '-P', '--smtp-port',
+            action='store',
+            type=int,
+            dest='smtp_port',
+            default=GOOGLE_SMTP_PORT,
+            help='SMTP port'
+        )
         parser.add_argument(
             '-U', '--smtp-username',
             action='store',
@@ -105,7 +121,9 @@ class SecretsSend(Command):
                 'google_oauth_client_secret'),
             refresh_token=self.refresh_token,
             gpg_encrypt=True,
-            verbose=self.app_args.verbose_level > 1
+            verbose=self.app_args.verbose_level > 1,
+            smtp_host=parsed_args.smtp_host,
+            smtp_port=parsed_args.smtp_port,
         )
         if parsed_args.refresh_token:
             new_refresh_token = googlesmtp.get_authorization()[0]
@@ -151,20 +169,35 @@ class SecretsSend(Command):
             https://github.com/davedittrich/python_secrets
             """
         )
-        for recipient in recipients:
-            msg = googlesmtp.create_msg(
-                parsed_args.smtp_sender,
+        messages = [
+            (
                 recipient,
-                parsed_args.smtp_subject,
-                text_message=message,
-                addendum=addendum,
+                googlesmtp.create_msg(
+                    parsed_args.smtp_sender,
+                    recipient,
+                    parsed_args.smtp_subject,
+                    text_message=message,
+                    addendum=addendum,
+                ),
             )
-            googlesmtp.send_mail(
-                parsed_args.smtp_sender,
-                recipient,
-                msg,
-            )
-            self.logger.info("[+] sent secrets to %s", recipient)
+            for recipient in recipients
+        ]
+        if len(messages) == 0:
+            return None
+        failed = []
+        for recipient, error in googlesmtp.send_mails(
+            parsed_args.smtp_sender,
+            messages,
+        ):
+            if error is None:
+                self.logger.info("[+] sent secrets to %s", recipient)
+            else:
+                self.logger.error(
+                    "[-] sending secrets to %s failed: %s", recipient, error)
+                failed.append(recipient)
+        if len(failed) > 0:
+            raise RuntimeError(
+                f"[-] secrets not sent to {', '.join(failed)}")
 
 
 # vim: set fileencoding=utf-8 ts=4 sw=4 tw=0 et :
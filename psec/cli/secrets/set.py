@@ -16,7 +16,7 @@ from psec.secrets_environment import (
     SecretsEnvironment,
     is_generable,
 )
-from psec.utils import (
+from psec.utils.prompts import (
     prompt_options_list,
     prompt_string,
 )
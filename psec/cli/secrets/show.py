@@ -105,7 +105,7 @@ class SecretsShow(Lister):
         se.requires_environment()
         se.read_secrets_and_descriptions()
         variables = []
-        all_items = [k for k, v in se.items()]
+        all_items = set(se.keys())
         if parsed_args.args_group:
             if len(parsed_args.arg) == 0:
                 raise RuntimeError('[-] no group(s) specified')
@@ -136,12 +136,13 @@ class SecretsShow(Lister):
             variables = parsed_args.arg \
                 if len(parsed_args.arg) > 0 \
                 else [k for k, v in se.items()]
+        selected = set(variables)
         columns = ('Variable', 'Value', 'Export')
         data = ([(k,
                   redact(v, parsed_args.redact),
                   se.get_secret_export(k))
                 for k, v in se.items()
-                if (k in variables and
+                if (k in selected and
                     (not parsed_args.undefined or
                      (parsed_args.undefined and v in [None, ''])))])
         return columns, data
@@ -8,7 +8,7 @@ import sys
 
 from cliff.command import Command
 from psec.secrets_environment import SecretsEnvironment
-from psec.utils import secrets_tree
+from psec.utils.tree import secrets_tree
 
 
 class SecretsTree(Command):
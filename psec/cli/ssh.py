@@ -17,6 +17,12 @@ import time
 from cliff.command import Command
 from jinja2 import Template
 
+from psec.utils import atomic_write
+from psec.utils.known_hosts import (
+    KnownHostsFile,
+    SYSTEM_KNOWN_HOSTS,
+)
+
 logger = logging.getLogger(__name__)
 
 # Delay variables for reading AWS console-output
@@ -32,60 +38,38 @@ REKEY_PLAYBOOK = textwrap.dedent("""\
       gather_facts: '{{ ((host is not defined) or ("127.0.0.1" in host))|ternary("false","true") }}'
       become: yes
       vars:
-        remove_keys: false
+        ssh_hosts: []
+        ssh_host_public_keys: []
+        known_hosts_file: /etc/ssh/ssh_known_hosts
         ansible_python_interpreter: "python3"
 
       tasks:
-        - name: Assert ssh_hosts is defined when removing
-          assert:
-            that:
-            - ssh_hosts is defined
-          when: remove_keys|bool
-
-        - name: Debug ssh_hosts variable
+        - name: Debug ssh_hosts and ssh_host_public_keys variables
           debug:
-            var: ssh_hosts
-          when: remove_keys|bool
-
-        - name: Assert ssh_host_public_keys is defined when adding
-          assert:
-            that:
-              - ssh_host_public_keys is defined
-          when: not remove_keys|bool
-
-        - name: Define ssh_known_hosts_files
-          set_fact:
-            ssh_known_hosts_files: '{{ ssh_known_hosts_files|default([]) + [ item ] }}'
-          with_items:
-            - /etc/ssh/ssh_known_hosts
-           #- /root/.ssh/known_hosts
-           #- '{{ lookup("pipe", "echo ~{{ ansible_user }}/.ssh/known_hosts") }}'
+            msg:
+              ssh_hosts: '{{ ssh_hosts }}'
+              ssh_host_public_keys: '{{ ssh_host_public_keys }}'
+          when: ansible_verbosity > 0
 
         - name: Remove old SSH host keys
-          local_action: known_hosts state=absent path={{ item.0 }} host={{ item.1 }}
+          local_action: known_hosts state=absent path={{ known_hosts_file }} host={{ item }}
           ignore_errors: True
-          with_nested:
-            - '{{ ssh_known_hosts_files }}'
-            - '{{ ssh_hosts }}'
+          loop: '{{ ssh_hosts }}'
           become: true
-          when: remove_keys|bool
 
         - name: Ensure SSH host keys are present
           known_hosts:
             state: present
-            path: '{{ item.0 }}'
-            key: '{{ item.1 }}'
-            host: '{{ item.1.split(" ")[0].split(",")[0] }}'
-          with_nested:
-            - '{{ ssh_known_hosts_files }}'
-            - '{{ ssh_host_public_keys }}'
+            path: '{{ known_hosts_file }}'
+            key: '{{ item }}'
+            host: '{{ item.split(" ")[0].split(",")[0] }}'
+          loop: '{{ ssh_host_public_keys }}'
           ignore_errors: yes
           become: true
-          when: not remove_keys|bool
 
         - name: Fix file permissions on known_hosts file
           file:
-            path: '{{ ssh_known_hosts_files.0 }}'
+            path: '{{ known_hosts_file }}'
             mode: 0o644
           become: true
     """).encode('utf-8')  # noqa
@@ -112,42 +96,147 @@ def _get_type(line):
     return None
 
 
-# Example of key output in the form of a string for pep8.
-"""
-digitalocean_droplet.red (remote-exec): ----- BEGIN SSH HOST KEY FINGERPRINTS -----
-digitalocean_droplet.red (remote-exec): ssh-ed25519 SHA256:8v65hZhe0e207BQaoltof+QJv9dDfQAMhXoL4DYfRw0. root@debian-8-11-1-amd64
-digitalocean_droplet.red (remote-exec): ssh-rsa SHA256:FU1eQ29nUT88vZyWDqi+eLG3+BstP87p2gerThBpj4M. root@debian-8-11-1-amd64
-digitalocean_droplet.red (remote-exec): ----- END SSH HOST KEY FINGERPRINTS -----
-""" # noqa
-
-
-def _parse_fingerprint_terraform(line, host=None):
-    """Parse SSH host fingerprint from terraform output line"""
-    fingerprint = None
-    if line.find('(remote-exec)') > 0:
-        host = line.split(' ')[0].split('.')[-1]
-        fingerprint = line.split(': ', 2)[1]
-    return host, fingerprint
-
-
-# Example of key output in the form of a string for pep8.
-"""
-ec2: -----BEGIN SSH HOST KEY FINGERPRINTS-----
-ec2: 1024 SHA256:LTiTXefHVhoT0/ueGYqySync6tev2VTRqSEFoQhEL0w root@ip-172-31-34-76 (DSA)
-ec2: 256 SHA256:2Ww7AQqN94ySGqzji9kKSFdz/U+IzMGdZpJsqklAsV0 root@ip-172-31-34-76 (ECDSA)
-ec2: 256 SHA256:Lo44FsL/leHOmx1UeyWahpT5MWmNj0/phfeu4cdcaIA no comment (ED25519)
-ec2: 2048 SHA256:xBvRCJWJa101vImgK+GnVOjwJoHFW5stc4bN3O1Bqwg root@ip-172-31-34-76 (RSA)
-ec2: -----END SSH HOST KEY FINGERPRINTS-----
-"""  # noqa
-
+# Regular expressions for parsing console output lines. The examples
+# below show the lines produced by Terraform (DigitalOcean droplets,
+# possibly interleaved for several droplets) and by AWS instances::
+#
+#   digitalocean_droplet.red (remote-exec):   Host: 165.22.163.3
+#   digitalocean_droplet.red (remote-exec): ----- BEGIN SSH HOST KEY FINGERPRINTS -----  # noqa
+#   digitalocean_droplet.red (remote-exec): ssh-ed25519 SHA256:8v65hZhe0e207BQaoltof+QJv9dDfQAMhXoL4DYfRw0. root@debian-8-11-1-amd64  # noqa
+#   digitalocean_droplet.red (remote-exec): ----- END SSH HOST KEY FINGERPRINTS -----  # noqa
+#   digitalocean_droplet.red (remote-exec): ----- BEGIN SSH HOST PUBLIC KEYS -----  # noqa
+#   digitalocean_droplet.red (remote-exec): ssh-ed25519 AAAAC3NzaC1lZDI1NTE5AAAAIA69uuX+ItFoAAe+xE9c+XggGw7Z2Z7t3YVRJxSHMupv root@debian  # noqa
+#   digitalocean_droplet.red (remote-exec): ----- END SSH HOST PUBLIC KEYS -----  # noqa
+#
+#   [+] Host: 3.87.24.100
+#   ec2: -----BEGIN SSH HOST KEY FINGERPRINTS-----
+#   ec2: 256 SHA256:Lo44FsL/leHOmx1UeyWahpT5MWmNj0/phfeu4cdcaIA no comment (ED25519)  # noqa
+#   ec2: -----END SSH HOST KEY FINGERPRINTS-----
+#
+ANSI_ESCAPE = re.compile(r'(\x9B|\x1B\[)[0-?]*[ -\/]*[@-~]')
+CONSOLE_LINE = re.compile(r"""
+    ^(?:ec2:\ *)?
+    (?:digitalocean_droplet\.(?P<name>[a-zA-Z]+):?\ +)?
+    (?P<remote>\(remote-exec\):\ *)?
+    (?:
+        (?P<plus>\[\+\]\ +)?Host:\ *(?P<host>\S*)
+      | -+\ *(?P<marker>BEGIN|END)\ SSH\ HOST
+        \ (?P<section>KEY\ FINGERPRINTS|PUBLIC\ KEYS)\ *-+
+      | (?P<data>.*)
+    )$
+    """, re.VERBOSE)  # noqa
+
+
+class ConsoleOutputParser(object):
+    """
+    Incremental parser for SSH host keys in cloud console output.
+
+    Lines are consumed one at a time. Lines that can't matter (no host
+    is in the middle of a section of keys or fingerprints and the line
+    has no address or section marker) are skipped with substring tests;
+    the rest are matched once against a single combined regular
+    expression. Only the state of each host (which section of output it
+    is in, and its address) is kept, so output of any size can be
+    processed as it is produced.
+
+    ``parse()`` yields ``(kind, host, value)`` tuples as information is
+    found, where ``kind`` is ``address`` (``value`` is a dictionary with
+    ``public_ip`` and ``public_dns``), ``fingerprint``, or ``hostkey``.
+    ``host`` is the DigitalOcean droplet name, or ``None`` for output
+    lines that do not name a droplet.
+    """
 
-def _parse_fingerprint_awsconsole(line, host=None):
-    """Parse SSH host fingerprint from AWS console output"""
-    fingerprint = None
-    if line.startswith('ec2:'):
-        host = host
-        fingerprint = line.split(': ', 2)[1]
-    return host, fingerprint
+    def __init__(self, domain=None, resolve=True):
+        self.domain = domain
+        self.resolve = resolve
+        self._hosts = dict()
+        # Number of hosts in the middle of a section.
+        self._open_sections = 0
+
+    def _get_state(self, host):
+        state = self._hosts.get(host)
+        if state is None:
+            state = self._hosts[host] = {
+                'section': None,
+                'public_ip': None,
+                'public_dns': None,
+            }
+        return state
+
+    def feed(self, line):
+        """
+        Process one line of console output, returning the list of
+        ``(kind, host, value)`` tuples found in it.
+        """
+        if (
+            self._open_sections == 0
+            and 'Host:' not in line
+            and 'SSH HOST' not in line
+        ):
+            return []
+        if '\x1b' in line or '\x9b' in line:
+            line = ANSI_ESCAPE.sub('', line)
+        match = CONSOLE_LINE.match(line.strip())
+        host = match.group('name')
+        state = self._get_state(host)
+        if match.group('marker') is not None:
+            self._open_sections -= state['section'] is not None
+            state['section'] = (
+                match.group('section')
+                if match.group('marker') == 'BEGIN'
+                else None
+            )
+            self._open_sections += state['section'] is not None
+            return []
+        if match.group('host') is not None:
+            address = match.group('host')
+            if address == '':
+                return []
+            if match.group('remote') is not None:
+                # DigitalOcean style from Terraform
+                state['public_ip'] = address
+                state['public_dns'] = f'{host}.{self.domain}'
+            elif match.group('plus') is not None:
+                # AWS style from Pulumi
+                state['public_ip'] = address
+                if self.resolve:
+                    try:
+                        state['public_dns'] = socket.gethostbyaddr(
+                            address)[0]
+                    except Exception:  # nosec
+                        pass
+            else:
+                return []
+            return [(
+                'address',
+                host,
+                {
+                    'public_ip': state['public_ip'],
+                    'public_dns': state['public_dns'],
+                },
+            )]
+        data = match.group('data')
+        if state['section'] is None or not data:
+            return []
+        if state['section'] == 'KEY FINGERPRINTS':
+            return [('fingerprint', host, data)]
+        fields = data.split(' ')
+        if len(fields) < 2:
+            return []
+        return [(
+            'hostkey',
+            host,
+            f"{state['public_dns']},{state['public_ip']} "
+            f"{fields[0]} {fields[1]}",
+        )]
+
+    def parse(self, source):
+        """
+        Yield ``(kind, host, value)`` tuples for the lines read from
+        ``source`` (an iterable of lines).
+        """
+        for line in source:
+            yield from self.feed(line)
 
 
 def _write_fingerprints_pubkeys_to_files(hostdict=None,
@@ -171,7 +260,7 @@ def _write_fingerprints_pubkeys_to_files(hostdict=None,
                 raise RuntimeError(
                     f"[-] '{dir}' exists and is not a directory")
     for host, v in hostdict.items():
-        for fingerprint in v['fingerprint']:
+        for fingerprint in v.get('fingerprint', []):
             dir = os.path.join(known_hosts_root, 'fingerprints', host)
             os.makedirs(dir, exist_ok=True)
             ktype = _get_type(fingerprint)
@@ -180,7 +269,7 @@ def _write_fingerprints_pubkeys_to_files(hostdict=None,
                 f.write(f'{fingerprint}\n')
                 logger.debug("[+] wrote fingerprint to '%s'", fp_file)
 
-        for hostkey in v['hostkey']:
+        for hostkey in v.get('hostkey', []):
             dir = os.path.join(known_hosts_root, 'known_hosts', host)
             os.makedirs(dir, exist_ok=True)
             ktype = _get_type(hostkey)
@@ -202,61 +291,101 @@ def _ansible_verbose(verbose_level=1):
     return flag
 
 
-def _ansible_set_hostkeys(hostkeys,  # nosec
-                          debug=False,
-                          ask_become_pass='--ask-become-pass',
-                          verbose_level=1):
-    """Use Ansible playbook to set SSH known host keys"""
-    with tempfile.NamedTemporaryFile() as playbook:
-        playbook.seek(0)
-        playbook.write(REKEY_PLAYBOOK)
-        playbook.flush()
-        if verbose_level > 2:
-            print(REKEY_PLAYBOOK, file=sys.stderr, flush=True)
-        # TODO(dittrich): Look for local ansible.cfg file
-        cmd = ['ansible-playbook',
-               ask_become_pass,
-               _ansible_verbose(verbose_level),
-               '-e', f"'{hostkeys}'",
-               playbook.name
-               ]
-        ansible = pexpect.spawnu(
-            " ".join([arg for arg in cmd]))
-        ansible.interact()
-        if ansible.isalive():
-            raise RuntimeError('[-] Ansible did not exit gracefully.')
-
-
-def _ansible_remove_hostkeys(hostkeys,  # nosec
-                             debug=False,
-                             ask_become_pass='--ask-become-pass',
+def _ansible_update_hostkeys(add=None,  # nosec
+                             remove=None,
+                             known_hosts_file=SYSTEM_KNOWN_HOSTS,
+                             ask_become_pass='',
                              verbose_level=1):
-    """Use Ansible playbook to remove SSH known host keys"""
-    with tempfile.NamedTemporaryFile() as playbook:
-        playbook.seek(0)
-        playbook.write(REKEY_PLAYBOOK)
-        if verbose_level > 2:
-            print(REKEY_PLAYBOOK, file=sys.stderr, flush=True)
-        playbook.flush()
-        hosts = [i.split()[0]
-                 for i in json.loads(hostkeys)['ssh_host_public_keys']]
-        ssh_hosts = json.dumps({'ssh_hosts': list(set(hosts))})
+    """
+    Use a single Ansible playbook run to remove SSH known host keys for
+    the hosts in ``remove`` and add the known_hosts lines in ``add``.
+    """
+    payload = _hostkeys_payload(
+        add=add,
+        remove=remove,
+        known_hosts_file=known_hosts_file,
+    )
+    if verbose_level > 2:
+        print(REKEY_PLAYBOOK.decode('utf-8'), file=sys.stderr, flush=True)
+    with tempfile.TemporaryDirectory() as tmpdir:
+        playbook = os.path.join(tmpdir, 'rekey.yml')
+        hostkeys = os.path.join(tmpdir, 'hostkeys.json')
+        atomic_write(playbook, REKEY_PLAYBOOK, fsync=False)
+        atomic_write(hostkeys, payload, fsync=False)
         # TODO(dittrich): Look for local ansible.cfg file
-        cmd = ['ansible-playbook',
-               ask_become_pass,
-               _ansible_verbose(verbose_level),
-               '-e', f"'{ssh_hosts}'",
-               '-e', 'remove_keys=true',
-               playbook.name,
-               ]
-        ansible = pexpect.spawnu(
-            " ".join([arg for arg in cmd]))
+        args = [arg for arg in [
+            ask_become_pass,
+            _ansible_verbose(verbose_level),
+            '-e', f'@{hostkeys}',
+            playbook,
+        ] if arg != '']
+        ansible = pexpect.spawnu('ansible-playbook', args=args)
         ansible.interact()
-        # Short delay because randomly this causes an exception
-        # to be thrown. (Am I doing something wrong?)
-        time.sleep(3)
-        if ansible.isalive():
-            raise RuntimeError('[-] Ansible did not exit gracefully.')
+        ansible.close()
+        if ansible.exitstatus != 0:
+            raise RuntimeError(
+                '[-] Ansible error (see stdout and stderr above)')
+
+
+def _hostkeys_payload(add=None,
+                      remove=None,
+                      known_hosts_file=SYSTEM_KNOWN_HOSTS):
+    """Return the JSON variables for the known_hosts playbook."""
+    return json.dumps({
+        'ssh_hosts': sorted(set(remove or [])),
+        'ssh_host_public_keys': list(add or []),
+        'known_hosts_file': str(known_hosts_file),
+    })
+
+
+def _get_hostkey_hosts(hostkeys):
+    """Return the host names in a list of known_hosts lines."""
+    return [
+        host
+        for hostkey in hostkeys
+        for host in hostkey.split(' ')[0].split(',')
+    ]
+
+
+def update_known_hosts(add=None,
+                       remove=None,
+                       known_hosts_file=SYSTEM_KNOWN_HOSTS,
+                       use_ansible=False,
+                       ask_become_pass='',
+                       debug=False,
+                       verbose_level=1):
+    """
+    Remove the SSH known host keys for the hosts in ``remove`` and add
+    the known_hosts lines in ``add``.
+
+    The file is edited in-process (and rewritten atomically) when this
+    process can write to it. Otherwise (or if ``use_ansible`` is True)
+    all of the changes are made by a single run of an Ansible playbook,
+    which can elevate privileges.
+    """
+    known_hosts = KnownHostsFile(known_hosts_file)
+    if not use_ansible and known_hosts.is_writable():
+        removed = known_hosts.remove(remove or [])
+        added = known_hosts.add(add or [])
+        known_hosts.write()
+        logger.info(
+            "[+] removed %d and added %d entries in '%s'",
+            removed, added, known_hosts.path,
+        )
+        return
+    if debug:
+        _ansible_debug(_hostkeys_payload(
+            add=add,
+            remove=remove,
+            known_hosts_file=known_hosts_file,
+        ))
+    _ansible_update_hostkeys(
+        add=add,
+        remove=remove,
+        known_hosts_file=known_hosts_file,
+        ask_become_pass=ask_become_pass,
+        verbose_level=verbose_level,
+    )
 
 
 def _ansible_debug(hostkeys):
@@ -426,9 +555,6 @@ class PublicKeys(object):
         self.instance_id = instance_id
         self.debug = debug
         self.client = None
-        self.ansi_escape = re.compile(r'(\x9B|\x1B\[)[0-?]*[ -\/]*[@-~]')
-        self.digital_ocean_name = re.compile(
-            r'digitalocean_droplet\.([a-zA-Z]+):{0,1} ')
         self.host_info = None
         if known_hosts_root is not None:
             self.host_info = _parse_known_hosts(root=known_hosts_root)
@@ -443,10 +569,6 @@ class PublicKeys(object):
                         except KeyError:
                             self.hostdict[host]['hostkey'] = [pubkey]
 
-    def _strip_ansi_escapes(self, line):
-        # https://www.tutorialspoint.com/How-can-I-remove-the-ANSI-escape-sequences-from-a-string-in-python
-        return self.ansi_escape.sub('', line)
-
     def get_public_ip(self):
         """Return the host IP address"""
         return self.public_ip
@@ -549,122 +671,36 @@ class PublicKeys(object):
         return self.console_output
 
     def process_saved_console_output(self, source=None):
-        """Get console output from stdin or file"""
-        if source is None:
-            raise RuntimeError('[-] no console-output was found')
-        # Sort out just the console output for instances to
-        # then process individually to extract SSH key information.
-
-        console_output = dict()
-        for line in source:
-            line = self._strip_ansi_escapes(line.strip())
-            match = self.digital_ocean_name.match(line)
-            if match is None:
-                short_name = 'None'
-            else:
-                short_name = match.group(1)
-            try:
-                console_output[short_name].append(line)
-            except KeyError:
-                console_output[short_name] = [line]
-
-        for k, v in console_output.items():
-            if len(console_output) > 1 and k == "None":
-                continue
-            self.extract_keys(console_output=v,
-                              short_name=k)
-
-    def _id_host_from_line(self, line):
-        re.match(r'digitalocean_droplet\.([a-zA-Z]+) ', line)
-
-    def extract_keys(self, console_output=[], short_name=None):
         """
-        Extract public keys from console-output text.
+        Get SSH host keys and fingerprints from console output read
+        (one line at a time) from stdin, a file, or a list of lines.
 
-        I will grant that this is a complicated method, which needs to
-        be simplified at some point. But not now. Just trying to get
-        both multi-host Terraform+DigitalOcean and single-host
-        (prototype) Pulumi+AWS SSH key processing to both work at
-        the same time. Make it work now. Make it pretty later.
+        Output lines that don't name a DigitalOcean droplet are only
+        used if no line does.
         """
-
-        # TODO(dittrich): Simplify logic here.
-
-        if console_output is None:
-            raise RuntimeError('[-] no console output to process')
-        in_fingerprints = False
-        in_pubkeys = False
-        fields = list()
-        public_dns = None
-        public_ip = None
-        for line in console_output:
-            # Find short_name at first opportunity.
-            if short_name is None:
-                match = self.digital_ocean_name.match(line)
-                short_name = match.group(1)
-            if line.startswith('ec2: '):
-                line = line[5:].strip()
+        if source is None:
+            raise RuntimeError('[-] no console-output was found')
+        parser = ConsoleOutputParser(domain=self.domain)
+        unnamed = dict()
+        for kind, host, value in parser.parse(source):
+            if host is None:
+                if len(self.hostdict) > 0:
+                    continue
+                hostdict = unnamed
+                host = 'None'
             else:
-                line = line.strip()
-            if line.find('(remote-exec):   Host: ') >= 0:
-                # DigitalOcean style from Terraform
-                _host = line.split(' Host: ')[1]
-                if _host != "":
-                    public_ip = _host
-                    public_dns = f'{short_name}.{self.domain}'
-                    if short_name not in self.hostdict:
-                        self.hostdict[short_name] = dict()
-                    self.hostdict[short_name]['public_ip'] = public_ip  # noqa
-                    self.hostdict[short_name]['public_dns'] = public_dns  # noqa
-            elif line.find('[+] Host: ') >= 0:
-                # AWS style from Pulumi
-                _host = line.split(' Host: ')[1]
-                if _host != "":
-                    public_ip = _host
-                    try:
-                        public_dns = socket.gethostbyaddr(public_ip)[0]
-                    except Exception:
-                        pass
-            elif line.find('BEGIN SSH HOST KEY FINGERPRINTS') >= 0:
-                in_fingerprints = True
-                continue
-            elif line.find('END SSH HOST KEY FINGERPRINTS') >= 0:
-                in_fingerprints = False
-                continue
-            elif line.find('BEGIN SSH HOST PUBLIC KEYS') >= 0:
-                in_pubkeys = True
-                continue
-            elif line.find('END SSH HOST PUBLIC KEYS') >= 0:
-                in_pubkeys = False
-                continue
-            if in_fingerprints:
-                if line.startswith('ec2:'):
-                    hostid, fingerprint = _parse_fingerprint_awsconsole(
-                        line,
-                        name=short_name)
-                else:
-                    hostid, fingerprint = _parse_fingerprint_terraform(line)
-                try:
-                    self.hostdict[short_name]['fingerprint'].extend([fingerprint])  # noqa
-                except KeyError:
-                    self.hostdict[short_name]['fingerprint'] = [fingerprint]
-                if self.debug:
-                    self.logger.info('fingerprint: %s', fingerprint)
-            elif in_pubkeys:
-                # TODO(dittrich): Should use regex instead.
-                fields = line.split(' ')
-                # 'digitalocean_droplet.red (remote-exec): ssh-ed25519 AAAAC3NzaC1lZDI1NTE5AAAAIA69uuX+ItFoAAe+xE9c+XggGw7Z2Z7t3YVRJxSHMupv root@debian.example.com'  # noqa
-                hostid = f"{public_dns},{public_ip}"
-                if fields[1] == '(remote-exec):':
-                    pubkey = f"{hostid} {fields[2]} {fields[3]}"
-                else:
-                    pubkey = f"{hostid} {fields[0]} {fields[1]}"
-                try:
-                    self.hostdict[short_name]['hostkey'].extend([pubkey])
-                except KeyError:
-                    self.hostdict[short_name]['hostkey'] = [pubkey]
-                if self.debug:
-                    self.logger.info('pubkey: %s', pubkey)
+                if len(unnamed) > 0:
+                    unnamed.clear()
+                hostdict = self.hostdict
+            info = hostdict.setdefault(host, dict())
+            if kind == 'address':
+                info.update(value)
+            else:
+                info.setdefault(kind, list()).append(value)
+            if self.debug:
+                self.logger.info('%s: %s', kind, value)
+        self.hostdict.update(unnamed)
+        return self.hostdict
 
     def get_hostfingerprint_list(self):
         """Return the hostfingerprint list"""
@@ -675,6 +711,10 @@ class PublicKeys(object):
         Output JSON with host key material in a dictionary with
         key 'ssh_host_public_key' for use in Ansible playbook.
         """
+        return json.dumps({'ssh_host_public_keys': self.get_hostkeys()})
+
+    def get_hostkeys(self):
+        """Return the known_hosts lines for all hosts."""
         keylist = list()
         if len(self.hostdict) > 0:
             # New multi-host feature.
@@ -689,7 +729,7 @@ class PublicKeys(object):
                     keylist.append(f"{self.public_ip} {key}")
                 if self.public_dns is not None:
                     keylist.append(f"{self.public_dns} {key}")
-        return json.dumps({'ssh_host_public_keys': keylist})
+        return keylist
 
     def get_hostkey_list(self):
         """Return the hostkey list"""
@@ -836,8 +876,11 @@ class SSHKnownHostsAdd(Command):
 
     By default, the public keys are added to the system ``known_hosts``
     file (``/etc/ssh/ssh_known_hosts``, which is not writeable by normal
-    users) for added security. The file is manipulated indirectly using
-    an embedded Ansible playbook.
+    users) for added security. Use ``--known-hosts-file`` to specify a
+    different file. If you can write to the file (e.g., your own
+    ``~/.ssh/known_hosts`` file), it is edited directly. Otherwise it is
+    manipulated indirectly using an embedded Ansible playbook, run once
+    for all hosts. Use ``--use-ansible`` to always use the playbook.
 
     Use ``--show-playbook`` to just see the Ansible playbook without
     running it. Use ``-vvv`` to see the Ansible playbook while it is
@@ -902,6 +945,20 @@ class SSHKnownHostsAdd(Command):
             default=None,
             help='instance ID for getting direct AWS console output'
         )
+        parser.add_argument(
+            '--known-hosts-file',
+            action='store',
+            dest='known_hosts_file',
+            default=SYSTEM_KNOWN_HOSTS,
+            help=f'known_hosts file to update (default: {SYSTEM_KNOWN_HOSTS})'
+        )
+        parser.add_argument(
+            '--use-ansible',
+            action='store_true',
+            dest='use_ansible',
+            default=False,
+            help='Use Ansible even if the known_hosts file is writable'
+        )
         parser.add_argument(
             '--ask-become-pass',
             action='store_const',
@@ -944,14 +1001,13 @@ class SSHKnownHostsAdd(Command):
         public_keys = PublicKeys(
             known_hosts_root=parsed_args.known_hosts_root,
             debug=self.app.options.debug)
-        hostkeys_as_json_string = public_keys.get_hostkey_list_as_json()
-        if self.app.options.debug:
-            _ansible_debug(hostkeys_as_json_string)
-        _ansible_set_hostkeys(
-                hostkeys_as_json_string,
-                debug=self.app.options.debug,
-                ask_become_pass=parsed_args.ask_become_pass,
-                verbose_level=self.app_args.verbose_level)
+        update_known_hosts(
+            add=public_keys.get_hostkeys(),
+            known_hosts_file=parsed_args.known_hosts_file,
+            use_ansible=parsed_args.use_ansible,
+            ask_become_pass=parsed_args.ask_become_pass,
+            debug=self.app.options.debug,
+            verbose_level=self.app_args.verbose_level)
 
 
 class SSHKnownHostsExtract(Command):
@@ -962,6 +1018,18 @@ class SSHKnownHostsExtract(Command):
     it may need to be extracted (e.g., after Pulumi creates AWS
     instances, you need to manually extract the instance log(s)
     in order to post-process them.
+
+    Console output is read from the file named on the command line,
+    or from standard input (when it is not a terminal, or ``-`` is
+    given as the file name), one line at a time, so output can be
+    piped straight from a running command::
+
+        $ terraform apply | tee terraform.log | psec ssh known-hosts extract
+
+    Both Terraform (DigitalOcean) output, with lines for several
+    droplets interleaved, and AWS console output are recognized. The
+    fingerprints and public keys found are written to files in the
+    ``fingerprints/`` and ``known_hosts/`` directories.
     """
 
     logger = logging.getLogger(__name__)
@@ -991,87 +1059,35 @@ class SSHKnownHostsExtract(Command):
         se = self.app.secrets
         se.requires_environment()
         se.read_secrets_and_descriptions()
-
-        # TODO(dittrich): OK, this is hacky, but I am in a hurry right now.
-        # Need to merge the former Bash script multi-host Terraform on
-        # DigitalOcean output processing in ansible-dims-playbooks with
-        # the prototype single-host Pulumi on AWS processing originally
-        # coded here.  For now, just call a different method based on
-        # whether the file name includes 'terraform' vs. 'console-output'
-        # from each source.
-
-        # NOTE: parsed_args.source is a TextIOWrapper.
-        if parsed_args.source.name.find('terraform') >= 0:
-            self._extract_keys_terraform_digitalocean_style(parsed_args)
-        elif parsed_args.source.name.find('console-output') >= 0:
-            self._extract_keys_pulumi_aws_style(parsed_args)
-        else:
-            raise RuntimeError(
-                "[-] don't know how to process " +
-                f"'{parsed_args.source}'")
-
-    def _extract_keys_terraform_digitalocean_style(self, parsed_args):
+        source = parsed_args.source
+        if source is None:
+            if sys.stdin.isatty():
+                raise RuntimeError('[-] no console-output was found')
+            source = sys.stdin
         # TODO(dittrich): The domain is assumed to be defined by do_domain
-        # This should probably be generalized better, but need to move
-        # quicky to get this running.
+        # This should probably be generalized better.
         public_keys = PublicKeys(
-            domain=self.app.secrets.get_secret('do_domain'),
+            domain=se.get_secret('do_domain', allow_none=True),
             debug=self.app.options.debug)
-        if parsed_args.source is not None:
-            public_keys.process_saved_console_output(parsed_args.source)
+        public_keys.process_saved_console_output(source)
+        if len(public_keys.hostdict) == 0:
+            raise RuntimeError(
+                f"[-] no SSH host keys found in '{source.name}'")
         _write_fingerprints_pubkeys_to_files(
             hostdict=public_keys.hostdict,
             known_hosts_root=parsed_args.known_hosts_root)
 
-    def _extract_keys_pulumi_aws_style(self, parsed_args):
-        # Get the instance_id from command line option, or
-        # from console output file name. Avoid a conflict.
-        if (parsed_args.instance_id is not None and
-           not (parsed_args.public_ip is None or parsed_args.public_dns is None)):  # noqa
-            raise RuntimeError(
-                "[-] --instance-id cannot be used with "
-                "either --public-ip or --public-dns")
-        if parsed_args.source is not None:
-            instance_id = get_instance_id_from_source(
-                source=parsed_args.source)
-            if parsed_args.instance_id is not None:
-                if parsed_args.instance_id != instance_id:
-                    raise RuntimeError(
-                        "[-] --instance-id given does not match "
-                        "name of source console log")
-        else:
-            instance_id = parsed_args.instance_id
-
-        public_ip = parsed_args.public_ip
-        public_dns = parsed_args.public_dns
-        public_keys = PublicKeys(public_ip=public_ip,
-                                 public_dns=public_dns,
-                                 instance_id=instance_id,
-                                 debug=self.app.options.debug)
-        if parsed_args.source is not None:
-            public_keys.process_saved_console_output(parsed_args.source)
-        elif instance_id is not None:
-            source = public_keys.retrieve_aws_console_output()
-            public_keys.process_saved_console_output(source)
-        if parsed_args.save_to_files:
-            _write_fingerprints_pubkeys_to_files(
-                hostdict=public_keys.hostdict,
-                known_hosts_root=parsed_args.known_hosts_root)
-        hostkeys_as_json_string = public_keys.get_hostkey_list_as_json()
-        if self.app.options.debug:
-            _ansible_debug(hostkeys_as_json_string)
-        _ansible_set_hostkeys(hostkeys_as_json_string,
-                              debug=self.app.options.debug,
-                              ask_become_pass=parsed_args.ask_become_pass,
-                              verbose_level=self.app_args.verbose_level)
-
 
 class SSHKnownHostsRemove(Command):
     """
     Remove SSH keys from known_hosts file(s).
 
-    This command indirectly manipulates the known hosts file using an
-    embedded Ansible playbook.
+    By default, keys are removed from the system ``known_hosts`` file
+    (``/etc/ssh/ssh_known_hosts``). Use ``--known-hosts-file`` to specify a
+    different file. If you can write to the file, it is edited directly.
+    Otherwise it is manipulated indirectly using an embedded Ansible
+    playbook, run once for all hosts. Use ``--use-ansible`` to always use
+    the playbook.
 
     Use ``--show-playbook`` to just see the Ansible playbook without running
     it. Use ``-vvv`` to see the Ansible playbook while it is being applied.
@@ -1134,6 +1150,20 @@ class SSHKnownHostsRemove(Command):
         #     default=None,
         #     help='instance ID for getting direct AWS'
         # )
+        parser.add_argument(
+            '--known-hosts-file',
+            action='store',
+            dest='known_hosts_file',
+            default=SYSTEM_KNOWN_HOSTS,
+            help=f'known_hosts file to update (default: {SYSTEM_KNOWN_HOSTS})'
+        )
+        parser.add_argument(
+            '--use-ansible',
+            action='store_true',
+            dest='use_ansible',
+            default=False,
+            help='Use Ansible even if the known_hosts file is writable'
+        )
         parser.add_argument(
             '--ask-become-pass',
             action='store_const',
@@ -1171,14 +1201,13 @@ class SSHKnownHostsRemove(Command):
             public_keys = PublicKeys(
                 known_hosts_root=parsed_args.known_hosts_root,
                 debug=self.app.options.debug)
-            hostkeys_as_json_string = public_keys.get_hostkey_list_as_json()
-            if self.app.options.debug:
-                _ansible_debug(hostkeys_as_json_string)
-            _ansible_remove_hostkeys(
-                    hostkeys_as_json_string,
-                    debug=self.app.options.debug,
-                    ask_become_pass=parsed_args.ask_become_pass,
-                    verbose_level=self.app_args.verbose_level)
+            update_known_hosts(
+                remove=_get_hostkey_hosts(public_keys.get_hostkeys()),
+                known_hosts_file=parsed_args.known_hosts_file,
+                use_ansible=parsed_args.use_ansible,
+                ask_become_pass=parsed_args.ask_become_pass,
+                debug=self.app.options.debug,
+                verbose_level=self.app_args.verbose_level)
         else:
             raise RuntimeError(
                 '[!] TODO(dittrich): NOT YET IMPLEMENTED')
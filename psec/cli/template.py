@@ -1,11 +1,275 @@
 # -*- coding: utf-8 -*-
 
+import hashlib
+import json
 import logging
+import os
+
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
 
 from cliff.command import Command
-from jinja2 import (Environment, FileSystemLoader,
+from jinja2 import (Environment, FileSystemBytecodeCache, FileSystemLoader,
                     StrictUndefined, Undefined,
-                    make_logging_undefined, select_autoescape)
+                    make_logging_undefined, meta, select_autoescape)
+
+from psec.backup_store import file_sha256
+from psec.utils import (
+    atomic_write,
+    DEFAULT_MODE,
+)
+
+
+# Directory in the environment's tmpdir for compiled templates.
+TEMPLATE_CACHE_DIR = 'jinja2'
+# File in TEMPLATE_CACHE_DIR recording the variables used by templates.
+TEMPLATE_VARIABLES_FILE = 'variables.json'
+TEMPLATE_VARIABLES_VERSION = 1
+# Suffix removed from template file names in rendered directories.
+TEMPLATE_SUFFIX = '.j2'
+TEMPLATE_JOBS = min(32, (os.cpu_count() or 1) + 4)
+
+
+class TemplateVariablesCache(object):
+    """
+    Cache of the variables and templates referenced by template sources,
+    keyed by the SHA-256 hash of the source, so templates that have not
+    changed don't need to be parsed to find them.
+    """
+
+    def __init__(self, path=None):
+        self.path = path
+        self.entries = dict()
+        self.changed = False
+        if path is None:
+            return
+        try:
+            with open(path, 'r') as f:
+                saved = json.load(f)
+            if saved.get('version') == TEMPLATE_VARIABLES_VERSION:
+                self.entries = saved['templates']
+        except (OSError, ValueError, KeyError, AttributeError):
+            pass
+
+    def get_entry(self, template_env, name):
+        """
+        Return the ``variables`` and ``templates`` (``None`` for a
+        template name that is not a constant) referenced by template
+        ``name``.
+        """
+        source, filename, _ = template_env.loader.get_source(
+            template_env, name)
+        digest = hashlib.sha256(source.encode('utf-8')).hexdigest()
+        entry = self.entries.get(digest)
+        if entry is None:
+            ast = template_env.parse(source, name, filename)
+            entry = {
+                'variables': sorted(meta.find_undeclared_variables(ast)),
+                'templates': list(meta.find_referenced_templates(ast)),
+            }
+            self.entries[digest] = entry
+            self.changed = True
+        return entry
+
+    def write(self):
+        """Save the cache (mode ``0600``), if it changed."""
+        if self.path is None or not self.changed:
+            return
+        atomic_write(
+            self.path,
+            json.dumps({
+                'version': TEMPLATE_VARIABLES_VERSION,
+                'templates': self.entries,
+            }),
+            fsync=False,
+        )
+        self.changed = False
+
+
+def get_template_env(searchpath='.', check_defined=False, cache_dir=None,
+                     logger=None):
+    """
+    Return a Jinja2 ``Environment`` for the templates in ``searchpath``,
+    saving compiled templates in ``cache_dir`` (if not ``None``).
+    """
+    base = Undefined if check_defined else StrictUndefined
+    return Environment(
+        loader=FileSystemLoader(os.path.abspath(searchpath)),
+        autoescape=select_autoescape(
+            disabled_extensions=('txt',),
+            default_for_string=True,
+            default=True,
+        ),
+        undefined=make_logging_undefined(logger=logger, base=base),
+        bytecode_cache=(
+            None if cache_dir is None
+            else FileSystemBytecodeCache(directory=str(cache_dir))
+        ),
+    )
+
+
+def find_template_variables(template_env, name, cache=None, seen=None):
+    """
+    Return the names of the variables that template ``name`` (and the
+    templates it extends, includes, or imports) gets from the context,
+    or ``None`` if they can't be determined because a template name is
+    only known when rendering.
+    """
+    if cache is None:
+        cache = TemplateVariablesCache()
+    if seen is None:
+        seen = {name}
+    entry = cache.get_entry(template_env, name)
+    variables = set(entry['variables'])
+    for template in entry['templates']:
+        if template is None:
+            return None
+        if template in seen:
+            continue
+        seen.add(template)
+        found = find_template_variables(
+            template_env, template, cache=cache, seen=seen)
+        if found is None:
+            return None
+        variables.update(found)
+    return variables
+
+
+def get_template_vars(se, variables=None):
+    """
+    Return the values of the secrets in ``variables`` (default: all
+    secrets) that the environment has, for use as template context.
+    Secrets that are not set have the value ``None``.
+    """
+    se.requires_environment()
+    se.read_secrets_descriptions()
+    try:
+        se.read_secrets()
+    except FileNotFoundError:
+        pass
+    if variables is None:
+        variables = se.keys()
+    known = set(se.keys())
+    return {
+        variable: se.get_secret(variable, allow_none=True)
+        for variable in variables
+        if variable in known
+    }
+
+
+def get_template_cache_dir(se):
+    """
+    Return the directory (mode ``0700``) in the environment's tmpdir for
+    compiled templates.
+    """
+    cache_dir = se.get_tmpdir_path(create_path=True) / TEMPLATE_CACHE_DIR
+    cache_dir.mkdir(exist_ok=True, mode=DEFAULT_MODE)
+    return cache_dir
+
+
+def get_directory_templates(source, dest):
+    """
+    Return ``(template name, destination)`` pairs for the files in
+    directory ``source`` (named relative to it), rendered to the same
+    relative paths in directory ``dest`` (without any ``.j2`` suffix).
+    """
+    source = Path(source)
+    templates = []
+    for root, dirs, files in os.walk(source):
+        dirs.sort()
+        for name in sorted(files):
+            relpath = (Path(root) / name).relative_to(source)
+            output = Path(dest) / relpath
+            if output.suffix == TEMPLATE_SUFFIX:
+                output = output.with_suffix('')
+            templates.append([relpath.as_posix(), output])
+    return templates
+
+
+def read_manifest(path):
+    """
+    Return the ``(template name, destination)`` pairs listed in the
+    manifest file at ``path`` (one ``source dest`` pair per line).
+    """
+    templates = []
+    with open(path, 'r') as f:
+        for lineno, line in enumerate(f, start=1):
+            fields = line.split('#')[0].split()
+            if not fields:
+                continue
+            if len(fields) != 2:
+                raise RuntimeError(
+                    f"[-] {path}:{lineno}: expected 'source dest'")
+            templates.append([fields[0], Path(fields[1])])
+    return templates
+
+
+def get_new_file_mode():
+    """
+    Return the permissions ``open()`` gives new files under the process
+    umask.
+    """
+    mask = os.umask(0)
+    os.umask(mask)
+    return 0o666 & ~mask
+
+
+def write_if_changed(path, text, new_file_mode=None):
+    """
+    Write ``text`` to file ``path`` (atomically, keeping the existing
+    file's permissions) only if that changes its contents, so the file's
+    modification time is left alone when it doesn't. New files (and
+    directories) get the same permissions as files created by ``open()``
+    unless ``new_file_mode`` is given.
+
+    Returns True if the file was written.
+    """
+    data = text.encode('utf-8')
+    if file_sha256(path) == hashlib.sha256(data).hexdigest():
+        return False
+    try:
+        mode = os.stat(path).st_mode & 0o7777
+    except FileNotFoundError:
+        mode = (
+            get_new_file_mode() if new_file_mode is None
+            else new_file_mode
+        )
+    Path(path).parent.mkdir(parents=True, exist_ok=True)
+    atomic_write(path, data, mode=mode, fsync=False)
+    return True
+
+
+def render_templates(template_env, templates, template_vars,
+                     jobs=TEMPLATE_JOBS, write=True):
+    """
+    Render ``(template name, destination)`` pairs in parallel, writing
+    only the destinations whose contents change (if ``write`` is True).
+
+    Returns the destinations that were written and a list of
+    ``(template name, error)`` pairs for the templates that failed.
+    """
+
+    # The umask can't be read without changing it, so read it here
+    # rather than in the rendering threads.
+    new_file_mode = get_new_file_mode()
+
+    def render(template):
+        name, dest = template
+        text = template_env.get_template(name).render(template_vars)
+        return write and write_if_changed(
+            dest, text, new_file_mode=new_file_mode)
+
+    changed = []
+    failed = []
+    with ThreadPoolExecutor(max_workers=jobs) as executor:
+        futures = [executor.submit(render, t) for t in templates]
+        for (name, dest), future in zip(templates, futures):
+            try:
+                if future.result():
+                    changed.append(dest)
+            except Exception as err:  # pylint: disable=broad-except
+                failed.append((name, err))
+    return changed, failed
 
 
 class Template(Command):
@@ -15,8 +279,28 @@ class Template(Command):
     For information on the Jinja2 template engine and how to
     use it, see http://jinja.pocoo.org
 
+    Only the secrets that the template (and any templates it extends,
+    includes, or imports) references are loaded. Compiled templates are
+    cached in the environment's ``tmp`` directory, so rendering a template
+    again doesn't require compiling it again unless it changed.
+
     To assist debugging, use ``--check-defined`` to check that
     all required variables are defined.
+
+    Many templates can be rendered at once (and in parallel, using
+    ``--jobs`` threads), with the environment and the secrets they use
+    loaded only once. If ``source`` is a directory, each file under it is
+    rendered to the same relative path in the ``dest`` directory (without
+    any ``.j2`` suffix), and templates include other templates by their
+    path relative to ``source``. The ``--manifest`` option instead reads
+    ``source dest`` pairs (one per line) from a file. Destination files
+    are only rewritten (atomically, keeping their permissions) when their
+    contents change, so unchanged files keep their modification times. New
+    files get the same permissions (set by the ``--umask`` option) as when
+    rendering a single template::
+
+        $ psec template --manifest templates.txt
+        $ psec template templates/ /etc/myapp/
     """
 
     logger = logging.getLogger(__name__)
@@ -37,6 +321,21 @@ class Template(Command):
             default=False,
             help="Do not require and load an environment"
         )
+        parser.add_argument(
+            '--manifest',
+            action='store',
+            dest='manifest',
+            default=None,
+            help="File listing 'source dest' pairs to render"
+        )
+        parser.add_argument(
+            '--jobs',
+            action='store',
+            type=int,
+            dest='jobs',
+            default=TEMPLATE_JOBS,
+            help="Number of templates rendered at once (batches only)"
+        )
         parser.add_argument(
             'source',
             nargs="?",
@@ -53,26 +352,83 @@ class Template(Command):
 
     def take_action(self, parsed_args):
         se = self.app.secrets
-        if parsed_args.no_env:
-            template_vars = dict()
+        searchpath = '.'
+        if parsed_args.manifest is not None:
+            templates = read_manifest(parsed_args.manifest)
+        elif (
+            parsed_args.source is not None
+            and os.path.isdir(parsed_args.source)
+        ):
+            if parsed_args.dest in [None, '-']:
+                raise RuntimeError(
+                    '[-] a destination directory is required')
+            searchpath = parsed_args.source
+            templates = get_directory_templates(
+                parsed_args.source, parsed_args.dest)
         else:
+            if parsed_args.source is None:
+                raise RuntimeError('[-] no template source specified')
+            templates = None
+        cache_dir = None
+        if not parsed_args.no_env:
             se.requires_environment()
-            se.read_secrets_and_descriptions()
-            template_vars = se.items()
-        template_loader = FileSystemLoader('.')
-        base = Undefined if parsed_args.check_defined is True \
-            else StrictUndefined
-        LoggingUndefined = make_logging_undefined(
+            cache_dir = get_template_cache_dir(se)
+        template_env = get_template_env(
+            searchpath=searchpath,
+            check_defined=parsed_args.check_defined,
+            cache_dir=cache_dir,
             logger=self.logger,
-            base=base)
-        template_env = Environment(
-            loader=template_loader,
-            autoescape=select_autoescape(
-                disabled_extensions=('txt',),
-                default_for_string=True,
-                default=True,
-            ),
-            undefined=LoggingUndefined)
+        )
+        names = (
+            [parsed_args.source] if templates is None
+            else [name for name, _ in templates]
+        )
+        if parsed_args.no_env:
+            template_vars = dict()
+        else:
+            cache = TemplateVariablesCache(
+                cache_dir / TEMPLATE_VARIABLES_FILE)
+            variables = set()
+            for name in names:
+                found = find_template_variables(
+                    template_env,
+                    name,
+                    cache=cache,
+                )
+                if found is None:
+                    variables = None
+                    break
+                variables.update(found)
+            cache.write()
+            self.logger.debug(
+                '[+] templates reference variables: %s',
+                'unknown' if variables is None
+                else ', '.join(sorted(variables))
+            )
+            template_vars = get_template_vars(se, variables)
+        if templates is not None:
+            if parsed_args.jobs < 1:
+                raise RuntimeError('[-] --jobs must be at least 1')
+            changed, failed = render_templates(
+                template_env,
+                templates,
+                template_vars,
+                jobs=parsed_args.jobs,
+                write=not parsed_args.check_defined,
+            )
+            for dest in changed:
+                self.logger.debug("[+] wrote '%s'", dest)
+            self.logger.info(
+                '[+] rendered %d templates (%d changed)',
+                len(templates) - len(failed),
+                len(changed),
+            )
+            if failed:
+                raise RuntimeError(
+                    '[-] failed to render: '
+                    + ', '.join(f"'{name}' ({err})" for name, err in failed)
+                )
+            return
         template = template_env.get_template(parsed_args.source)
         output_text = template.render(template_vars)
         if parsed_args.check_defined is False:
@@ -7,13 +7,19 @@ import textwrap
 import ipaddress
 import logging
 
+from pathlib import Path
+
 from cliff.command import Command
 from cliff.lister import Lister
-from psec.utils import (
+from psec.cli.utils.netblock import get_netblock_cache_path
+from psec.utils.network import (
     get_myip,
     get_myip_methods,
-    get_netblock,
+    get_netblocks,
     myip_methods,
+    MYIP_CACHE_FILE,
+    MYIP_CACHE_TTL,
+    MYIP_RACE_COUNT,
 )
 
 
@@ -45,9 +51,17 @@ class MyIP(Command):
     This is not the most secure way to grant network access as it allows any
     customer using the same provider to also communicate through the firewall,
     but you have to admit that it is better than ``allow ANY``!  ¯\_(ツ)_/¯
+    Netblocks are saved and reused as described in ``utils netblock``.
 
     To see a table of the methods, use ``utils myip methods``.
 
+    The ``race`` method tries several randomly chosen methods at the same
+    time (``--race-count``, default: 3) and uses the first address found, so
+    one slow service does not hold things up. The address it finds is saved
+    in the secrets base directory and reused by the ``race`` method for
+    ``--cache-ttl`` seconds (default: 300, ``0`` disables the cache). Other
+    methods always look up the current address.
+
     KNOWN LIMITATION: Some of the methods may not fully support IPv6 at this
     point. If you find one that doesn't work, try a different one.
 
@@ -76,6 +90,24 @@ class MyIP(Command):
             default=default_method,
             help='Method to use for determining IP address'
         )
+        parser.add_argument(
+            '--race-count',
+            action='store',
+            type=int,
+            dest='race_count',
+            metavar='<count>',
+            default=MYIP_RACE_COUNT,
+            help='Number of methods tried at once by the race method'
+        )
+        parser.add_argument(
+            '--cache-ttl',
+            action='store',
+            type=int,
+            dest='cache_ttl',
+            metavar='<seconds>',
+            default=MYIP_CACHE_TTL,
+            help='Seconds the race method reuses a saved IP address'
+        )
         what = parser.add_mutually_exclusive_group(required=False)
         what.add_argument(
             '-C', '--cidr',
@@ -95,12 +127,27 @@ class MyIP(Command):
         return parser
 
     def take_action(self, parsed_args):
+        basedir = Path(self.app.options.secrets_basedir)
         interface = ipaddress.ip_interface(
-            get_myip(method=parsed_args.method))
+            get_myip(
+                method=parsed_args.method,
+                cache_path=(
+                    basedir / MYIP_CACHE_FILE if basedir.is_dir() else None
+                ),
+                cache_ttl=parsed_args.cache_ttl,
+                count=parsed_args.race_count,
+            ))
         if parsed_args.cidr:
             print(str(interface.with_prefixlen))
         elif parsed_args.netblock:
-            print(get_netblock(ip=interface.ip))
+            ip = str(interface.ip)
+            netblock = get_netblocks(
+                [ip],
+                cache_path=get_netblock_cache_path(basedir),
+            )[ip]
+            if netblock is None:
+                raise RuntimeError(f'[-] WHOIS lookup failed for {ip}')
+            print(netblock)
         else:
             print(str(interface.ip))
 
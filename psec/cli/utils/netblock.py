@@ -1,14 +1,42 @@
 # -*- coding: utf-8 -*-
 
 import logging
+import sys
+
+from pathlib import Path
 
 from cliff.command import Command
-from psec.utils import (
+from psec.utils.network import (
     get_myip,
-    get_netblock,
+    get_netblocks,
+    NETBLOCK_CACHE_FILE,
+    NETBLOCK_CACHE_TTL,
+    NETBLOCK_WORKERS,
 )
 
 
+def get_netblock_cache_path(basedir):
+    """
+    Return the path to the netblock cache in ``basedir``, or ``None``
+    if that directory does not exist.
+    """
+    basedir = Path(basedir)
+    return basedir / NETBLOCK_CACHE_FILE if basedir.is_dir() else None
+
+
+def format_netblocks(ips, netblocks):
+    """
+    Return one ``<ip> <netblock(s)>`` line for each address in ``ips``
+    (including duplicates), in order, with ``-`` in place of the
+    netblock(s) for addresses whose lookup failed.
+    """
+    lines = []
+    for ip in ips:
+        netblock = netblocks.get(str(ip).split('/')[0])
+        lines.append(f"{ip} {'-' if netblock is None else netblock}")
+    return lines
+
+
 class Netblock(Command):
     """
     Get network CIDR block(s) for IP from WHOIS lookup.
@@ -18,8 +46,23 @@ class Netblock(Command):
 
     https://pypi.org/project/ipwhois/
 
-    If no arguments are given, the routable address of the host on which
-    ``psec`` is being run will be determined and used as the default.
+    Addresses are taken from the command line or, if there are none (or
+    the argument ``-`` is given), read from stdin one or more per line.
+    If no addresses are given at all, the routable address of the host on
+    which ``psec`` is being run will be determined and used as the default.
+
+    The netblocks found are saved in the secrets base directory and reused
+    for ``--cache-ttl`` seconds (default: one day, ``0`` disables the
+    cache) for any address they contain, so only addresses outside all
+    known netblocks are looked up. At most ``--max-workers`` lookups are
+    made at the same time.
+
+    For a single address, just its netblock(s) are printed. For more than
+    one, a line with each address and its netblock(s) is printed for every
+    address, in the order the addresses were given (``-`` marks addresses
+    whose lookup failed, which are also reported on stderr)::
+
+        $ psec utils netblock < addresses.txt
     """
 
     logger = logging.getLogger(__name__)
@@ -29,21 +72,68 @@ class Netblock(Command):
 
     def get_parser(self, prog_name):
         parser = super().get_parser(prog_name)
+        parser.add_argument(
+            '--cache-ttl',
+            action='store',
+            type=int,
+            dest='cache_ttl',
+            metavar='<seconds>',
+            default=NETBLOCK_CACHE_TTL,
+            help='Seconds to reuse saved netblocks (0 to disable)'
+        )
+        parser.add_argument(
+            '--max-workers',
+            action='store',
+            type=int,
+            dest='max_workers',
+            metavar='<count>',
+            default=NETBLOCK_WORKERS,
+            help='Maximum number of WHOIS lookups made at once'
+        )
         parser.add_argument(
             'ip',
             nargs='*',
             default=[],
-            help='IP address to use'
+            help="IP address to use ('-' to read from stdin)"
         )
         return parser
 
     def take_action(self, parsed_args):
-        if len(parsed_args.ip) == 0:
+        if parsed_args.max_workers < 1:
+            raise RuntimeError('[-] --max-workers must be at least 1')
+        ips = [ip for ip in parsed_args.ip if ip != '-']
+        if (
+            '-' in parsed_args.ip
+            or (len(ips) == 0 and not sys.stdin.isatty())
+        ):
+            ips.extend(
+                ip for line in sys.stdin
+                for ip in line.split('#')[0].split()
+            )
+        if len(ips) == 0:
             # TODO(dittrich): Just use random for now
             # until refactoring out the choice method.
-            parsed_args.ip.append(get_myip(method='random'))
-        for ip in parsed_args.ip:
-            print(get_netblock(ip=ip))
+            ips.append(get_myip(method='random'))
+        netblocks = get_netblocks(
+            ips,
+            cache_path=get_netblock_cache_path(
+                self.app.options.secrets_basedir),
+            cache_ttl=parsed_args.cache_ttl,
+            max_workers=parsed_args.max_workers,
+        )
+        if len(ips) == 1:
+            netblock = list(netblocks.values())[0]
+            if netblock is not None:
+                print(netblock)
+        else:
+            for line in format_netblocks(ips, netblocks):
+                print(line)
+        failed = [ip for ip, netblock in netblocks.items() if netblock is None]
+        for ip in failed:
+            self.logger.error("[-] no netblock found for '%s'", ip)
+        if len(failed) > 0:
+            raise RuntimeError(
+                f"[-] WHOIS lookup failed for {', '.join(failed)}")
 
 
 # vim: set fileencoding=utf-8 ts=4 sw=4 tw=0 et :
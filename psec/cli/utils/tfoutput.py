@@ -3,12 +3,16 @@
 import json
 import logging
 import os
-import shlex
-import subprocess  # nosec
 
 from cliff.lister import Lister
 from pathlib import Path
 
+from psec.utils.tfstate import (
+    get_output_variables,
+    get_tfstate_outputs,
+    TFSTATE_FILE,
+)
+
 
 # The TfOutput Lister assumes `terraform output` structured as
 # shown here:
@@ -66,72 +70,103 @@ class TfOutput(Lister):
 
     If the ``tfstate`` argument is not provided, this command will attempt to
     search for a ``terraform.tfstate`` file in (1) the active environment's
-    secrets storage directory (see ``environments path``), or (2) the current
-    working directory. The former is documented preferred location for storing
-    this file, since it will contain secrets that *should not* be stored in a
-    source repository directory to avoid potential leaking of those secrets::
+    ``tmp`` directory (where ``utils tfstate backend`` puts it), (2) the
+    active environment's secrets storage directory (see ``environments
+    path``), or (3) the current working directory. The first two are the
+    preferred locations for storing this file, since it will contain secrets
+    that *should not* be stored in a source repository directory to avoid
+    potential leaking of those secrets::
 
         $ psec environments path
         /Users/dittrich/.secrets/psec
+
+    The outputs are read directly from the state file (version 3 or 4)
+    without running ``terraform``. Only the outputs are decoded, so this is
+    fast even for state files with very large resource sections. Use
+    ``--terraform`` to run ``terraform output`` instead (this is also done
+    automatically for state files that can't be read directly, if
+    ``terraform`` is installed).
+
+    The ``--set-secrets`` option saves the outputs as secrets in the active
+    environment. Outputs that are maps are saved as one secret per item,
+    named ``<output>_<key>``, as shown in the table. Variables must have
+    descriptions unless ``--ignore-missing`` is used to skip those that
+    don't. Values that are not strings are saved as JSON.
     """
 
     logger = logging.getLogger(__name__)
 
     def get_parser(self, prog_name):
         parser = super().get_parser(prog_name)
-        tfstate = None
-        try:
-            tfstate = os.path.join(self.app.secrets.get_tmpdir_path(),
-                                   "terraform.tfstate")
-        except AttributeError:
-            pass
+        parser.add_argument(
+            '--terraform',
+            action='store_true',
+            dest='use_terraform',
+            default=False,
+            help='Run terraform to get outputs'
+        )
+        parser.add_argument(
+            '--set-secrets',
+            action='store_true',
+            dest='set_secrets',
+            default=False,
+            help='Save outputs as secrets in the environment'
+        )
+        parser.add_argument(
+            '--ignore-missing',
+            action='store_true',
+            dest='ignore_missing',
+            default=False,
+            help='Skip saving outputs that have no description'
+        )
         parser.add_argument(
             'tfstate',
             nargs='?',
-            default=tfstate,
+            default=None,
             help='Path to Terraform state file'
         )
         return parser
 
     def take_action(self, parsed_args):
-        se = self.app.secrets
+        se = None
+        if (
+            parsed_args.tfstate is None
+            or parsed_args.set_secrets
+        ):
+            se = self.app.get_secrets_environment()
         columns = ('Variable', 'Value')
-        data = list()
         tfstate = parsed_args.tfstate
         if tfstate is None:
-            base = 'terraform.tfstate'
-            tfstate = se.get_environment_path() / base
-            if not os.path.exists(tfstate):
-                tfstate = Path(os.getcwd()) / base
-            if not os.path.exists(tfstate):
+            candidates = [
+                se.get_tmpdir_path() / TFSTATE_FILE,
+                se.get_environment_path() / TFSTATE_FILE,
+                Path(os.getcwd()) / TFSTATE_FILE,
+            ]
+            tfstate = next((c for c in candidates if c.exists()), None)
+            if tfstate is None:
                 raise RuntimeError('[-] no terraform state file specified')
         if not os.path.exists(tfstate):
             raise RuntimeError(f"[-] file does not exist: '{tfstate}'")
-        if self.app_args.verbose_level > 1:
-            # NOTE(dittrich): Not DRY, but spend time fixing later.
-            self.logger.info(
-                ' '.join(['/usr/local/bin/terraform',
-                          'output',
-                          f'-state={tfstate}',
-                          '-json'])
+        self.logger.debug("[+] reading outputs from '%s'", tfstate)
+        data = get_output_variables(
+            get_tfstate_outputs(
+                tfstate,
+                use_terraform=parsed_args.use_terraform,
             )
-        p = subprocess.Popen(
-            [
-                '/usr/local/bin/terraform',
-                'output',
-                f'-state={shlex.quote(tfstate)}',
-                '-json'
-            ],
-            env=dict(os.environ),
-            stdout=subprocess.PIPE,
-            stderr=subprocess.PIPE,
-            shell=False  # nosec
         )
-        jout, err = p.communicate()
-        dout = json.loads(jout.decode('UTF-8'))
-        for prefix in dout.keys():
-            for k, v in dout[prefix]['value'].items():
-                data.append([f"{prefix}_{k}", v])
+        if parsed_args.set_secrets:
+            se.read_secrets_and_descriptions()
+            for variable, value in data:
+                if se.get_type(variable) is None:
+                    if parsed_args.ignore_missing:
+                        continue
+                    raise RuntimeError(
+                        f"[-] variable '{variable}' has no description")
+                se.set_secret(
+                    variable,
+                    value if isinstance(value, str) else json.dumps(value),
+                )
+            se.write_secrets()
         return columns, data
 
 
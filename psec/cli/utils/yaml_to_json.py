@@ -2,17 +2,40 @@
 
 import json
 import logging
+import os
+import stat
 import sys
+import time
 import yaml
 
+from concurrent.futures import (
+    ProcessPoolExecutor,
+    ThreadPoolExecutor,
+)
 from pathlib import Path
 from typing import Union
 from cliff.command import Command
-from psec.utils import safe_delete_file
+from psec.utils import (
+    atomic_write,
+    safe_delete_file,
+    SECRETS_DESCRIPTIONS_DIR,
+)
+
+try:
+    # Use the (much faster) libyaml parser when it is available.
+    from yaml import CSafeLoader as SafeLoader
+except ImportError:
+    from yaml import SafeLoader
 
 
 logger = logging.getLogger(__name__)
 
+YAML_SUFFIXES = ['.yml', '.yaml']
+# Number of original files overwritten and removed at once.
+SHRED_JOBS = 4
+# Number of files handed to a conversion process at a time.
+CONVERT_CHUNKSIZE = 8
+
 
 def get_yaml_files_from_path(path: Path) -> list:
     """
@@ -20,10 +43,131 @@ def get_yaml_files_from_path(path: Path) -> list:
     """
     return [
         fname for fname in path.iterdir()
-        if fname.suffix.lower() in ['.yml', '.yaml']
+        if fname.suffix.lower() in YAML_SUFFIXES
     ]
 
 
+def find_yaml_secrets_files(basedir: Path) -> list:
+    """
+    Return the YAML secrets files (``secrets.yml``) and secrets
+    descriptions files (in ``secrets.d``) for every environment in
+    secrets base directory ``basedir``.
+    """
+    found = []
+    with os.scandir(basedir) as it:
+        env_paths = sorted(
+            Path(entry.path) for entry in it
+            if entry.is_dir() and not entry.name.startswith('.')
+        )
+    for env_path in env_paths:
+        found.extend(
+            env_path / f'secrets{suffix}'
+            for suffix in YAML_SUFFIXES
+            if (env_path / f'secrets{suffix}').is_file()
+        )
+        descriptions = env_path / SECRETS_DESCRIPTIONS_DIR
+        if descriptions.is_dir():
+            found.extend(sorted(get_yaml_files_from_path(descriptions)))
+    return found
+
+
+def load_yaml(stream):
+    """Load YAML content from a string or open file."""
+    return yaml.load(stream, Loader=SafeLoader)  # nosec
+
+
+def convert_yaml_file(yaml_file: Path):
+    """
+    Convert a YAML file to a JSON file with the same base name (written
+    atomically, with the same permissions as the YAML file). The JSON
+    file is not flushed to disk (see ``convert_yaml_files()``).
+
+    Returns the number of bytes converted and an error message (or
+    ``None``), so failures in worker processes can be reported together.
+    """
+    try:
+        with open(yaml_file, 'rb') as f:
+            st = os.fstat(f.fileno())
+            content = load_yaml(f)
+        if not content:
+            return 0, 'no YAML content'
+        atomic_write(
+            yaml_file.with_suffix('.json'),
+            json.dumps(content, indent=2),
+            mode=stat.S_IMODE(st.st_mode),
+            fsync=False,
+        )
+    except (OSError, yaml.YAMLError, TypeError, ValueError) as err:
+        return 0, str(err).replace('\n', ' ')
+    return st.st_size, None
+
+
+def convert_yaml_files(
+    yaml_files: list,
+    keep_original=False,
+    jobs=None,
+    shred_jobs=SHRED_JOBS,
+    verbose=False,
+):
+    """
+    Convert YAML files to JSON files in parallel (using ``jobs``
+    processes), then (unless ``keep_original`` is True) securely delete
+    the YAML files that were converted, ``shred_jobs`` at a time. The
+    JSON files are flushed to disk all at once, before any YAML files
+    are deleted.
+
+    Returns a list of ``(path, error)`` pairs for files that could not
+    be converted.
+    """
+    yaml_files = list(yaml_files)
+    failed = []
+    converted = []
+    size = 0
+    if verbose:
+        for yaml_file in yaml_files:
+            logger.info("[+] converting '%s' to JSON", yaml_file)
+    start = time.monotonic()
+    if len(yaml_files) > 1 and jobs != 1:
+        with ProcessPoolExecutor(max_workers=jobs) as executor:
+            results = list(executor.map(
+                convert_yaml_file,
+                yaml_files,
+                chunksize=CONVERT_CHUNKSIZE,
+            ))
+    else:
+        results = [convert_yaml_file(path) for path in yaml_files]
+    for yaml_file, (nbytes, error) in zip(yaml_files, results):
+        if error is not None:
+            logger.error("[-] can't convert '%s': %s", yaml_file, error)
+            failed.append((yaml_file, error))
+            continue
+        converted.append(yaml_file)
+        size += nbytes
+    if converted and hasattr(os, 'sync'):
+        os.sync()
+    elapsed = max(time.monotonic() - start, 1e-6)
+    if verbose:
+        logger.info(
+            '[+] converted %d files (%.1f KiB) in %.2fs: '
+            '%.1f files/s, %.1f KiB/s',
+            len(converted), size / 1024, elapsed,
+            len(converted) / elapsed, size / 1024 / elapsed,
+        )
+    if not keep_original and converted:
+        start = time.monotonic()
+        with ThreadPoolExecutor(max_workers=shred_jobs) as executor:
+            list(executor.map(
+                lambda path: safe_delete_file(str(path), verbose=verbose),
+                converted,
+            ))
+        if verbose:
+            logger.info(
+                '[+] removed %d files in %.2fs',
+                len(converted), time.monotonic() - start,
+            )
+    return failed
+
+
 def update_from_yaml(
     path: Path = Path('secrets/secrets.d'),
     keep_original=False,
@@ -32,17 +176,14 @@ def update_from_yaml(
     """
     Helper function to convert old YAML style directories.
     """
-    yaml_files = get_yaml_files_from_path(path)
-    for yaml_file in yaml_files:
-        # json_file = f"{os.path.splitext(yaml_file)[0]}.json"
-        json_file = yaml_file.with_suffix('.json')
-        if verbose:
-            logger.info("[+] converting '%s' to JSON", yaml_file)
-        yaml_to_json(yaml_file=yaml_file, json_file=json_file)
-        if not keep_original:
-            if verbose:
-                logger.info("[+] removing '%s'", yaml_file)
-            safe_delete_file(yaml_file)
+    failed = convert_yaml_files(
+        get_yaml_files_from_path(path),
+        keep_original=keep_original,
+        verbose=verbose,
+    )
+    if failed:
+        raise RuntimeError(
+            f"[-] failed to convert {len(failed)} file(s) in '{path}'")
 
 
 def yaml_to_json(
@@ -53,7 +194,7 @@ def yaml_to_json(
     Translate a YAML file (or stdin) to a JSON file (or stdout).
     """
     if yaml_file in ['-', None]:
-        content = yaml.safe_load(sys.stdin.read())
+        content = load_yaml(sys.stdin.read())
         if not content:
             raise RuntimeError(
                 '[-] failed to read YAML content from stdin'
@@ -63,7 +204,7 @@ def yaml_to_json(
             raise TypeError(
                 f"[-] 'yaml_file' must be '-' or Path: {str(yaml_file)}"
             )
-        content = yaml.safe_load(yaml_file.read_text())
+        content = load_yaml(yaml_file.read_text())
         if not content:
             raise RuntimeError(
                 '[-] failed to read YAML content from '
@@ -94,6 +235,18 @@ class YAMLToJSON(Command):
     an argument with the ``--convert`` option, *all* files ending in ``.yml``
     in the directory will be processed.
 
+    The ``--all-environments`` option (used with ``--convert``) finds and
+    converts all YAML secrets files (``secrets.yml``) and secrets descriptions
+    files in every environment in the secrets base directory, for migrating
+    many old environments at once.
+
+    Files are converted in parallel by ``--jobs`` processes (using the
+    ``libyaml`` parser if PyYAML was built with it), and each JSON file is
+    written atomically with the same permissions as the YAML file. Once all
+    files are converted, the originals of those that converted successfully
+    are securely deleted, ``--shred-jobs`` at a time. The number of files
+    converted and the throughput are reported.
+
     .. note::
 
         The original format for secrets files and secrets description files was
@@ -118,13 +271,15 @@ class YAMLToJSON(Command):
             1 directory, 4 files
             $ psec utils yaml-to-json --convert /tmp/secrets/secrets.d
             [+] converting '/tmp/secrets/secrets.d/jenkins.yml' to JSON
-            [+] removing '/tmp/secrets/secrets.d/jenkins.yml'
             [+] converting '/tmp/secrets/secrets.d/myapp.yml' to JSON
-            [+] removing '/tmp/secrets/secrets.d/myapp.yml'
             [+] converting '/tmp/secrets/secrets.d/trident.yml' to JSON
-            [+] removing '/tmp/secrets/secrets.d/trident.yml'
             [+] converting '/tmp/secrets/secrets.d/oauth.yml' to JSON
+            [+] converted 4 files (1.2 KiB) in 0.05s: 80.0 files/s, 24.6 KiB/s
+            [+] removing '/tmp/secrets/secrets.d/jenkins.yml'
+            [+] removing '/tmp/secrets/secrets.d/myapp.yml'
+            [+] removing '/tmp/secrets/secrets.d/trident.yml'
             [+] removing '/tmp/secrets/secrets.d/oauth.yml'
+            [+] removed 4 files in 0.00s
             $ tree /tmp/secrets/
             /tmp/secrets/
             └── secrets.d
@@ -157,6 +312,29 @@ class YAMLToJSON(Command):
             default=False,
             help='Keep original YAML file after conversion'
         )
+        parser.add_argument(
+            '--all-environments',
+            action='store_true',
+            dest='all_environments',
+            default=False,
+            help='Convert YAML files in all environments in the base directory'
+        )
+        parser.add_argument(
+            '--jobs',
+            action='store',
+            type=int,
+            dest='jobs',
+            default=os.cpu_count() or 1,
+            help='Number of processes converting files'
+        )
+        parser.add_argument(
+            '--shred-jobs',
+            action='store',
+            type=int,
+            dest='shred_jobs',
+            default=SHRED_JOBS,
+            help='Number of original files securely deleted at once'
+        )
         parser.add_argument(
             'arg',
             nargs='*',
@@ -166,8 +344,14 @@ class YAMLToJSON(Command):
         return parser
 
     def take_action(self, parsed_args):
+        if parsed_args.all_environments:
+            if not parsed_args.convert:
+                raise RuntimeError(
+                    "[-] must use '--convert' with '--all-environments'")
+            parsed_args.arg = []
         if '-' in parsed_args.arg and parsed_args.convert:
             raise RuntimeError('[-] stdin cannot be used with ``--convert``')
+        yaml_files = []
         for arg in parsed_args.arg:
             json_file = '-'
             if arg == '-':
@@ -183,30 +367,44 @@ class YAMLToJSON(Command):
                     )
                 if path.is_file():
                     if parsed_args.convert:
-                        json_file = path.with_suffix('.json')
-                        self.logger.info("[+] converting '%s'", path)
-                    yaml_to_json(
-                        yaml_file=path,
-                        json_file=json_file,
-                    )
-                    if (
-                        parsed_args.convert
-                        and not parsed_args.keep_original
-                    ):
-                        if self.app_args.verbose_level >= 1:
-                            self.logger.info("[+] removing '%s'", str(path))
-                        safe_delete_file(str(path))
+                        yaml_files.append(path)
+                    else:
+                        yaml_to_json(
+                            yaml_file=path,
+                            json_file=json_file,
+                        )
                 elif path.is_dir():
                     if not parsed_args.convert:
                         raise RuntimeError(
                             "[-] must use '--convert' with directory "
                             f"'{str(path)}'"
                         )
-                    update_from_yaml(
-                        path=path,
-                        keep_original=parsed_args.keep_original,
-                        verbose=(self.app_args.verbose_level >= 1)
-                    )
+                    yaml_files.extend(get_yaml_files_from_path(path))
+        if parsed_args.all_environments:
+            basedir = Path(self.app.options.secrets_basedir)
+            if not basedir.is_dir():
+                raise RuntimeError(
+                    f"[-] secrets base directory '{basedir}' not found")
+            yaml_files = find_yaml_secrets_files(basedir)
+            self.logger.info(
+                "[+] found %d YAML files in '%s'", len(yaml_files), basedir)
+        if not yaml_files:
+            return
+        if parsed_args.jobs < 1 or parsed_args.shred_jobs < 1:
+            raise RuntimeError(
+                '[-] --jobs and --shred-jobs must be at least 1')
+        failed = convert_yaml_files(
+            yaml_files,
+            keep_original=parsed_args.keep_original,
+            jobs=parsed_args.jobs,
+            shred_jobs=parsed_args.shred_jobs,
+            verbose=(self.app_args.verbose_level >= 1),
+        )
+        if failed:
+            raise RuntimeError(
+                f'[-] failed to convert {len(failed)} of '
+                f'{len(yaml_files)} files'
+            )
 
 
 # vim: set fileencoding=utf-8 ts=4 sw=4 tw=0 et :
@@ -0,0 +1,335 @@
+# -*- coding: utf-8 -*-
+
+"""
+Secrets daemon (``psecd``).
+
+Keeps loaded ``SecretsEnvironment`` objects in memory and answers
+requests for secrets over a Unix domain socket, so that programs
+calling ``psec secrets get`` many times in a row don't have to re-read
+and re-parse the environment every time.
+
+The socket is created with mode ``0600`` (by default in the secrets
+base directory, which is itself mode ``0700``) and connections from any
+other user are rejected where the platform can report peer credentials.
+
+Requests and responses are single lines of JSON::
+
+    {"op": "get", "environment": "myapp", "variables": ["myapp_pi_password"]}
+    {"result": {"myapp_pi_password": "GAINFUL.saliva.IMPUDENT"}}
+
+Supported operations are ``ping``, ``get``, ``show``, and ``export``.
+Errors are returned as ``{"error": "<message>"}``.
+
+Cached environments are reloaded whenever the size or modification time
+of the secrets file or any secrets description file changes.
+"""
+
+# Standard imports
+import argparse
+import json
+import logging
+import os
+import signal
+import socket
+import socketserver
+import struct
+import sys
+import threading
+
+from pathlib import Path
+
+# Local imports
+from psec.exceptions import (
+    PsecdUnavailableError,
+    SecretNotFoundError,
+)
+from psec.utils import (
+    get_default_secrets_basedir,
+    get_environment_signature,
+)
+
+
+logger = logging.getLogger(__name__)
+
+SOCKET_NAME = '.psecd.sock'
+SOCKET_MODE = 0o600
+CLIENT_TIMEOUT = 2.0
+MAX_REQUEST_SIZE = 1024 * 1024
+OPERATIONS = ['ping', 'get', 'show', 'export']
+
+
+def get_socket_path(basedir=None):
+    """
+    Return the path to the ``psecd`` socket.
+
+    The environment variable ``D2_PSECD_SOCKET`` takes priority over
+    the default location in the secrets base directory.
+    """
+    socket_path = os.getenv('D2_PSECD_SOCKET', None)
+    if socket_path is not None:
+        return Path(socket_path)
+    if basedir is None:
+        basedir = get_default_secrets_basedir()
+    return Path(basedir) / SOCKET_NAME
+
+
+class EnvironmentCache:
+    """
+    Cache of loaded secrets environments for a base directory.
+    """
+
+    def __init__(self, basedir):
+        self.basedir = Path(basedir)
+        self._environments = {}
+        self._lock = threading.Lock()
+
+    def get(self, environment):
+        """
+        Return the loaded ``SecretsEnvironment`` for ``environment``,
+        (re)loading it if its files changed since it was last loaded.
+        """
+        # pylint: disable=import-outside-toplevel
+        from psec.secrets_environment import SecretsEnvironment
+        # pylint: enable=import-outside-toplevel
+
+        if (
+            environment in ['.', '..']
+            or Path(environment).name != environment
+        ):
+            raise RuntimeError(
+                f"[-] invalid environment name '{environment}'"
+            )
+        env_path = self.basedir / environment
+        with self._lock:
+            signature = get_environment_signature(env_path)
+            cached = self._environments.get(environment)
+            if cached is not None and cached[0] == signature:
+                return cached[1]
+            logger.debug("[+] loading environment '%s'", environment)
+            se = SecretsEnvironment(
+                environment=environment,
+                secrets_basedir=self.basedir,
+            )
+            se.requires_environment()
+            se.read_secrets_and_descriptions()
+            self._environments[environment] = (signature, se)
+            return se
+
+    def clear(self):
+        """Drop all cached environments."""
+        with self._lock:
+            self._environments.clear()
+
+
+class PsecdRequestHandler(socketserver.StreamRequestHandler):
+    """
+    Handle newline delimited JSON requests on a client connection.
+    """
+
+    def handle(self):
+        while True:
+            line = self.rfile.readline(MAX_REQUEST_SIZE)
+            if not line:
+                break
+            try:
+                request = json.loads(line)
+                response = {'result': self.server.dispatch(request)}
+            except Exception as err:  # pylint: disable=broad-except
+                response = {'error': str(err)}
+            self.wfile.write(json.dumps(response).encode('UTF-8') + b'\n')
+            self.wfile.flush()
+
+
+class PsecdServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    """
+    Threaded Unix domain socket server for secrets requests.
+    """
+
+    daemon_threads = True
+
+    def __init__(self, socket_path, basedir):
+        self.socket_path = Path(socket_path)
+        self.cache = EnvironmentCache(basedir)
+        remove_stale_socket(self.socket_path)
+        super().__init__(str(self.socket_path), PsecdRequestHandler)
+
+    def server_bind(self):
+        # Ensure the socket is never accessible by others, even
+        # briefly, by creating it under a restrictive umask.
+        old_umask = os.umask(0o177)
+        try:
+            super().server_bind()
+        finally:
+            os.umask(old_umask)
+        os.chmod(self.socket_path, SOCKET_MODE)
+
+    def verify_request(self, request, client_address):
+        peer_uid = get_peer_uid(request)
+        if peer_uid is not None and peer_uid != os.getuid():
+            logger.warning(
+                '[-] rejecting connection from uid %d', peer_uid
+            )
+            return False
+        return True
+
+    def server_close(self):
+        super().server_close()
+        try:
+            self.socket_path.unlink()
+        except FileNotFoundError:
+            pass
+
+    def dispatch(self, request):
+        """Perform the operation specified by ``request``."""
+        op = request.get('op')
+        if op not in OPERATIONS:
+            raise RuntimeError(f"[-] unsupported operation '{op}'")
+        if op == 'ping':
+            return 'pong'
+        environment = request.get('environment')
+        if environment in ['', None]:
+            raise RuntimeError('[-] no environment specified')
+        se = self.cache.get(str(environment))
+        variables = request.get('variables') or se.keys()
+        if op == 'get':
+            return {
+                variable: se.get_secret(variable, allow_none=True)
+                for variable in variables
+            }
+        known = set(se.keys())
+        for variable in variables:
+            if variable not in known:
+                raise SecretNotFoundError(secret=variable)
+        if op == 'show':
+            return [
+                [
+                    variable,
+                    se.get_secret(variable, allow_none=True),
+                    se.get_secret_export(variable),
+                ]
+                for variable in variables
+            ]
+        # op == 'export'
+        return se.get_exported_variables(
+            variables=variables,
+            env_var_prefix=request.get('env_var_prefix'),
+        )
+
+
+def get_peer_uid(sock):
+    """
+    Return the user ID of the process on the other end of a Unix domain
+    socket, or ``None`` if the platform does not support reporting it.
+    """
+    if not hasattr(socket, 'SO_PEERCRED'):
+        return None
+    creds = sock.getsockopt(
+        socket.SOL_SOCKET,
+        socket.SO_PEERCRED,
+        struct.calcsize('3i'),
+    )
+    _, uid, _ = struct.unpack('3i', creds)
+    return uid
+
+
+def remove_stale_socket(socket_path):
+    """
+    Remove a socket left behind by a ``psecd`` that is no longer running.
+    """
+    if not os.path.exists(socket_path):
+        return
+    try:
+        psecd_request('ping', socket_path=socket_path)
+    except PsecdUnavailableError:
+        os.unlink(socket_path)
+    else:
+        raise RuntimeError(
+            f"[-] psecd is already listening on '{socket_path}'"
+        )
+
+
+def psecd_request(op, socket_path=None, timeout=CLIENT_TIMEOUT, **kwargs):
+    """
+    Send a request to ``psecd`` and return the result.
+
+    Raises ``PsecdUnavailableError`` if the daemon is not running so
+    callers can fall back to reading the environment directly. Errors
+    reported by the daemon are raised as ``RuntimeError``.
+    """
+    if socket_path is None:
+        socket_path = get_socket_path()
+    if not os.path.exists(socket_path):
+        raise PsecdUnavailableError
+    request = dict(kwargs, op=op)
+    try:
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+            sock.settimeout(timeout)
+            sock.connect(str(socket_path))
+            sock.sendall(json.dumps(request).encode('UTF-8') + b'\n')
+            with sock.makefile('rb') as f:
+                line = f.readline()
+    except OSError as err:
+        raise PsecdUnavailableError(msg=f'[-] psecd: {err}')
+    if not line:
+        raise PsecdUnavailableError
+    response = json.loads(line)
+    if 'error' in response:
+        raise RuntimeError(response['error'])
+    return response['result']
+
+
+def main(argv=None):
+    """
+    Command line interface for the ``psecd`` program.
+    """
+    parser = argparse.ArgumentParser(
+        prog='psecd',
+        description=__doc__.strip().splitlines()[0],
+    )
+    parser.add_argument(
+        '-d', '--secrets-basedir',
+        metavar='<secrets-basedir>',
+        dest='secrets_basedir',
+        default=get_default_secrets_basedir(),
+        help='Root directory for holding secrets (Env: D2_SECRETS_BASEDIR)'
+    )
+    parser.add_argument(
+        '--socket',
+        metavar='<socket>',
+        dest='socket',
+        default=None,
+        help='Path to Unix domain socket (Env: D2_PSECD_SOCKET)'
+    )
+    parser.add_argument(
+        '-v', '--verbose',
+        action='store_true',
+        dest='verbose',
+        default=False,
+        help='Log each request'
+    )
+    args = parser.parse_args(argv)
+    logging.basicConfig(
+        level=logging.DEBUG if args.verbose else logging.INFO,
+        format='%(message)s',
+    )
+    socket_path = (
+        Path(args.socket) if args.socket is not None
+        else get_socket_path(basedir=args.secrets_basedir)
+    )
+    server = PsecdServer(socket_path, args.secrets_basedir)
+    signal.signal(signal.SIGTERM, lambda *_: sys.exit(0))
+    logger.info("[+] psecd listening on '%s'", socket_path)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
+
+
+# vim: set fileencoding=utf-8 ts=4 sw=4 tw=0 et :
@@ -110,4 +110,8 @@ class InvalidDescriptionsError(DescriptionsError):
     """Invalid secrets descriptions"""
 
 
+class PsecdUnavailableError(PsecBaseException):
+    """Secrets daemon is not available"""
+
+
 # vim: set fileencoding=utf-8 ts=4 sw=4 tw=0 et :
@@ -82,6 +82,7 @@ import imaplib
 import json
 import logging
 import smtplib
+import time
 import urllib
 
 from email.mime.multipart import MIMEMultipart
@@ -92,6 +93,15 @@ import gnupg
 import lxml.html  # nosec
 
 
+GOOGLE_SMTP_HOST = 'smtp.gmail.com'
+GOOGLE_SMTP_PORT = 587
+SMTP_TIMEOUT = 30
+# Access tokens expiring within this many seconds are refreshed first.
+TOKEN_EXPIRY_MARGIN = 60
+# Number of times a message is retried on a new connection.
+SMTP_RETRIES = 1
+
+
 class GoogleSMTP(object):
     """
     Google OAuth2 SMTP class.
@@ -106,6 +116,9 @@ class GoogleSMTP(object):
         refresh_token=None,
         verbose=False,
         gpg_encrypt=False,
+        smtp_host=GOOGLE_SMTP_HOST,
+        smtp_port=GOOGLE_SMTP_PORT,
+        starttls=True,
     ):
         self.username = username
         self.client_id = client_id
@@ -119,6 +132,14 @@ class GoogleSMTP(object):
         )
         self.access_token = None
         self.expires_in = 0
+        self.expires_at = 0
+        self.smtp_host = smtp_host
+        self.smtp_port = smtp_port
+        self.starttls = starttls
+        self.server = None
+        # Keyring index built on first use by ``find_keyid()``.
+        self._keys = None
+        self._keys_by_email = None
         self.GOOGLE_ACCOUNTS_BASE_URL = 'https://accounts.google.com'
         self.REDIRECT_URI = 'urn:ietf:wg:oauth:2.0:oob'
         # TODO(dittrich): Disabled this temporarily
@@ -198,29 +219,48 @@ class GoogleSMTP(object):
             f"{self.url_format_params(params)}"
         )
 
+    def index_keyring(self):
+        """
+        Read the GPG keyring (once) and index the keys by the email
+        addresses in their user IDs.
+        """
+        if self._keys is None:
+            self._keys = self.gpg.list_keys()
+            self._keys_by_email = dict()
+            for key in self._keys:
+                for uid in key['uids']:
+                    email = uid.rsplit('<', 1)[-1].rstrip('>').strip()
+                    keyids = self._keys_by_email.setdefault(
+                        email.lower(), list())
+                    if key['keyid'] not in keyids:
+                        keyids.append(key['keyid'])
+        return self._keys
+
     def find_keyid(self, recipient, keyid=None):
         """
         Locate the GPG keyid for encrypting a message to the recipient.
 
         If a keyid is provided, make sure it matches the recipient and
-        return None if it does not. Otherwise, walk through all keys in
-        the keyring to find a match. If more than one key is found,
-        raise a RuntimeError.
-        """
-        all_keys = self.gpg.list_keys()
-        matching_keys = [
-            key['keyid']
-            for key in all_keys
-            for uids in key['uids']
-            if (
-                (keyid and keyid == key['keyid'])
-                or recipient in uids
-            )
-        ]
+        return None if it does not. Otherwise, look up the recipient in
+        an index of the keyring (which is only read once), falling back
+        to searching the user IDs of all keys. If more than one key is
+        found, raise a RuntimeError.
+        """
+        keys = self.index_keyring()
+        matching_keys = list(
+            self._keys_by_email.get(recipient.lower(), list()))
+        if len(matching_keys) == 0:
+            for key in keys:
+                if key['keyid'] in matching_keys:
+                    continue
+                if any(recipient in uid for uid in key['uids']):
+                    matching_keys.append(key['keyid'])
+        if keyid:
+            matching_keys = [k for k in matching_keys if k == keyid]
         if len(matching_keys) > 1:
             raise RuntimeError(
                 '[-] found multiple keys for recipient: '
-                ",".join([matching_keys])
+                f"{','.join(matching_keys)}"
             )
         if len(matching_keys) == 0:
             return None
@@ -391,8 +431,23 @@ class GoogleSMTP(object):
         response = self.generate_refresh_token()
         self.access_token = response['access_token']
         self.expires_in = response['expires_in']
+        self.expires_at = time.monotonic() + int(self.expires_in)
         return self.access_token, self.expires_in
 
+    def ensure_authorization(self):
+        """
+        Refresh OAuth 2.0 authorization token data, unless the current
+        access token is still valid for at least ``TOKEN_EXPIRY_MARGIN``
+        seconds.
+        """
+        if (
+            self.access_token is None
+            or time.monotonic() + TOKEN_EXPIRY_MARGIN >= self.expires_at
+        ):
+            self.logger.debug('[+] refreshing OAuth2 access token')
+            self.refresh_authorization()
+        return self.access_token
+
     def create_msg(
         self,
         fromaddr,
@@ -461,6 +516,110 @@ class GoogleSMTP(object):
         msg_alternative.attach(part_html)
         return msg
 
+    def connect(self):
+        """
+        Open an SMTP session authenticated with the OAuth2 access token
+        (refreshed first if necessary), replacing any open session.
+        """
+        self.close()
+        self.ensure_authorization()
+        auth_string = self.generate_oauth2_string(base64_encode=True)
+        server = smtplib.SMTP(
+            self.smtp_host,
+            self.smtp_port,
+            timeout=SMTP_TIMEOUT,
+        )
+        try:
+            server.ehlo(self.client_id)
+            if self.starttls:
+                server.starttls()
+                server.ehlo(self.client_id)
+            code, response = server.docmd('AUTH', 'XOAUTH2 ' + auth_string)
+            if code != 235:
+                raise RuntimeError(
+                    f'[-] SMTP authentication failed: {code} '
+                    f"{response.decode('utf-8', errors='replace')}"
+                )
+        except Exception:
+            server.close()
+            raise
+        self.server = server
+        return server
+
+    def close(self):
+        """
+        Close the SMTP session, if one is open.
+        """
+        if self.server is None:
+            return
+        try:
+            self.server.quit()
+        except smtplib.SMTPException:
+            self.server.close()
+        finally:
+            self.server = None
+
+    def send_mails(
+        self,
+        fromaddr,
+        messages,
+    ):
+        """
+        Send email messages over a single authenticated SMTP session.
+
+        This is a generator that yields a (``To:`` address, error) pair
+        as each message is sent (with ``None`` for the error if it was
+        delivered), so callers can record every delivery as it happens.
+        A message refused by the server does not stop the others from
+        being sent. If the connection is lost, a new session is opened
+        and the message being sent is retried (up to ``SMTP_RETRIES``
+        times). If a session can't be opened, the remaining messages are
+        reported as failed without being sent.
+
+        Args:
+          fromaddr: Email ``From:`` address.
+          messages: Iterable of (``To:`` address, ``Message`` object)
+              pairs.
+        """
+        session_error = None
+        try:
+            for toaddr, msg in messages:
+                if session_error is not None:
+                    yield toaddr, session_error
+                    continue
+                data = msg.as_string()
+                error = None
+                for _ in range(SMTP_RETRIES + 1):
+                    try:
+                        if self.server is None:
+                            self.connect()
+                    except (
+                        RuntimeError,
+                        OSError,
+                        smtplib.SMTPException,
+                    ) as err:
+                        session_error = error = err
+                        break
+                    try:
+                        self.server.sendmail(fromaddr, toaddr, data)
+                        error = None
+                        break
+                    except (
+                        smtplib.SMTPServerDisconnected,
+                        ConnectionError,
+                    ) as err:
+                        self.server.close()
+                        self.server = None
+                        error = err
+                        self.logger.debug(
+                            '[-] SMTP connection lost (%s): reconnecting', err)
+                    except smtplib.SMTPException as err:
+                        error = err
+                        break
+                yield toaddr, error
+        finally:
+            self.close()
+
     def send_mail(
         self,
         fromaddr,
@@ -475,14 +634,9 @@ class GoogleSMTP(object):
           toaddr: Email ``To:`` address.
           msg: Already fully-populated ``Message`` object.
         """
-        self.access_token, self.expires_in = self.refresh_authorization()
-        auth_string = self.generate_oauth2_string(base64_encode=True)
-        server = smtplib.SMTP('smtp.gmail.com:587')
-        server.ehlo(self.client_id)
-        server.starttls()
-        server.docmd('AUTH', 'XOAUTH2 ' + auth_string)
-        server.sendmail(fromaddr, toaddr, msg.as_string())
-        server.quit()
+        for _, error in self.send_mails(fromaddr, [(toaddr, msg)]):
+            if error is not None:
+                raise RuntimeError(f'[-] sending to {toaddr} failed: {error}')
 
 
 # vim: set fileencoding=utf-8 ts=4 sw=4 tw=0 et :
@@ -9,8 +9,13 @@ import logging
 import os
 import re
 import secrets  # noqa
+import tempfile
+import time
 
-from collections import OrderedDict
+from collections import (
+    namedtuple,
+    OrderedDict,
+)
 from pathlib import Path
 from shutil import copy
 from stat import S_IMODE
@@ -22,10 +27,12 @@ from psec.exceptions import (
     SecretNotFoundError,
 )
 from psec.utils import (
+    atomic_write,
     copydescriptions,
-    find,
+    file_lock,
     get_default_environment,
     get_default_secrets_basedir,
+    get_descriptions_key,
     is_secrets_basedir,
     remove_other_perms,
     secrets_basedir_create,
@@ -34,7 +41,6 @@ from psec.utils import (
     SECRETS_FILE,
 )
 from .factory import SecretFactory
-from .handlers import *  # noqa: F401,F403
 
 
 logger = logging.getLogger(__name__)
@@ -52,8 +58,23 @@ BOOLEAN_OPTIONS = [
     {'descr': 'False', 'ident': 'false'},
 ]
 
+# Cache of validated descriptions kept in the descriptions directory.
+DESCRIPTIONS_CACHE_FILE = '.cache'
+DESCRIPTIONS_CACHE_VERSION = 1
+# Description files modified more recently than this when the cache
+# would be written might change again without changing their mtime.
+DESCRIPTIONS_CACHE_MIN_AGE_NS = 2 * 1000000000
+
+# Lock file serializing writers of the secrets file.
+SECRETS_LOCK_FILE = f'.{SECRETS_FILE}.lock'
+
+# Index entry locating a variable's description record.
+VariableDescription = namedtuple(
+    'VariableDescription',
+    ['group', 'row', 'description'],
+)
+
 secret_factory = SecretFactory()
-SECRET_TYPES = secret_factory.describe_secret_classes()
 SECRET_ATTRIBUTES = [
     'Variable',
     'Group',
@@ -65,6 +86,19 @@ SECRET_ATTRIBUTES = [
 ]
 
 
+def __getattr__(name):
+    """
+    Compute ``SECRET_TYPES`` on first reference.
+
+    Describing the secret types requires importing every handler module
+    (including the xkcdpass word list support), which is too expensive
+    to do every time this module is imported.
+    """
+    if name == 'SECRET_TYPES':
+        return secret_factory.describe_secret_classes()
+    raise AttributeError(f"module '{__name__}' has no attribute '{name}'")
+
+
 # FIXME: Left for backwards compatibility.
 def is_generable(secret_type=None):
     """
@@ -199,7 +233,15 @@ class SecretsEnvironment(object):
             self.clone_from(source)
             self.read_secrets_descriptions()
         self._secrets = OrderedDict()
+        # Secrets as last read from (or written to) the secrets file,
+        # used to find the changes to merge in ``write_secrets()``.
+        self._original = OrderedDict()
+        self._deleted = set()
         self._descriptions = OrderedDict()
+        # Maps variable names to VariableDescription entries.
+        self._index = dict()
+        # Maps group names to the set of variables they describe.
+        self._group_items = dict()
         self._changed = False
         for attribute in SECRET_ATTRIBUTES:
             self.__dict__[attribute] = {}
@@ -471,6 +513,35 @@ class SecretsEnvironment(object):
                     f"variable '{_env_var}'")
             os.environ[_env_var] = str(value)
 
+    def get_exported_variables(self, variables=None, env_var_prefix=None):
+        """Return the environment variables that export secrets
+
+        Each secret is exported under its own name and, if different,
+        under the name given by its ``Export`` attribute (or its name
+        with ``env_var_prefix`` prepended). Undefined secrets are not
+        exported.
+
+        :param variables: :type: list of secrets (default: all secrets)
+        :param env_var_prefix: :type: string
+        :return: dictionary mapping environment variables to values
+        """
+        if env_var_prefix is None:
+            env_var_prefix = self.env_var_prefix
+        if variables is None:
+            variables = self._secrets.keys()
+        exports = OrderedDict()
+        for secret in variables:
+            value = self._secrets.get(secret)
+            if value is None:
+                continue
+            exports[secret] = str(value)
+            _env_var = self.Export.get(secret)  # type: ignore
+            if _env_var is None and env_var_prefix is not None:
+                _env_var = f'{env_var_prefix}{secret}'
+            if _env_var is not None:
+                exports[_env_var] = str(value)
+        return exports
+
     def set_secret(self, secret, value=None):
         """Set secret to value and record change
 
@@ -492,9 +563,11 @@ class SecretsEnvironment(object):
             del self.Variable[secret]  # type: ignore
             del self.Type[secret]
             del self._secrets[secret]
+            self._index.pop(secret, None)
         except KeyError:
             pass
         else:
+            self._deleted.add(secret)
             self._changed = True
 
     def get_type(self, variable):
@@ -569,6 +642,7 @@ class SecretsEnvironment(object):
             )
             for k, v in _secrets.items():
                 self._set_secret(k, v)
+            self._original = _secrets
         except FileNotFoundError as err:
             if from_descriptions:
                 for group in self._descriptions.keys():
@@ -580,18 +654,74 @@ class SecretsEnvironment(object):
                 raise err
         return self
 
+    def get_secrets_lock_path(self):
+        """Return path to the lock file for the secrets file"""
+        return self.get_secrets_file_path().parent / SECRETS_LOCK_FILE
+
     def write_secrets(self):
-        """Write out the current secrets if any changes were made"""
-        if self._changed:
-            _fname = self.get_secrets_file_path()
-            self.logger.debug("[+] writing secrets to '%s'", _fname)
-            with _fname.open('w', encoding='utf-8') as f:
-                json.dump(self._secrets, f, indent=2)  # type: ignore
-                f.write('\n')
-            self._changed = False
-            remove_other_perms(_fname)
-        else:
+        """
+        Write out the current secrets if any changes were made.
+
+        While holding an advisory lock on the environment, the secrets
+        file is re-read and only the secrets changed (or deleted) since
+        it was read by this object are applied to it, so concurrent
+        writers changing different secrets don't undo each other's
+        changes. The result is written to a temporary file (mode
+        ``0600``) that is flushed to disk before it replaces the
+        secrets file.
+        """
+        if not self._changed:
             self.logger.debug('[-] not writing secrets (unchanged)')
+            return
+        _fname = self.get_secrets_file_path()
+        self.logger.debug("[+] writing secrets to '%s'", _fname)
+        with file_lock(self.get_secrets_lock_path()):
+            try:
+                current = json.loads(
+                    _fname.read_text(),
+                    object_pairs_hook=OrderedDict,
+                )
+            except FileNotFoundError:
+                current = OrderedDict()
+            merged = self._merge_secrets(current)
+            atomic_write(_fname, json.dumps(merged, indent=2) + '\n')
+        # Pick up changes made by other writers.
+        for k in [k for k in self._secrets if k not in merged]:
+            del self._secrets[k]
+            self.Variable.pop(k, None)  # type: ignore
+        for k, v in merged.items():
+            self._secrets[k] = v
+            getattr(self, 'Variable')[k] = v
+        self._original = merged
+        self._deleted = set()
+        self._changed = False
+
+    def _merge_secrets(self, current):
+        """
+        Return the secrets in ``current`` (as just read from the secrets
+        file) updated with the changes made to this object's secrets.
+        """
+        merged = OrderedDict(current)
+        for k in self._deleted | (set(self._original) - set(self._secrets)):
+            merged.pop(k, None)
+        for k, v in self._secrets.items():
+            if k in self._original and self._original[k] == v:
+                # Unchanged here; keep any change made by another writer.
+                continue
+            if k not in self._original and v is None:
+                # Placeholder for an unset secret; don't clobber a value.
+                merged.setdefault(k, None)
+                continue
+            if (
+                k in current
+                and current[k] != self._original.get(k)
+                and current[k] != v
+            ):
+                self.logger.warning(
+                    "[!] secret '%s' was changed by another process: "
+                    "overwriting", k)
+            merged[k] = v
+        return merged
 
     def clone_from(self, src: Union[Path, str]):
         """
@@ -696,73 +826,141 @@ class SecretsEnvironment(object):
                         f"[-] variable '{v}' duplicates an existing variable"
                     )
 
+    def get_descriptions_cache_path(self):
+        """Return path to the secrets descriptions cache file."""
+        return self.get_descriptions_path() / DESCRIPTIONS_CACHE_FILE
+
+    def read_descriptions_cache(self, key):
+        """
+        Return the validated descriptions saved in the descriptions cache
+        file, or None if the cache is missing or does not match ``key``.
+        """
+        try:
+            cache = json.loads(
+                self.get_descriptions_cache_path().read_text(),
+                object_pairs_hook=OrderedDict,
+            )
+        except (OSError, ValueError):
+            return None
+        if (
+            not isinstance(cache, dict)
+            or cache.get('version') != DESCRIPTIONS_CACHE_VERSION
+            or cache.get('key') != key
+        ):
+            return None
+        return cache.get('descriptions')
+
+    def write_descriptions_cache(self, key, descriptions):
+        """
+        Save validated descriptions to the descriptions cache file.
+
+        The cache is not written if any description file was modified
+        too recently for its modification time to reliably reflect
+        later changes.
+        """
+        racy = time.time_ns() - DESCRIPTIONS_CACHE_MIN_AGE_NS
+        if any(mtime_ns >= racy for _, _, mtime_ns in key):
+            return
+        cache_path = self.get_descriptions_cache_path()
+        try:
+            fd, tmp_path = tempfile.mkstemp(
+                dir=cache_path.parent,
+                prefix=f'{cache_path.name}.',
+            )
+            with os.fdopen(fd, 'w') as f:
+                json.dump(
+                    {
+                        'version': DESCRIPTIONS_CACHE_VERSION,
+                        'key': key,
+                        'descriptions': descriptions,
+                    },
+                    f,
+                )
+            os.replace(tmp_path, cache_path)
+        except OSError as err:
+            self.logger.debug(
+                "[-] could not write descriptions cache: %s", err)
+
     def read_secrets_descriptions(
         self,
         ignore_errors=False,
     ):
-        """Load the descriptions of groups of secrets from a .d directory"""
+        """
+        Load the descriptions of groups of secrets from a .d directory
+
+        Validated descriptions are saved in a cache file in the .d
+        directory that is used instead of the description files for as
+        long as none of them are added, removed, or modified.
+        """
         groups_dir = self.get_descriptions_path()
         if not groups_dir.exists():
             if not ignore_errors:
                 self.logger.info(
                     '[-] secrets descriptions directory not found'
                 )
+            return
+        key = get_descriptions_key(groups_dir)
+        if len(key) == 0 and not ignore_errors:
+            self.logger.info('[-] no secrets descriptions files found')
+        all_descriptions = self.read_descriptions_cache(key)
+        if all_descriptions is not None:
+            self.logger.debug(
+                "[+] reading secrets descriptions cache in '%s'", groups_dir)
         else:
-            # Ignore .order file and any other file extensions
-            extensions = ['.json']
-            file_names = [
-                fn for fn in groups_dir.iterdir()
-                if fn.suffix in extensions
-            ]
             self.logger.debug(
                 "[+] reading secrets descriptions from '%s'", groups_dir)
             # Iterate over files in directory, loading them into
             # dictionaries as dictionary keyed on group name.
-            if len(file_names) == 0 and not ignore_errors:
-                self.logger.info('[-] no secrets descriptions files found')
-            for fname in file_names:
-                group = fname.stem
+            all_descriptions = OrderedDict()
+            for name, _, _ in key:
+                group = os.path.splitext(name)[0]
                 if '.' in group:
                     raise RuntimeError(
                         f"[-] group name cannot include '.': '{group}'")
                 descriptions = self.read_descriptions(group=group)
-                if descriptions is not None:
-                    self._descriptions[group] = descriptions
-                    # Dynamically create maps keyed on variable name
-                    # for simpler lookups. (See the get_prompt() method
-                    # for an example.)
-                    # {'Prompt': 'Google OAuth2 username', 'Type': 'string', 'Variable': 'google_oauth_username'}  # noqa
-                    for d in descriptions:
-                        # TODO(dittrich): https://github.com/davedittrich/python_secrets/projects/1#card-49358317  # noqa
-                        self.Group[d['Variable']] = group  # type: ignore pylint: disable=no-member  # noqa
-                        for k, v in d.items():
-                            try:
-                                # Add to existing map
-                                getattr(self, k)[d['Variable']] = v
-                            except AttributeError:
-                                raise RuntimeError(
-                                    f"[-] '{k}' is not a valid attribute")
-                else:
+                if descriptions is None:
                     raise RuntimeError(
                         f"[-] descriptions for group '{group}' is empty")
+                all_descriptions[group] = descriptions
+            self.write_descriptions_cache(key, all_descriptions)
+        for group, descriptions in all_descriptions.items():
+            self._descriptions[group] = descriptions
+            self._group_items[group] = {d['Variable'] for d in descriptions}
+            # Dynamically create maps keyed on variable name
+            # for simpler lookups. (See the get_prompt() method
+            # for an example.)
+            # {'Prompt': 'Google OAuth2 username', 'Type': 'string', 'Variable': 'google_oauth_username'}  # noqa
+            for row, d in enumerate(descriptions):
+                # The first group to describe a variable wins.
+                self._index.setdefault(
+                    d['Variable'],
+                    VariableDescription(group, row, d),
+                )
+                # TODO(dittrich): https://github.com/davedittrich/python_secrets/projects/1#card-49358317  # noqa
+                self.Group[d['Variable']] = group  # type: ignore pylint: disable=no-member  # noqa
+                for k, v in d.items():
+                    try:
+                        # Add to existing map
+                        getattr(self, k)[d['Variable']] = v
+                    except AttributeError:
+                        raise RuntimeError(
+                            f"[-] '{k}' is not a valid attribute")
 
     def descriptions(self):
         return self._descriptions
 
+    def get_description(self, variable):
+        """
+        Get the full description record for variable (or None if there
+        is no description).
+        """
+        entry = self._index.get(variable)
+        return None if entry is None else entry.description
+
     def get_secret_type(self, variable):
         """Get the Type of variable from set of secrets descriptions"""
-        for g in self._descriptions.keys():
-            i = find(
-                self._descriptions[g],
-                'Variable',
-                variable
-            )
-            if i is not None:
-                try:
-                    return self._descriptions[g][i]['Type']
-                except KeyError:
-                    return None
-        return None
+        description = self.get_description(variable)
+        return None if description is None else description.get('Type')
 
     def get_options(self, secret):
         """Get the options for setting the secret"""
@@ -776,21 +974,10 @@ class SecretsEnvironment(object):
         """Get the prompt for the secret"""
         return self.Prompt.get(secret, secret)  # type: ignore
 
-    # TODO(dittrich): Not very DRY (but no time now)
     def get_secret_arguments(self, variable):
         """Get the Arguments of variable from set of secrets descriptions"""
-        for g in self._descriptions.keys():
-            i = find(
-                self._descriptions[g],
-                'Variable',
-                variable
-            )
-            if i is not None:
-                try:
-                    return self._descriptions[g][i]['Arguments']
-                except KeyError:
-                    return {}
-        return {}
+        description = self.get_description(variable)
+        return {} if description is None else description.get('Arguments', {})
 
     def get_items_from_group(self, group):
         """Get the variables in a secrets description group"""
@@ -801,10 +988,7 @@ class SecretsEnvironment(object):
 
     def is_item_in_group(self, item, group):
         """Return true or false based on item being in group"""
-        return find(
-            self._descriptions[group],
-            'Variable',
-            item) is not None
+        return item in self._group_items[group]
 
     def get_group(self, item):
         """Return the group to which an item belongs."""
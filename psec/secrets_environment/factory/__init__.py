@@ -10,8 +10,12 @@ from abc import (
     abstractmethod,
 )
 from collections import OrderedDict
+from importlib import import_module
 from inspect import getdoc
 
+# Local imports
+from psec.secrets_environment.handlers import HANDLER_MODULES
+
 
 logger = logging.getLogger(__name__)
 
@@ -25,6 +29,7 @@ class SecretFactory:
     """
 
     class_map = {}
+    _secret_types = None
 
     # def _get_secret_class(self, class_name):
     #     """
@@ -42,15 +47,48 @@ class SecretFactory:
             return secret_class
         return wrapper
 
+    @classmethod
+    def get_secret_types(cls):
+        """
+        Return the list of supported secret types without importing
+        any handler modules.
+        """
+        return sorted(HANDLER_MODULES)
+
+    @classmethod
+    def get_handler_class(cls, secret_type):
+        """
+        Return the handler class for ``secret_type``, importing its
+        module on first use.
+        """
+        secret_class = cls.class_map.get(secret_type)
+        if secret_class is None:
+            try:
+                module_name, class_name = (
+                    HANDLER_MODULES[secret_type].split(':')
+                )
+            except KeyError:
+                raise RuntimeError(
+                    f"[-] secret type '{secret_type}' is not supported"
+                )
+            module = import_module(module_name)
+            # Importing the module registers the class, but don't
+            # rely on the decorator having used the same key.
+            secret_class = cls.class_map.setdefault(
+                secret_type,
+                getattr(module, class_name),
+            )
+        return secret_class
+
     @classmethod
     def get_handler(cls, secret_type):
-        return cls.class_map[secret_type]()
+        return cls.get_handler_class(secret_type)()
 
     @classmethod
     def get_handler_classes(cls):
         return [
-            secret_class for secret_class
-            in cls.class_map.values()
+            cls.get_handler_class(secret_type)
+            for secret_type in cls.get_secret_types()
         ]
 
     @classmethod
@@ -59,22 +97,82 @@ class SecretFactory:
             secret_class().add_parser_arguments(parser)
         return parser
 
+    @classmethod
+    def generate_secrets(cls, variables, unique=False, **kwargs):
+        """
+        Generate values for many variables at once.
+
+        Variables are grouped by type so that each handler is created
+        once and can draw all the values it needs in a single pass.
+
+        Args:
+          variables: Mapping of variable names to secret types.
+          unique: Generate a different value for each variable, rather
+            than one value shared by all variables of the same type.
+          kwargs: Arguments passed on to the handlers.
+
+        Returns:
+          OrderedDict mapping variable names to their new values. Types
+          that can't be generated get the value their handler's
+          ``generate_secret()`` returns (e.g., ``''`` for strings), and
+          variables whose value is ``None`` are left out.
+        """
+        by_type = OrderedDict()
+        for variable, secret_type in variables.items():
+            by_type.setdefault(secret_type, []).append(variable)
+        generated = {}
+        for secret_type, names in by_type.items():
+            handler = cls.get_handler(secret_type)
+            if not handler.is_generable():
+                values = [handler.generate_secret(**kwargs)] * len(names)
+            elif unique:
+                values = handler.generate_secrets(
+                    len(names), unique=True, **kwargs
+                )
+            else:
+                values = handler.generate_secrets(1, **kwargs) * len(names)
+            generated.update(zip(names, values))
+        return OrderedDict(
+            (variable, generated[variable])
+            for variable in variables
+            if generated.get(variable) is not None
+        )
+
     @classmethod
     def describe_secret_classes(cls):
-        return [
-            secret_class().describe()
-            for secret_class in cls.get_handler_classes()
-        ]
+        if cls._secret_types is None:
+            cls._secret_types = [
+                secret_class().describe()
+                for secret_class in cls.get_handler_classes()
+            ]
+        return cls._secret_types
 
 
 class SecretHandler(ABC):
     """
     Abstract secrets class.
+
+    Subclasses should declare whether they can generate values by
+    setting the ``generable`` class attribute. When left as ``None``,
+    generability is determined on first request by attempting to
+    generate a secret, and the result is cached on the class.
     """
+
+    generable = None
+
     @abstractmethod
     def generate_secret(self, **kwargs):
         raise NotImplementedError
 
+    def generate_secrets(self, count, **kwargs):
+        """
+        Generate ``count`` values.
+
+        Override this method in handlers that can produce many values
+        more cheaply than by generating them one at a time.
+        """
+        return [self.generate_secret(**kwargs) for _ in range(count)]
+
     def add_parser_arguments(self, parser):
         """
         Override this method with argparse arguments specific
@@ -83,14 +181,16 @@ class SecretHandler(ABC):
         return parser
 
     def is_generable(self):
-        result = None
-        try:
-            result = self.generate_secret()
-        except NotImplementedError:
-            return False
-        except RuntimeError:
-            return True
-        return result not in ['', None]
+        if self.generable is None:
+            result = None
+            try:
+                result = self.generate_secret()
+            except NotImplementedError:
+                result = None
+            except RuntimeError:
+                result = True
+            type(self).generable = result not in ['', None]
+        return self.generable
 
     def describe(self):
         return OrderedDict(
@@ -2,20 +2,28 @@
 
 """
 Secrets handlers.
-"""
 
-from pathlib import Path
+Handler modules are not imported here. The ``HANDLER_MODULES`` table
+maps each supported secret type to the module that implements it (in
+the same ``name = module:Class`` style as the ``psec`` command entry
+points) so that ``SecretFactory`` can import a handler only when a
+secret of that type is actually used.
+"""
 
+HANDLER_MODULES = {
+    'boolean': 'psec.secrets_environment.handlers.boolean:Boolean_c',
+    'crypt_6': 'psec.secrets_environment.handlers.crypt_6:Crypt_6_c',
+    'password': 'psec.secrets_environment.handlers.password:XKCD_Password_c',  # noqa
+    'sha256_digest': 'psec.secrets_environment.handlers.sha256_digest:DIGEST_SHA256_c',  # noqa
+    'string': 'psec.secrets_environment.handlers.string:String_c',
+    'token_base64': 'psec.secrets_environment.handlers.token_base64:BASE64_Token_c',  # noqa
+    'token_hex': 'psec.secrets_environment.handlers.token_hex:Token_Hex32_c',
+    'token_urlsafe': 'psec.secrets_environment.handlers.token_urlsafe:Token_URLsafe_c',  # noqa
+    'uuid4': 'psec.secrets_environment.handlers.uuid4:UUID4_c',
+}
 
-handlers_dir = Path(__file__).parent
-# Derive list of supported secret types from files in this directory.
-handlers = sorted(
-    [
-        str(item.stem)
-        for item in handlers_dir.iterdir()
-        if str(item.stem)[0] not in ['.', '_']
-    ]  # noqa
-)
+# List of supported secret types.
+handlers = sorted(HANDLER_MODULES)
 
 __all__ = handlers
 
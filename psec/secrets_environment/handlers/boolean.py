@@ -18,6 +18,8 @@ class Boolean_c(SecretHandler):
     Boolean string (`true` or `false`)
     """
 
+    generable = False
+
     def generate_secret(self, **kwargs) -> str:
         """
         Cannot generate boolean strings.
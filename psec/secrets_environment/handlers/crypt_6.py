@@ -13,12 +13,14 @@ from ..factory import (
 )
 
 
-@SecretFactory.register_handler(__name__)
+@SecretFactory.register_handler(__name__.split('.')[-1])
 class Crypt_6_c(SecretHandler):
     """
         crypt() style SHA512 ("$6$") digest
     """
 
+    generable = True
+
     def generate_secret(
         self,
         unique=False,
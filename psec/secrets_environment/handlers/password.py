@@ -6,6 +6,9 @@ XKCD password class.
 # Standard imports
 import secrets
 
+from array import array
+from itertools import accumulate
+
 # External imports
 from xkcdpass import xkcd_password as xp
 from xkcdpass.xkcd_password import CASE_METHODS
@@ -27,11 +30,118 @@ MIN_ACROSTIC_LENGTH = 3
 MAX_ACROSTIC_LENGTH = 6
 DELIMITER = '.'
 
+# Process-wide word indexes, keyed by word file.
+_word_indexes = {}
+
+
+class WordIndex:
+    """
+    Compact index of the words in an XKCD word file.
+
+    The unique words are sorted by length and then first letter and kept
+    in a single joined string with an array of offsets. The words of each
+    length, and of each length and first letter, occupy contiguous ranges
+    of the index, so choosing a random word of a given length range and
+    first letter doesn't need to filter the word list.
+    """
+
+    def __init__(self, words):
+        words = sorted(set(words), key=lambda word: (len(word), word))
+        self._buffer = ''.join(words)
+        self._offsets = array('L', accumulate(
+            (len(word) for word in words),
+            initial=0,
+        ))
+        # Maps length, and (length, first letter), to (start, end) ranges.
+        self._lengths = {}
+        self._buckets = {}
+        for i, word in enumerate(words):
+            for key, ranges in [
+                (len(word), self._lengths),
+                ((len(word), word[0]), self._buckets),
+            ]:
+                start, _ = ranges.get(key, (i, i))
+                ranges[key] = (start, i + 1)
+
+    @classmethod
+    def from_wordfile(cls, wordfile=None):
+        """
+        Build the index for a (comma separated list of) word file(s).
+        """
+        words = []
+        for wf in (wordfile or xp.DEFAULT_WORDFILE).split(','):
+            with open(xp.locate_wordfile(wf), encoding='utf-8') as f:
+                words.extend(line.strip() for line in f)
+        return cls(word for word in words if word)
+
+    def __len__(self):
+        return len(self._offsets) - 1
+
+    def word(self, i):
+        """Return the word at position ``i`` in the index."""
+        return self._buffer[self._offsets[i]:self._offsets[i + 1]]
+
+    def _ranges(self, min_length, max_length, letter=None):
+        if letter is None:
+            return [
+                self._lengths[length]
+                for length in range(min_length, max_length + 1)
+                if length in self._lengths
+            ]
+        return [
+            self._buckets[(length, letter)]
+            for length in range(min_length, max_length + 1)
+            if (length, letter) in self._buckets
+        ]
+
+    def count(self, min_length, max_length, letter=None):
+        """
+        Return the number of words with lengths between ``min_length``
+        and ``max_length`` (inclusive), and starting with ``letter``
+        when specified.
+        """
+        return sum(
+            end - start
+            for start, end in self._ranges(min_length, max_length, letter)
+        )
+
+    def choice(self, min_length, max_length, letter=None):
+        """
+        Return a randomly chosen word with length between ``min_length``
+        and ``max_length`` (inclusive), starting with ``letter`` when
+        specified.
+        """
+        ranges = self._ranges(min_length, max_length, letter)
+        n = sum(end - start for start, end in ranges)
+        if n == 0:
+            raise RuntimeError(
+                f"[-] no words of length {min_length} to {max_length}"
+                + (f" start with '{letter}'" if letter is not None else '')
+            )
+        n = secrets.randbelow(n)
+        for start, end in ranges:
+            if n < end - start:
+                return self.word(start + n)
+            n -= end - start
+
+
+def get_word_index(wordfile=None):
+    """
+    Return the ``WordIndex`` for ``wordfile``, building it on first use.
+    """
+    try:
+        return _word_indexes[wordfile]
+    except KeyError:
+        index = _word_indexes[wordfile] = WordIndex.from_wordfile(wordfile)
+        return index
+
 
 @SecretFactory.register_handler(__name__.split('.')[-1])
 class XKCD_Password_c(SecretHandler):
     """Simple (xkcd) password string"""
 
+    generable = True
+
     def __init__(self):
         self.last_result = None
 
@@ -104,6 +214,18 @@ class XKCD_Password_c(SecretHandler):
         see: https://www.unix-ninja.com/p/your_xkcd_passwords_are_pwned
         """
         unique = kwargs.get('unique', False)
+        if not unique and self.last_result:
+            return self.last_result
+        password = self.generate_secrets(1, **kwargs)[0]
+        if not unique:
+            self.last_result = password
+        return password
+
+    def generate_secrets(self, count, **kwargs):
+        """
+        Generate ``count`` XKCD-style password strings using the
+        process-wide index of the word file.
+        """
         case = kwargs.get('case', 'lower')
         acrostic = kwargs.get('acrostic', None)
         numwords = kwargs.get('numwords', WORDS)
@@ -123,38 +245,24 @@ class XKCD_Password_c(SecretHandler):
                 "'numwords' must be between "
                 f"{min_acrostic_length} and {max_acrostic_length}"
             )
-        wordfile = kwargs.get('wordfile', None)
-
-        if not unique and self.last_result:
-            return self.last_result
-
-        # Create a wordlist from the default wordfile.
-        if wordfile is None:
-            wordfile = xp.locate_wordfile()
-        mywords = xp.generate_wordlist(
-            wordfile=wordfile,
-            min_length=min_words_length,
-            max_length=max_words_length)
-        if acrostic is None:
-            # Chose a random word for acrostic with length
+        index = get_word_index(kwargs.get('wordfile', None))
+        passwords = []
+        for _ in range(count):
+            # Chose a random word for the acrostic with length
             # equal to desired number of words.
-            acrostic = secrets.choice(
-                xp.generate_wordlist(
-                    wordfile=wordfile,
-                    min_length=numwords,
-                    max_length=numwords)
+            word = (
+                acrostic if acrostic is not None
+                else index.choice(numwords, numwords)
             )
-        # Create a password with acrostic word
-        password = xp.generate_xkcdpassword(
-            mywords,
-            numwords=numwords,
-            acrostic=acrostic,
-            case=case,
-            delimiter=delimiter,
-        )
-        if not unique:
-            self.last_result = password
-        return password
+            # Create a password with acrostic word
+            words = [
+                index.choice(min_words_length, max_words_length, letter)
+                for letter in word
+            ]
+            passwords.append(
+                delimiter.join(xp.set_case(words, method=case))
+            )
+        return passwords
 
 
 # vim: set ts=4 sw=4 tw=0 et :
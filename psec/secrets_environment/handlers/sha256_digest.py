@@ -20,6 +20,8 @@ class DIGEST_SHA256_c(SecretHandler):
     DIGEST-SHA256 (user:pass) digest
     """
 
+    generable = True
+
     def generate_secret(self, user=None, credential=None, **kwargs) -> str:
         """
         Generate a DIGEST-SHA256 (user:pass) digest
@@ -12,6 +12,8 @@ from ..factory import (
 class String_c(SecretHandler):
     """Arbitrary string"""
 
+    generable = False
+
     def generate_secret(self, **kwargs) -> str:
         """
         Strings are not generated.
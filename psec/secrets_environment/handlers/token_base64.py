@@ -23,6 +23,8 @@ class BASE64_Token_c(SecretHandler):
     Random byte string
     """
 
+    generable = True
+
     def generate_secret(
         self,
         unique=False,
@@ -39,5 +41,22 @@ class BASE64_Token_c(SecretHandler):
             encoding='utf-8'
         )
 
+    def generate_secrets(
+        self,
+        count,
+        unique=False,
+        size=DEFAULT_SIZE,
+        **kwargs,
+    ):
+        """
+        Generate ``count`` BASE64 encoded tokens of 'size' bytes from
+        one draw of random bytes.
+        """
+        data = secrets.token_bytes(size * count)
+        return [
+            str(base64.b64encode(data[i:i + size]), encoding='utf-8')
+            for i in range(0, size * count, size)
+        ]
+
 
 # vim: set ts=4 sw=4 tw=0 et :
@@ -19,11 +19,23 @@ class Token_Hex32_c(SecretHandler):
     32-bit hexadecimal token
     """
 
+    generable = True
+
     def generate_secret(self, nbytes=32, **kwargs) -> str:
         """
         Generate a 32-bit hexadecimal token.
         """
         return secrets.token_hex(nbytes=nbytes)
 
+    def generate_secrets(self, count, nbytes=32, **kwargs):
+        """
+        Generate ``count`` hexadecimal tokens from one draw of random bytes.
+        """
+        data = secrets.token_bytes(nbytes * count)
+        return [
+            data[i:i + nbytes].hex()
+            for i in range(0, nbytes * count, nbytes)
+        ]
+
 
 # vim: set ts=4 sw=4 tw=0 et :
@@ -4,6 +4,7 @@ Hex token secret class.
 """
 
 # Standard imports
+import base64
 import secrets
 
 # Local imports
@@ -19,11 +20,25 @@ class Token_URLsafe_c(SecretHandler):
     32-bit URL-safe token
     """
 
+    generable = True
+
     def generate_secret(self, nbytes=32, **kwargs) -> str:
         """
         Generate a 32-bit URL-safe token.
         """
         return secrets.token_urlsafe(nbytes=nbytes)
 
+    def generate_secrets(self, count, nbytes=32, **kwargs):
+        """
+        Generate ``count`` URL-safe tokens from one draw of random bytes.
+        """
+        data = secrets.token_bytes(nbytes * count)
+        return [
+            base64.urlsafe_b64encode(
+                data[i:i + nbytes]
+            ).rstrip(b'=').decode('ascii')
+            for i in range(0, nbytes * count, nbytes)
+        ]
+
 
 # vim: set ts=4 sw=4 tw=0 et :
@@ -4,6 +4,7 @@ UUID4 secret class.
 """
 
 # Standard imports
+import secrets
 import uuid
 
 # Local imports
@@ -19,11 +20,23 @@ class UUID4_c(SecretHandler):
     UUID4 token
     """
 
+    generable = True
+
     def generate_secret(self, **kwargs) -> str:
         """
         Generate a UUID4 string.
         """
         return str(uuid.uuid4())
 
+    def generate_secrets(self, count, **kwargs):
+        """
+        Generate ``count`` UUID4 strings from one draw of random bytes.
+        """
+        data = secrets.token_bytes(16 * count)
+        return [
+            str(uuid.UUID(bytes=data[i:i + 16], version=4))
+            for i in range(0, 16 * count, 16)
+        ]
+
 
 # vim: set ts=4 sw=4 tw=0 et :
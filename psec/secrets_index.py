@@ -0,0 +1,237 @@
+# -*- coding: utf-8 -*-
+
+"""
+Cross-environment secrets search index.
+
+Answers ``psec secrets find`` queries without loading every environment
+in the secrets base directory. The index maps each environment to the
+names and groups of its variables, and to keyed hashes (HMAC-SHA256) of
+their values. The hash key is generated once per base directory. Values
+themselves are never stored in the index.
+
+Both the index and its key are kept in the secrets base directory with
+mode ``0600``. An environment's entry is rebuilt only when its secrets
+file or description files change.
+"""
+
+# Standard imports
+import hashlib
+import hmac
+import json
+import logging
+import os
+import secrets
+import tempfile
+import time
+
+from pathlib import Path
+
+# Local imports
+from psec.utils import (
+    atomic_write,
+    get_environment_paths,
+    get_environment_signature,
+)
+
+
+logger = logging.getLogger(__name__)
+
+INDEX_FILE = '.secrets-index.json'
+INDEX_KEY_FILE = '.secrets-index.key'
+INDEX_VERSION = 1
+INDEX_KEY_SIZE = 32
+# Environments whose files were modified more recently than this when
+# they are indexed might change again without changing their mtimes.
+INDEX_MIN_AGE_NS = 2 * 1000000000
+
+
+class SecretsIndex:
+    """
+    Search index for the environments in a secrets base directory.
+
+      Typical usage example::
+
+          from psec.secrets_index import SecretsIndex
+
+          index = SecretsIndex(basedir).refresh()
+          matches = index.find_names(['password'])
+    """
+
+    def __init__(self, basedir):
+        self.basedir = Path(basedir)
+        self.index_path = self.basedir / INDEX_FILE
+        self.key_path = self.basedir / INDEX_KEY_FILE
+        self._key = None
+        self._environments = {}
+
+    def get_key(self):
+        """
+        Return the hash key for this base directory, creating it (with
+        mode ``0600``) on first use.
+
+        The key is written to a temporary file that is then linked into
+        place, so a process that finds the key file always reads a whole
+        key, and when processes race to create it they all use the key of
+        the one that linked it first.
+        """
+        if self._key is None:
+            try:
+                self._key = self.read_key()
+            except FileNotFoundError:
+                key = secrets.token_bytes(INDEX_KEY_SIZE)
+                fd, tmp_path = tempfile.mkstemp(
+                    dir=self.basedir, prefix=f'.{INDEX_KEY_FILE}.')
+                try:
+                    with os.fdopen(fd, 'w') as f:
+                        f.write(key.hex() + '\n')
+                        f.flush()
+                        os.fsync(f.fileno())
+                    os.link(tmp_path, self.key_path)
+                except FileExistsError:
+                    key = self.read_key()
+                finally:
+                    os.unlink(tmp_path)
+                self._key = key
+        return self._key
+
+    def read_key(self):
+        """Return the saved hash key."""
+        key = bytes.fromhex(self.key_path.read_text().strip())
+        if len(key) != INDEX_KEY_SIZE:
+            raise RuntimeError(
+                f"[-] invalid secrets index key in '{self.key_path}'")
+        return key
+
+    def value_hash(self, value):
+        """Return the keyed hash of a secret value."""
+        return hmac.new(
+            self.get_key(),
+            str(value).encode('utf-8'),
+            hashlib.sha256,
+        ).hexdigest()
+
+    def read(self):
+        """Load the saved index, if it is present and usable."""
+        try:
+            index = json.loads(self.index_path.read_text())
+        except (OSError, ValueError):
+            return {}
+        if (
+            not isinstance(index, dict)
+            or index.get('version') != INDEX_VERSION
+        ):
+            return {}
+        return index.get('environments', {})
+
+    def write(self):
+        """Save the index with mode ``0600``."""
+        atomic_write(
+            self.index_path,
+            json.dumps({
+                'version': INDEX_VERSION,
+                'environments': self._environments,
+            }),
+            fsync=False,
+        )
+
+    def index_environment(self, environment):
+        """
+        Return the ``[variable, group, value_hash]`` entries for the
+        variables in ``environment``.
+        """
+        # pylint: disable=import-outside-toplevel
+        from psec.secrets_environment import SecretsEnvironment
+        # pylint: enable=import-outside-toplevel
+
+        se = SecretsEnvironment(
+            environment=environment,
+            secrets_basedir=self.basedir,
+        )
+        se.read_secrets_and_descriptions(ignore_errors=True)
+        return [
+            [
+                variable,
+                se.get_group(variable),
+                None if value is None else self.value_hash(value),
+            ]
+            for variable, value in se.items()
+        ]
+
+    def refresh(self):
+        """
+        Bring the index up to date, re-indexing only the environments
+        whose files changed since they were last indexed.
+        """
+        saved = self.read()
+        environments = {}
+        racy = time.time_ns() - INDEX_MIN_AGE_NS
+        for env_path in get_environment_paths(basedir=self.basedir):
+            environment = env_path.name
+            signature = [
+                list(item)
+                for item in get_environment_signature(env_path)
+            ]
+            entry = saved.get(environment)
+            if entry is not None and entry['signature'] == signature:
+                environments[environment] = entry
+                continue
+            logger.debug("[+] indexing environment '%s'", environment)
+            try:
+                variables = self.index_environment(environment)
+            except RuntimeError as err:
+                logger.warning(
+                    "[-] can't index environment '%s': %s",
+                    environment,
+                    err,
+                )
+                variables = []
+            if any(
+                mtime is not None and mtime >= racy
+                for _, _, mtime in signature
+            ):
+                # Make sure this is checked again next time.
+                signature = None
+            environments[environment] = {
+                'signature': signature,
+                'variables': variables,
+            }
+        self._environments = environments
+        if environments != saved:
+            try:
+                self.write()
+            except OSError as err:
+                logger.debug("[-] could not write search index: %s", err)
+        return self
+
+    def _matching(self, match, group=None):
+        return [
+            [environment, var_group, variable]
+            for environment, entry in sorted(self._environments.items())
+            for variable, var_group, value_hash in entry['variables']
+            if (group is None or var_group == group)
+            and match(variable, value_hash)
+        ]
+
+    def find_names(self, terms, group=None):
+        """
+        Return ``[environment, group, variable]`` lists for variables
+        whose names contain any of ``terms``.
+        """
+        return self._matching(
+            lambda variable, _: any(term in variable for term in terms),
+            group=group,
+        )
+
+    def find_values(self, values, group=None):
+        """
+        Return ``[environment, group, variable]`` lists for variables
+        whose values equal any of ``values``.
+        """
+        hashes = {self.value_hash(value) for value in values}
+        return self._matching(
+            lambda _, value_hash: value_hash in hashes,
+            group=group,
+        )
+
+
+# vim: set fileencoding=utf-8 ts=4 sw=4 tw=0 et :
@@ -3,6 +3,13 @@
 """
 Utility functions.
 
+Helpers that pull in heavy external dependencies live in submodules
+that are only imported by the subcommands that need them:
+
+  ``psec.utils.network``  IP address and WHOIS lookups
+  ``psec.utils.prompts``  interactive prompts
+  ``psec.utils.tree``     tree rendering
+
   Author: Dave Dittrich <dave.dittrich@gmail.com>
 
   URL: https://python_secrets.readthedocs.org.
@@ -10,37 +17,23 @@ Utility functions.
 
 # Standard imports
 import argparse
+import importlib
+import json
 import logging
 import os
-import random
+import re
 import subprocess  # nosec
 import stat
 import sys
 import tempfile
 import time
 
-
-# External imports
-import ipaddress
-import requests
-import psutil
-
-from anytree import (
-    Node,
-    RenderTree,
+from collections import (
+    namedtuple,
+    OrderedDict,
 )
-# Workaround until bullet has Windows missing 'termios' fix.
-# TODO(dittrich): https://github.com/Mckinsey666/bullet/issues/2
-try:
-    from bullet import (
-        Bullet,
-        YesNo,
-    )
-except ModuleNotFoundError:
-    pass
-from bs4 import BeautifulSoup
-from collections import OrderedDict
-from ipwhois import IPWhois
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
 from pathlib import Path
 from shutil import (
     copy,
@@ -55,9 +48,31 @@ from psec.exceptions import (
     # SecretNotFoundError,
 )
 
+try:
+    import fcntl
+except ImportError:  # pragma: no cover
+    # Advisory locking is not available on Windows.
+    fcntl = None
+
 
 logger = logging.getLogger(__name__)
 
+# Names formerly defined in this module, now imported on first reference
+# from the submodule that defines them.
+LAZY_ATTRIBUTES = {
+    'get_myip': 'psec.utils.network',
+    'get_myip_methods': 'psec.utils.network',
+    'get_netblock': 'psec.utils.network',
+    'myip_http': 'psec.utils.network',
+    'myip_methods': 'psec.utils.network',
+    'myip_resolver': 'psec.utils.network',
+    'prompt_options_dict': 'psec.utils.prompts',
+    'prompt_options_list': 'psec.utils.prompts',
+    'prompt_string': 'psec.utils.prompts',
+    'atree': 'psec.utils.tree',
+    'secrets_tree': 'psec.utils.tree',
+}
+
 DEFAULT_UMASK = 0o077
 MAX_UMASK = 0o777
 DEFAULT_MODE = 0o700
@@ -66,6 +81,27 @@ MARKER = '.psec'
 BASEDIR_BASENAME = '.secrets' if os.sep == '/' else 'secrets'
 SECRETS_FILE = 'secrets.json'
 SECRETS_DESCRIPTIONS_DIR = f'{os.path.splitext(SECRETS_FILE)[0]}.d'
+# Maximum number of threads used to inspect environments.
+DISCOVERY_THREADS = 8
+
+# Result of inspecting a candidate environment directory.
+EnvironmentInfo = namedtuple(
+    'EnvironmentInfo',
+    ['path', 'valid', 'needs_conversion', 'alias_for', 'yaml_files'],
+)
+
+
+def __getattr__(name):
+    """
+    Resolve names that moved to submodules, importing them on demand.
+    """
+    try:
+        module = importlib.import_module(LAZY_ATTRIBUTES[name])
+    except KeyError:
+        raise AttributeError(
+            f"module '{__name__}' has no attribute '{name}'"
+        ) from None
+    return getattr(module, name)
 
 
 class CustomFormatter(
@@ -255,6 +291,7 @@ def ensure_secrets_basedir(
             logger.info(str(err))
         if not allow_create:
             if allow_prompt:
+                from psec.utils.prompts import YesNo  # pylint: disable=import-outside-toplevel  # noqa
                 client = YesNo(
                     f"create directory '{secrets_basedir}'? ",
                     default='n'
@@ -357,6 +394,111 @@ def copydescriptions(src: Path, dst: Path):
     remove_other_perms(dst)
 
 
+def get_descriptions_key(descriptions_dir):
+    """
+    Identify the current state of the description files in a directory.
+
+    Args:
+      descriptions_dir: Path to a descriptions ('.d') directory.
+
+    Returns:
+      A sorted list of ``[name, size, mtime_ns]`` lists, one for each
+      ``.json`` file, that changes whenever a description file is added,
+      removed, or modified.
+    """
+    key = []
+    with os.scandir(descriptions_dir) as it:
+        for entry in it:
+            if not entry.name.endswith('.json') or not entry.is_file():
+                continue
+            st = entry.stat()
+            key.append([entry.name, st.st_size, st.st_mtime_ns])
+    return sorted(key)
+
+
+def atomic_write(path, data, mode=None, fsync=True):
+    """
+    Replace the contents of a file atomically.
+
+    The data is written to a temporary file in the same directory, which
+    is created with mode ``0600`` so it is never readable by others, then
+    renamed over ``path``. Readers see either the old or the new contents,
+    never a partially written file.
+
+    Args:
+      path: Path to the file to write.
+      data: Contents to write (``str`` is encoded as UTF-8).
+      mode: Permissions to give the file (default: ``0600``).
+      fsync: Flush the file and its directory to disk (default: ``True``).
+    """
+    path = Path(path)
+    if isinstance(data, str):
+        data = data.encode('utf-8')
+    fd, tmp_path = tempfile.mkstemp(dir=path.parent, prefix=f'.{path.name}.')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            if mode is not None and mode != DEFAULT_FILE_MODE:
+                os.chmod(tmp_path, mode)
+            f.write(data)
+            f.flush()
+            if fsync:
+                os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    except BaseException:
+        try:
+            os.unlink(tmp_path)
+        except FileNotFoundError:
+            pass
+        raise
+    if fsync and hasattr(os, 'O_DIRECTORY'):
+        dir_fd = os.open(path.parent, os.O_RDONLY | os.O_DIRECTORY)
+        try:
+            os.fsync(dir_fd)
+        finally:
+            os.close(dir_fd)
+
+
+@contextmanager
+def file_lock(path):
+    """
+    Hold an exclusive advisory lock on ``path`` for the duration of a
+    ``with`` block, creating the lock file (mode ``0600``) if necessary.
+
+    On platforms without ``fcntl`` this does not lock.
+    """
+    fd = os.open(path, os.O_RDWR | os.O_CREAT, DEFAULT_FILE_MODE)
+    try:
+        if fcntl is not None:
+            fcntl.flock(fd, fcntl.LOCK_EX)
+        yield
+    finally:
+        # Closing the descriptor releases the lock.
+        os.close(fd)
+
+
+def get_environment_signature(env_path):
+    """
+    Identify the current state of an environment's secrets.
+
+    Returns:
+      A tuple that changes whenever the secrets file or any of the
+      secrets description files for the environment at ``env_path``
+      is added, removed, or modified.
+    """
+    secrets_file = Path(env_path) / SECRETS_FILE
+    try:
+        st = os.stat(secrets_file)
+        signature = [(SECRETS_FILE, st.st_size, st.st_mtime_ns)]
+    except FileNotFoundError:
+        signature = [(SECRETS_FILE, None, None)]
+    try:
+        key = get_descriptions_key(Path(env_path) / SECRETS_DESCRIPTIONS_DIR)
+    except (FileNotFoundError, NotADirectoryError):
+        key = []
+    signature.extend(tuple(item) for item in key)
+    return tuple(signature)
+
+
 def umask(value):
     """Set umask."""
     if value.lower().find("o") < 0:
@@ -416,25 +558,96 @@ def getmount_fstype(mypath):
     return get_fs_type(mountpoint)
 
 
-def get_fs_type(mypath):
+# Journal of clean directories kept by full base directory permissions
+# checks. Directories modified more recently than this when the journal
+# is written might change again without changing their mtime.
+PERMISSIONS_JOURNAL = '.permissions.json'
+PERMISSIONS_JOURNAL_VERSION = 1
+JOURNAL_MIN_AGE_NS = 2 * 1000000000
+# File system types on which POSIX permissions can't be changed.
+NO_PERMS_FS_TYPES = ['NTFS', 'FAT', 'FAT32']
+# Per-process caches of the mount table and of file system types by
+# device number (``st_dev``).
+_mount_table = None
+_fs_types = {}
+
+
+def _unescape_mount_path(path):
+    """Decode the octal escapes (e.g., ``\\040``) used in ``/proc/mounts``."""
+    if '\\' not in path:
+        return path
+    return re.sub(
+        r'\\([0-7]{3})',
+        lambda m: chr(int(m.group(1), 8)),
+        path,
+    )
+
+
+def get_mount_table():
+    """
+    Return a list of ``(mountpoint, fstype)`` tuples, longest mount point
+    first, read once per process.
+
+    The table is read from ``/proc/self/mounts`` where available, falling
+    back to ``psutil`` on other platforms.
+    """
+    global _mount_table
+    if _mount_table is not None:
+        return _mount_table
+    table = []
+    try:
+        with open('/proc/self/mounts', encoding='utf-8') as f:
+            for line in f:
+                fields = line.split()
+                if len(fields) >= 3:
+                    table.append((_unescape_mount_path(fields[1]), fields[2]))
+    except OSError:
+        import psutil  # pylint: disable=import-outside-toplevel
+        table = [
+            (part.mountpoint, part.fstype)
+            for part in psutil.disk_partitions(all=True)
+        ]
+    _mount_table = sorted(table, key=lambda item: len(item[0]), reverse=True)
+    return _mount_table
+
+
+def _lookup_fs_type(mypath):
+    """Return the file system type of the longest matching mount point."""
+    path_ = os.path.realpath(os.path.abspath(mypath))
+    for mountpoint, fstype in get_mount_table():
+        if (
+            path_ == mountpoint
+            or path_.startswith(mountpoint.rstrip(os.path.sep) + os.path.sep)
+        ):
+            return fstype
+    return ''
+
+
+def get_fs_type(mypath, st_dev=None):
     """
     Identifies the file system type for a specific mount path.
 
+    Results are cached by device number, so only the first path on each
+    file system needs to be looked up in the mount table.
+
     Args:
       mypath (str): Candidate path.
+      st_dev (int): Device number of ``mypath``, if already known.
 
     Returns:
       string: File system type for partition containing ``mypath``.
     """
 
-    root_type = ''
-    for part in psutil.disk_partitions():
-        if part.mountpoint == os.path.sep:
-            root_type = part.fstype
-            continue
-        if str(mypath).startswith(part.mountpoint):
-            return part.fstype
-    return root_type
+    if st_dev is None:
+        try:
+            st_dev = os.stat(mypath).st_dev
+        except OSError:
+            return _lookup_fs_type(mypath)
+    try:
+        return _fs_types[st_dev]
+    except KeyError:
+        fs_type = _fs_types[st_dev] = _lookup_fs_type(mypath)
+        return fs_type
 
 
 def get_files_from_path(path=None):
@@ -464,18 +677,92 @@ def get_files_from_path(path=None):
     return files
 
 
-def get_environment_paths(basedir=None):
+def inspect_environment(env_path):
     """
-    Return sorted list of valid environment paths found in `basedir`.
+    Inspect a candidate environment directory.
+
+    Only the fixed locations that identify an environment are checked:
+    the environment directory itself and its descriptions directory.
+    Nothing else in the environment (e.g., ``tmp/`` or ``backups/``) is
+    looked at.
+
+    Args:
+      env_path: Path to candidate directory to inspect.
+
+    Returns:
+      An ``EnvironmentInfo`` named tuple.
+    """
+    env_path = Path(env_path)
+    alias_for = None
+    if env_path.is_symlink():
+        try:
+            alias_for = os.path.basename(os.readlink(env_path))
+        except OSError:
+            pass
+    contains_expected = False
+    yaml_files = []
+    YAML_SECRETS_FILE = str(SECRETS_FILE).replace('json', 'yml')
+    try:
+        with os.scandir(env_path) as it:
+            for entry in it:
+                if entry.name == SECRETS_FILE:
+                    contains_expected = True
+                elif entry.name == YAML_SECRETS_FILE:
+                    yaml_files.append(Path(entry.path))
+                elif (
+                    entry.name == SECRETS_DESCRIPTIONS_DIR
+                    and entry.is_dir()
+                ):
+                    contains_expected = True
+                    with os.scandir(entry.path) as descriptions:
+                        yaml_files.extend(
+                            Path(item.path) for item in descriptions
+                            if item.name.endswith('.yml')
+                        )
+    except (FileNotFoundError, NotADirectoryError, PermissionError):
+        pass
+    return EnvironmentInfo(
+        path=env_path,
+        valid=contains_expected and len(yaml_files) == 0,
+        needs_conversion=len(yaml_files) > 0,
+        alias_for=alias_for,
+        yaml_files=sorted(yaml_files),
+    )
+
+
+def discover_environments(basedir=None):
+    """
+    Inspect all directories in ``basedir`` in parallel.
+
+    Returns:
+      List of ``EnvironmentInfo`` named tuples, sorted by path, for every
+      directory (or link to a directory) in ``basedir``.
     """
     basedir = (
         get_default_secrets_basedir() if basedir is None
         else Path(basedir)
     )
+    with os.scandir(basedir) as it:
+        candidates = sorted(
+            Path(entry.path) for entry in it if entry.is_dir()
+        )
+    if len(candidates) < 2:
+        return [inspect_environment(path) for path in candidates]
+    with ThreadPoolExecutor(
+        max_workers=min(DISCOVERY_THREADS, len(candidates))
+    ) as executor:
+        return list(executor.map(inspect_environment, candidates))
+
+
+def get_environment_paths(basedir=None):
+    """
+    Return sorted list of valid environment paths found in `basedir`.
+    """
     results = list()
-    for item in sorted(basedir.iterdir()):
-        if is_valid_environment(item):
-            results.append(item)
+    for info in discover_environments(basedir=basedir):
+        report_environment(info)
+        if info.valid:
+            results.append(info.path)
     return results
 
 
@@ -492,128 +779,273 @@ def is_valid_environment(env_path, verbose_level=1):
       environment directory or not based on contents including a
       'secrets.json' file or a 'secrets.d' directory.
     """
-    environment = os.path.split(env_path)[1]
-    contains_expected = False
-    YAML_SECRETS_FILE = str(SECRETS_FILE).replace('json', 'yml')
-    yaml_files = []
-    for root, directories, filenames in os.walk(env_path):
-        if (
-            SECRETS_FILE in filenames
-            or SECRETS_DESCRIPTIONS_DIR in directories
-        ):
-            contains_expected = True
-        if YAML_SECRETS_FILE in filenames:
-            yaml_files.append(Path(root) / YAML_SECRETS_FILE)
-        if root.endswith(SECRETS_DESCRIPTIONS_DIR):
-            yaml_files.extend([
-                os.path.join(root, filename)
-                for filename in filenames
-                if filename.endswith('.yml')
-            ])
-    for filename in yaml_files:
+    info = (
+        env_path if isinstance(env_path, EnvironmentInfo)
+        else inspect_environment(env_path)
+    )
+    report_environment(info, verbose_level=verbose_level)
+    return info.valid
+
+
+def report_environment(info, verbose_level=1):
+    """
+    Log warnings about problems found by ``inspect_environment()``.
+    """
+    for filename in info.yaml_files:
         if verbose_level > 1:
             logger.warning("[!] found '%s'", filename)
-    is_valid = (
-        os.path.exists(env_path)
-        and contains_expected
-        and len(yaml_files) == 0
-    )
-    if len(yaml_files) > 0 and verbose_level > 0:
+    if info.needs_conversion and verbose_level > 0:
         logger.warning(
             "[!] environment '%s' needs conversion (see 'psec utils yaml-to-json --help')",  # noqa
-            environment)
-    if not is_valid and verbose_level > 1:
+            info.path.name)
+    if not info.valid and verbose_level > 1:
         logger.warning(
             "[!] environment directory '%s' exists but looks incomplete",
-            env_path)
-    return is_valid
+            info.path)
 
 
-def get_netblock(ip=None):
+def permissions_check(
+    basedir='.',
+    verbose_level=0,
+    environment=None,
+):
     """
-    Derives the CIDR netblocks for an IP via WHOIS lookup.
+    Check for presense of pernicious overly-permissive permissions.
 
-    Args:
-      ip (str): IP address
+    When ``environment`` is specified, only the top level of ``basedir``
+    and the tree for that environment are checked. Otherwise the whole
+    base directory is checked, using a journal of directory modification
+    times (kept in ``basedir``) to avoid examining the files in
+    directories that have not changed since they were last found to be
+    clean. (Changing the mode of an existing file does not change the
+    modification time of its directory, so such a change is found by the
+    next check of the environment, or after the directory changes.)
 
     Returns:
-      string: One or more CIDR blocks
+      list: ``(path, perms)`` tuples for directories and files found
+      with "other" permissions.
     """
-
-    ip = str(ip).split('/')[0] if '/' in str(ip) else ip
-    obj = IPWhois(ip)
-    results = obj.lookup_whois()
-    return results['asn_cidr']
-
-
-def permissions_check(
-    basedir='.',
-    verbose_level=0,
-):
-    """Check for presense of pernicious overly-permissive permissions."""
+    # Nothing is reported at lower verbosity, so don't bother looking.
+    if verbose_level < 1:
+        return []
     # File permissions on Cygwin/Windows filesystems don't work the
     # same way as Linux. Don't try to change them.
     # TODO(dittrich): Is there a Better way to handle perms on Windows?
     fs_type = get_fs_type(basedir)
-    if fs_type in ['NTFS', 'FAT', 'FAT32']:
+    if fs_type in NO_PERMS_FS_TYPES:
         msg = (
             f"[-] {basedir} has file system type '{fs_type}': "
             "skipping permissions check"
         )
         logger.info(msg)
-        return
-    any_other_perms = stat.S_IROTH | stat.S_IWOTH | stat.S_IXOTH
-    for root, dirs, files in os.walk(basedir, topdown=True):
-        for name in files:
-            path = os.path.join(root, name)
+        return []
+    if environment is not None:
+        found = _find_other_perms(basedir, basedir, recursive=False)
+        env_path = os.path.join(basedir, str(environment))
+        if os.path.isdir(env_path):
+            found.extend(_find_other_perms(basedir, env_path))
+    else:
+        journal_path = os.path.join(basedir, PERMISSIONS_JOURNAL)
+        journal = read_permissions_journal(journal_path)
+        new_journal = {}
+        found = _find_other_perms(
+            basedir,
+            basedir,
+            journal=journal,
+            new_journal=new_journal,
+        )
+        if new_journal != journal:
+            try:
+                atomic_write(
+                    journal_path,
+                    json.dumps({
+                        'version': PERMISSIONS_JOURNAL_VERSION,
+                        'directories': new_journal,
+                    }),
+                    fsync=False,
+                )
+            except OSError as err:
+                logger.debug(
+                    "[-] could not write permissions journal: %s", err)
+    for kind, path, perms in found:
+        print(f"[!] {kind} '{path}' is mode {oct(perms)}", file=sys.stderr)
+    return [(path, perms) for _, path, perms in found]
+
+
+def read_permissions_journal(journal_path):
+    """
+    Return the directory entries from a permissions journal, or an
+    empty dictionary if it is missing or unusable.
+    """
+    try:
+        with open(journal_path, encoding='utf-8') as f:
+            journal = json.load(f)
+    except (OSError, ValueError):
+        return {}
+    if (
+        not isinstance(journal, dict)
+        or journal.get('version') != PERMISSIONS_JOURNAL_VERSION
+    ):
+        return {}
+    return journal.get('directories', {})
+
+
+def _find_other_perms(
+    basedir,
+    top,
+    recursive=True,
+    journal=None,
+    new_journal=None,
+):
+    """
+    Return ``(kind, path, perms)`` tuples for the directories and files
+    under ``top`` that have any "other" permissions.
+
+    If ``journal`` is given, the files in a directory whose modification
+    time matches its entry are not examined again. Directories that are
+    clean are recorded in ``new_journal``.
+    """
+    found = []
+    racy = time.time_ns() - JOURNAL_MIN_AGE_NS
+    stack = [top]
+    while stack:
+        path = stack.pop()
+        try:
+            st = os.stat(path)
+        except OSError:
+            continue
+        clean = not st.st_mode & stat.S_IRWXO
+        if not clean:
+            found.append(('directory', path, stat.S_IMODE(st.st_mode)))
+        # The top directory is always examined, since writing the
+        # journal changes its modification time.
+        rel = os.path.relpath(path, basedir)
+        entry = (
+            journal.get(rel)
+            if journal is not None and path != top
+            else None
+        )
+        if entry is not None and entry[0] == st.st_mtime_ns:
+            subdirs = entry[1]
+        else:
+            subdirs = []
             try:
-                st = os.stat(path)
-                perms = st.st_mode & 0o777
-                open_perms = (perms & any_other_perms) != 0
-                if (open_perms and verbose_level >= 1):
-                    print(
-                        f"[!] file '{path}' is mode {oct(perms)}",
-                        file=sys.stderr
-                    )
+                with os.scandir(path) as it:
+                    entries = list(it)
             except OSError:
-                pass
-            for name in dirs:
-                path = os.path.join(root, name)
+                continue
+            for dir_entry in entries:
+                if dir_entry.is_dir(follow_symlinks=False):
+                    subdirs.append(dir_entry.name)
+                    continue
                 try:
-                    st = os.stat(path)
-                    perms = st.st_mode & 0o777
-                    open_perms = (perms & any_other_perms) != 0
-                    if (open_perms and verbose_level >= 1):
-                        print(
-                            (
-                                f"[!] directory '{path}' is mode "
-                                f"{oct(perms)}"
-                            ),
-                            file=sys.stderr
-                        )
+                    entry_st = dir_entry.stat()
                 except OSError:
-                    pass
+                    continue
+                if entry_st.st_mode & stat.S_IRWXO:
+                    clean = False
+                    found.append((
+                        'directory' if dir_entry.is_dir() else 'file',
+                        dir_entry.path,
+                        stat.S_IMODE(entry_st.st_mode),
+                    ))
+        if (
+            new_journal is not None
+            and path != top
+            and clean
+            and st.st_mtime_ns < racy
+        ):
+            new_journal[rel] = [st.st_mtime_ns, sorted(subdirs)]
+        if recursive:
+            stack.extend(
+                os.path.join(path, name)
+                for name in sorted(subdirs, reverse=True)
+            )
+    return found
 
 
 def remove_other_perms(dst):
     """
     Make all files in path ``dst`` have ``o-rwx`` permissions.
 
+    The tree is walked in a single pass in-process. Symbolic links are
+    neither followed nor (where the platform can't change the mode of a
+    link itself) modified.
+
     NOTE: This does not work on file system types ``NTFS``, ``FAT``, or
-    ``FAT32``. A log message will be produced when this is encountered.
+    ``FAT32``. A log message will be produced when this is encountered,
+    and any such file systems mounted within ``dst`` are skipped.
     """
     # File permissions on Cygwin/Windows filesystems don't work the
     # same way as Linux. Don't try to change them.
     # TODO(dittrich): Is there a Better way to handle perms on Windows?
-    fs_type = get_fs_type(dst)
-    if fs_type in ['NTFS', 'FAT', 'FAT32']:
+    try:
+        st = os.lstat(dst)
+    except FileNotFoundError:
+        return
+    if stat.S_ISLNK(st.st_mode):
+        # ``chmod`` changes the target of a symbolic link argument.
+        dst = os.path.realpath(dst)
+        st = os.stat(dst)
+    if not _can_set_perms(dst, st):
+        return
+    _remove_other_perm(dst, st)
+    if not stat.S_ISDIR(st.st_mode):
+        return
+    stack = [(str(dst), st.st_dev)]
+    while stack:
+        path, dev = stack.pop()
+        try:
+            with os.scandir(path) as it:
+                entries = list(it)
+        except FileNotFoundError:
+            continue
+        for entry in entries:
+            try:
+                entry_st = entry.stat(follow_symlinks=False)
+            except FileNotFoundError:
+                continue
+            if (
+                entry_st.st_dev != dev
+                and not _can_set_perms(entry.path, entry_st)
+            ):
+                continue
+            _remove_other_perm(entry.path, entry_st)
+            if stat.S_ISDIR(entry_st.st_mode):
+                stack.append((entry.path, entry_st.st_dev))
+
+
+def _can_set_perms(path, st):
+    """Check whether the file system holding ``path`` supports modes."""
+    fs_type = get_fs_type(path, st_dev=st.st_dev)
+    if fs_type in NO_PERMS_FS_TYPES:
         msg = (
-            f"[-] {dst} has file system type '{fs_type}': "
+            f"[-] {path} has file system type '{fs_type}': "
             'skipping setting permissions'
         )
         logger.info(msg)
-    else:
-        get_output(['chmod', '-R', 'o-rwx', dst])
+        return False
+    return True
+
+
+def _remove_other_perm(path, st):
+    """Remove ``o-rwx`` from ``path`` if set, without following links."""
+    if not st.st_mode & stat.S_IRWXO:
+        return
+    if (
+        stat.S_ISLNK(st.st_mode)
+        and os.chmod not in os.supports_follow_symlinks
+    ):
+        # The mode of a link can't be changed here (and isn't used).
+        return
+    try:
+        os.chmod(
+            path,
+            stat.S_IMODE(st.st_mode) & ~stat.S_IRWXO,
+            follow_symlinks=False,
+        )
+    except FileNotFoundError:
+        pass
 
 
 def get_output(cmd=['echo', 'NO COMMAND SPECIFIED'],
@@ -676,117 +1108,6 @@ def require_options(options, *args):
     return True
 
 
-def prompt_options_list(options=None,
-                        default=None,
-                        prompt="Select from the following options"):
-    """Prompt the user for a string using a list of options.
-
-    The options will be one of the following:
-
-    '*' - Any user input
-    'A,*' - 'A', or any user input.
-    'A,B' - Only choices are 'A' or 'B'.
-
-    """
-    if 'Bullet' not in globals():
-        raise RuntimeError("[-] can't use Bullet on Windows")
-    if (
-        len(options) == 0
-        or not isinstance(options[0], str)
-    ):
-        raise RuntimeError('[-] a list of options is required')
-    cancel = '<CANCEL>'
-    if default is None:
-        default = cancel
-    else:
-        # Remove the default from the list because it will
-        # be added back as the first item.
-        options = [i for i in options if i != default]
-    choices = [default] + options
-    cli = Bullet(prompt=f'\n{prompt}',
-                 choices=choices,
-                 indent=0,
-                 align=2,
-                 margin=1,
-                 shift=0,
-                 bullet="→",
-                 pad_right=5)
-    choice = cli.launch()
-    if default == cancel and choice == cancel:
-        logger.info('[-] cancelled selection of choice')
-        return None
-    return choice
-
-
-def prompt_options_dict(options=None,
-                        by_descr=True,
-                        prompt="Select from the following options"):
-    """
-    Prompt the user for a string using option dictionaries.
-
-    These dictionaries map a descriptive name to an identifier::
-
-        {'descr': 'DigitalOcean', 'ident': 'digitalocean'}
-
-
-    """
-    if 'Bullet' not in globals():
-        raise RuntimeError("[-] can't use Bullet on Windows")
-    if options is None:
-        raise RuntimeError('[-] no options specified')
-    if not isinstance(options[0], dict):
-        raise RuntimeError('[-] options is not a list of dictionaries')
-    choices = ['<CANCEL>'] + [
-                                opt['descr']
-                                if by_descr
-                                else opt['ident']
-                                for opt in options
-                             ]
-    cli = Bullet(prompt=f'\n{prompt}',
-                 choices=choices,
-                 indent=0,
-                 align=2,
-                 margin=1,
-                 shift=0,
-                 bullet="→",
-                 pad_right=5)
-    choice = cli.launch()
-    if choice == "<CANCEL>":
-        logger.info('[-] cancelled selection of choice')
-        return None
-    selected = find(options,
-                    'descr' if by_descr else 'ident',
-                    choice)
-    try:
-        return options[selected]['ident']
-    except Exception as exc:  # noqa
-        return None
-
-
-# >> Issue: [B322:blacklist] The input method in Python 2 will read from
-# standard input, evaluate and run the resulting string as python source code.
-# This is similar, though in many ways worse, then using eval. On Python 2, use
-# raw_input instead, input is safe in Python 3.
-#    Severity: High   Confidence: High Location: psec/utils/__init__.py:200
-#    More Info:
-#    https://bandit.readthedocs.io/en/latest/blacklists/blacklist_calls.html#b322-input  # noqa
-
-def prompt_string(prompt="Enter a value",
-                  default=None):
-    """Prompt the user for a string and return it"""
-    _new = None
-    while True:
-        try:
-            _new = str(input(f"{prompt}? [{str(default)}]: "))  # nosec
-            break
-        except ValueError:
-            print("Sorry, I didn't understand that.")
-            continue
-        except KeyboardInterrupt:
-            break
-    return default if _new in [None, ''] else _new
-
-
 def safe_delete_file(
     file_name=None,
     passes=3,
@@ -813,83 +1134,6 @@ def safe_delete_file(
     os.unlink(mask_name)
 
 
-def atree(dir,
-          print_files=True,
-          outfile=None):
-    """
-    Produces the tree structure for the path specified on the command
-    line. If output is specified (e.g., as sys.stdout) it will be used,
-    otherwise a list of strings is returned.
-
-    Uses anytree: https://anytree.readthedocs.io/en/latest/
-
-    :param dir:
-    :param print_files:
-    :param outfile:
-    :return: str
-    """
-
-    nodes = dict()
-    nodes[dir] = Node(dir)
-    root_node = nodes[dir]
-    for root, dirs, files in os.walk(dir, topdown=True):
-        if root not in nodes:
-            nodes[root] = Node(root)
-        for name in files:
-            if print_files:
-                nodes[os.path.join(root, name)] = \
-                    Node(name, parent=nodes[root])
-        for name in dirs:
-            nodes[os.path.join(root, name)] = Node(name, parent=nodes[root])
-
-    output = []
-    for pre, fill, node in RenderTree(root_node):
-        output.append((f'{ pre }{ node.name }'))
-    if outfile is not None:
-        for line in output:
-            print(line, file=outfile)
-    else:
-        return output
-
-
-def secrets_tree(
-    env=None,
-    outfile=None
-):
-    """
-    Produces the tree structure for groups and secrets in an environment.
-
-    If output is specified (e.g., as sys.stdout) it will be used,
-    otherwise a list of strings is returned.
-
-    Uses anytree: https://anytree.readthedocs.io/en/latest/
-
-    :param environment_dir:
-    :param outfile:
-    :return: str
-    """
-
-    nodes = dict()
-    env_name = str(env)
-    nodes[env_name] = Node(env_name)
-    root_node = nodes[env_name]
-    for group in sorted(env.get_groups()):
-        group_name = os.path.join(env_name, group)
-        nodes[group_name] = Node(group, parent=root_node)
-        for variable in sorted(env.get_items_from_group(group)):
-            nodes[os.path.join(group_name, variable)] = \
-                Node(variable, parent=nodes[group_name])
-
-    output = []
-    for pre, fill, node in RenderTree(root_node):
-        output.append((f'{ pre }{ node.name }'))
-    if outfile is not None:
-        for line in output:
-            print(line, file=outfile)
-    else:
-        return output
-
-
 def show_current_value(variable=None):
     """Pretty-print environment variable (if set)."""
     value = os.getenv(variable, None)
@@ -987,99 +1231,4 @@ class Timer(object):
         return f"{int(hours):0>2}:{int(minutes):0>2}:{seconds:05.2f}"
 
 
-def myip_http(arg=None):
-    """Use an HTTP service that only returns IP address."""
-    # Return type if no argument for use in Lister.
-    if arg is None:
-        return 'https'
-    page = requests.get(arg, stream=True, timeout=3.05)
-    soup = BeautifulSoup(page.text, 'html.parser')
-    if page.status_code != 200:
-        raise RuntimeError(
-            f"[-] error: {page.reason}\n{soup.body.text}")
-    logger.debug('[-] got page: "%s"', page.text)
-    interface = ipaddress.ip_interface(str(soup).strip())
-    return interface
-
-
-def myip_resolver(arg=None):
-    """Use DNS resolver to get IP address."""
-    # Return type if no argument for use in Lister.
-    if arg is None:
-        return 'dns'
-    output = get_output(cmd=arg.split(" "))
-    # Clean up output
-    result = str(output[0]).replace('"', '')
-    try:
-        interface = ipaddress.ip_interface(result)
-    except TypeError:
-        interface = None
-    return interface
-
-
-# Function map. (See epilog help text for MyIP.)
-myip_methods = {
-    'akamai': {
-        'arg': 'dig +short @ns1-1.akamaitech.net ANY whoami.akamai.net',
-        'func': myip_resolver
-    },
-    'amazon': {
-        'arg': 'https://checkip.amazonaws.com',
-        'func': myip_http,
-    },
-    'google': {
-        'arg': 'dig +short @ns1.google.com TXT o-o.myaddr.l.google.com',
-        'func': myip_resolver,
-    },
-    'opendns_h': {
-        'arg': 'https://diagnostic.opendns.com/myip',
-        'func': myip_http,
-    },
-    'opendns_r': {
-        'arg': 'dig +short @resolver1.opendns.com myip.opendns.com -4',
-        'func': myip_resolver,
-    },
-    'icanhazip': {
-        'arg': 'https://icanhazip.com/',
-        'func': myip_http,
-    },
-    'infoip': {
-        'arg': 'https://api.infoip.io/ip',
-        'func': myip_http,
-    },
-    'tnx': {
-        'arg': 'https://tnx.nl/ip',
-        'func': myip_http,
-    }
-}
-
-
-def get_myip_methods(include_random=False):
-    """Return list of available method ids for getting IP address."""
-    methods = list(myip_methods.keys())
-    # For argparse choices, set True
-    if include_random:
-        methods.append('random')
-    return methods
-
-
-def get_myip(method='random'):
-    """Return current routable source IP address."""
-    methods = get_myip_methods()
-    if method == 'random':
-        method = random.choice(methods)  # nosec
-    elif method not in methods:
-        raise RuntimeError(
-            f"[-] method '{method}' for obtaining IP address is "
-            "not implemented")
-    func = myip_methods[method].get('func')
-    logger.debug("[+] determining IP address using '%s'", method)
-    arg = myip_methods[method].get('arg')
-    ip = str(func(arg=arg))
-    if len(ip) == 0 or ip is None:
-        raise RuntimeError(
-            f"[-] method '{method}' failed to get an IP address")
-    return ip
-
-
 # vim: set fileencoding=utf-8 ts=4 sw=4 tw=0 et :
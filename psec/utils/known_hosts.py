@@ -0,0 +1,203 @@
+# -*- coding: utf-8 -*-
+
+"""
+SSH ``known_hosts`` file editing.
+
+Supports adding and removing host keys in an OpenSSH ``known_hosts``
+file in-process, rewriting the file atomically, including entries with
+hashed host names (``HashKnownHosts yes``) and ``[host]:port`` names.
+
+As in OpenSSH, ``[host]:22`` is the same as ``host`` and a host on any
+other port is a different name. Removing a plain ``host`` also removes
+its ``[host]:port`` entries (unless their names are hashed, since the
+ports can't be known).
+"""
+
+# Standard imports
+import base64
+import hashlib
+import hmac
+import logging
+import os
+import stat
+
+from pathlib import Path
+
+# Local imports
+from psec.utils import atomic_write
+
+
+logger = logging.getLogger(__name__)
+
+SYSTEM_KNOWN_HOSTS = '/etc/ssh/ssh_known_hosts'
+KNOWN_HOSTS_MODE = 0o644
+HASHED_PREFIX = '|1|'
+SSH_PORT = '22'
+
+
+def _split_host(name):
+    """
+    Return the host and port (``None`` for the default port) named by
+    ``host`` or ``[host]:port``.
+    """
+    if name.startswith('[') and ']:' in name:
+        host, port = name[1:].rsplit(']:', 1)
+        return host, None if port == SSH_PORT else port
+    return name, None
+
+
+def _host_matches(pattern, host, any_port=False):
+    """
+    Return True if a host name field from a ``known_hosts`` entry
+    names ``host`` (exactly, or by hash), after normalizing ``[host]:22``
+    to ``host``. If ``any_port`` is True, a plain ``host`` also matches
+    (unhashed) ``[host]:port`` fields.
+    """
+    name, port = _split_host(host)
+    if pattern.startswith(HASHED_PREFIX):
+        canonical = name if port is None else f'[{name}]:{port}'
+        try:
+            salt, digest = pattern[len(HASHED_PREFIX):].split('|', 1)
+            expected = hmac.new(
+                base64.b64decode(salt),
+                canonical.encode('utf-8'),
+                hashlib.sha1,
+            ).digest()
+            return hmac.compare_digest(expected, base64.b64decode(digest))
+        except ValueError:
+            return False
+    pattern_name, pattern_port = _split_host(pattern)
+    if pattern_name != name:
+        return False
+    return (
+        pattern_port == port
+        or (any_port and not host.startswith('['))
+    )
+
+
+class KnownHostsEntry(object):
+    """A line from a ``known_hosts`` file."""
+
+    def __init__(self, line):
+        self.line = line.rstrip('\n')
+        self.marker = None
+        self.hosts = []
+        self.keytype = None
+        self.key = None
+        fields = self.line.split()
+        if fields and fields[0].startswith('@'):
+            self.marker = fields.pop(0)
+        if len(fields) >= 3 and not fields[0].startswith('#'):
+            self.hosts = fields[0].split(',')
+            self.keytype = fields[1]
+            self.key = fields[2]
+
+    def names(self, host, any_port=False):
+        """
+        Return True if this entry is for ``host`` (on any port, if
+        ``any_port`` is True and ``host`` has no port).
+        """
+        return any(
+            _host_matches(pattern, host, any_port=any_port)
+            for pattern in self.hosts
+        )
+
+
+class KnownHostsFile(object):
+    """
+    An OpenSSH ``known_hosts`` file.
+
+      Typical usage example::
+
+          from psec.utils.known_hosts import KnownHostsFile
+
+          known_hosts = KnownHostsFile('~/.ssh/known_hosts')
+          known_hosts.remove(['red.example.com', '192.0.2.10'])
+          known_hosts.add(['red.example.com,192.0.2.10 ssh-ed25519 AAAA...'])
+          known_hosts.write()
+    """
+
+    def __init__(self, path=SYSTEM_KNOWN_HOSTS):
+        self.path = Path(path).expanduser()
+        try:
+            with open(self.path, 'r') as f:
+                self.entries = [KnownHostsEntry(line) for line in f]
+            self.mode = stat.S_IMODE(os.stat(self.path).st_mode)
+        except FileNotFoundError:
+            self.entries = []
+            self.mode = KNOWN_HOSTS_MODE
+        self.changed = False
+
+    def is_writable(self):
+        """
+        Return True if the file can be rewritten (atomically) by this
+        process, which requires write access to its directory.
+        """
+        if self.path.exists() and not os.access(self.path, os.W_OK):
+            return False
+        return os.access(self.path.parent, os.W_OK | os.X_OK)
+
+    def remove(self, hosts):
+        """
+        Remove all entries for any of ``hosts`` (except revocations),
+        including the ``[host]:port`` entries for a plain ``host``.
+
+        Returns the number of entries removed.
+        """
+        hosts = list(hosts)
+        kept = [
+            entry for entry in self.entries
+            if entry.marker == '@revoked'
+            or not any(entry.names(host, any_port=True) for host in hosts)
+        ]
+        removed = len(self.entries) - len(kept)
+        if removed:
+            self.entries = kept
+            self.changed = True
+        return removed
+
+    def add(self, lines):
+        """
+        Add ``known_hosts`` lines (``hosts keytype key [comment]``),
+        replacing any keys of the same type for the same hosts.
+
+        Returns the number of entries added.
+        """
+        added = 0
+        for line in lines:
+            new = KnownHostsEntry(line)
+            if not new.hosts:
+                raise RuntimeError(f"[-] invalid known_hosts line '{line}'")
+            if any(
+                entry.marker is None
+                and entry.keytype == new.keytype
+                and entry.key == new.key
+                and all(entry.names(host) for host in new.hosts)
+                for entry in self.entries
+            ):
+                continue
+            self.entries = [
+                entry for entry in self.entries
+                if entry.marker is not None
+                or entry.keytype != new.keytype
+                or not any(entry.names(host) for host in new.hosts)
+            ]
+            self.entries.append(new)
+            self.changed = True
+            added += 1
+        return added
+
+    def write(self):
+        """Atomically rewrite the file, if it was changed."""
+        if not self.changed:
+            return False
+        atomic_write(
+            self.path,
+            ''.join(f'{entry.line}\n' for entry in self.entries),
+            mode=self.mode,
+        )
+        self.changed = False
+        return True
+
+
+# vim: set fileencoding=utf-8 ts=4 sw=4 tw=0 et :
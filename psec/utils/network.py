@@ -0,0 +1,515 @@
+# -*- coding: utf-8 -*-
+
+"""
+Network address utility functions.
+
+These depend on ``requests``, ``bs4`` and ``ipwhois``, so they are kept
+out of ``psec.utils`` to avoid loading those packages on every run.
+"""
+
+# Standard imports
+import ipaddress
+import json
+import logging
+import queue
+import random
+import secrets
+import socket
+import struct
+import threading
+import time
+
+from concurrent.futures import (
+    FIRST_COMPLETED,
+    ThreadPoolExecutor,
+    wait,
+)
+
+# External imports
+import requests
+
+from bs4 import BeautifulSoup
+from ipwhois import IPWhois
+
+# Local imports
+from psec.utils import atomic_write
+
+
+logger = logging.getLogger(__name__)
+
+MYIP_TIMEOUT = 3.05
+MYIP_CACHE_FILE = '.myip.json'
+MYIP_CACHE_TTL = 300
+# Number of methods raced by the 'race' method.
+MYIP_RACE_COUNT = 3
+NETBLOCK_CACHE_FILE = '.netblocks.json'
+NETBLOCK_CACHE_VERSION = 1
+NETBLOCK_CACHE_TTL = 24 * 60 * 60
+# Number of WHOIS queries made at the same time.
+NETBLOCK_WORKERS = 4
+DNS_PORT = 53
+DNS_TYPES = {'A': 1, 'TXT': 16, 'AAAA': 28, 'ANY': 255}
+
+
+def get_netblock(ip=None):
+    """
+    Derives the CIDR netblocks for an IP via WHOIS lookup.
+
+    Args:
+      ip (str): IP address
+
+    Returns:
+      string: One or more CIDR blocks
+    """
+
+    ip = str(ip).split('/')[0] if '/' in str(ip) else ip
+    obj = IPWhois(ip)
+    results = obj.lookup_whois()
+    return results['asn_cidr']
+
+
+class NetblockIndex(object):
+    """
+    Index of the CIDR netblocks learned from WHOIS lookups.
+
+    Each WHOIS result is indexed under the network(s) it names, so the
+    result for any address within a network is found (by longest prefix
+    match) without another lookup. Results older than ``ttl`` seconds
+    are ignored. The index can be saved to and loaded from a file.
+    """
+
+    def __init__(self, path=None, ttl=NETBLOCK_CACHE_TTL):
+        self.path = path
+        self.ttl = ttl
+        # Learned results: {cidr: [result, time]}
+        self._netblocks = dict()
+        # {(version, prefixlen): {network_address: cidr}}
+        self._index = dict()
+        self.changed = False
+        if path is not None:
+            self.read()
+
+    def read(self):
+        """Load the saved index, dropping expired results."""
+        try:
+            with open(self.path, 'r') as f:
+                saved = json.load(f)
+            if saved.get('version') != NETBLOCK_CACHE_VERSION:
+                return
+            netblocks = saved['netblocks']
+        except (OSError, ValueError, KeyError, AttributeError):
+            return
+        now = time.time()
+        for cidr, (result, learned) in netblocks.items():
+            if 0 <= now - learned < self.ttl:
+                self._add(cidr, result, learned)
+
+    def write(self):
+        """Save the index (mode ``0600``), if it changed."""
+        if self.path is None or not self.changed:
+            return
+        try:
+            atomic_write(
+                self.path,
+                json.dumps({
+                    'version': NETBLOCK_CACHE_VERSION,
+                    'netblocks': self._netblocks,
+                }),
+                fsync=False,
+            )
+            self.changed = False
+        except OSError as err:
+            logger.debug("[-] could not write '%s': %s", self.path, err)
+
+    def _add(self, cidr, result, learned):
+        network = ipaddress.ip_network(cidr, strict=False)
+        self._netblocks[str(network)] = [result, learned]
+        self._index.setdefault(
+            (network.version, network.prefixlen), dict()
+        )[int(network.network_address)] = str(network)
+
+    def add(self, result):
+        """
+        Index a WHOIS ``asn_cidr`` result (one or more CIDR blocks
+        separated by commas) under each of its networks.
+        """
+        learned = time.time()
+        for cidr in str(result).split(','):
+            try:
+                self._add(cidr.strip(), result, learned)
+            except ValueError:
+                continue
+            self.changed = True
+
+    def lookup(self, ip):
+        """
+        Return the learned result for the most specific network that
+        contains ``ip``, or ``None``.
+        """
+        address = ipaddress.ip_address(ip)
+        best = None
+        for (version, prefixlen), networks in self._index.items():
+            if version != address.version or (
+                best is not None and prefixlen <= best[0]
+            ):
+                continue
+            mask = (
+                (1 << address.max_prefixlen) - 1
+                ^ ((1 << (address.max_prefixlen - prefixlen)) - 1)
+            )
+            cidr = networks.get(int(address) & mask)
+            if cidr is not None:
+                best = (prefixlen, cidr)
+        return None if best is None else self._netblocks[best[1]][0]
+
+
+def get_netblocks(ips, cache_path=None, cache_ttl=NETBLOCK_CACHE_TTL,
+                  max_workers=NETBLOCK_WORKERS):
+    """
+    Derive the CIDR netblocks for many IP addresses.
+
+    Addresses within netblocks already learned (from earlier lookups in
+    this call, or saved in ``cache_path`` less than ``cache_ttl`` seconds
+    ago) are resolved without a WHOIS lookup. The remaining addresses
+    are looked up, at most ``max_workers`` at a time, and the netblocks
+    learned are saved in ``cache_path``.
+
+    Args:
+      ips (list): IP addresses (with or without a ``/`` prefix length)
+      cache_path (Path): File in which to save netblocks
+      cache_ttl (int): Seconds to reuse saved netblocks (0 disables)
+      max_workers (int): Maximum number of concurrent WHOIS lookups
+
+    Returns:
+      dict: The netblock(s) for each address (``None`` if the lookup
+      failed)
+    """
+    index = NetblockIndex(
+        path=cache_path if cache_ttl > 0 else None,
+        ttl=cache_ttl,
+    )
+    results = dict()
+    pending = list()
+    for ip in ips:
+        ip = str(ip).split('/')[0]
+        if ip in results:
+            continue
+        try:
+            ipaddress.ip_address(ip)
+        except ValueError:
+            raise RuntimeError(f"[-] invalid IP address '{ip}'")
+        results[ip] = None
+        pending.append(ip)
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        running = dict()
+        while pending or running:
+            waiting = list()
+            for ip in pending:
+                result = index.lookup(ip)
+                if result is not None:
+                    results[ip] = result
+                elif len(running) < max_workers:
+                    logger.debug("[+] WHOIS lookup for '%s'", ip)
+                    running[executor.submit(get_netblock, ip=ip)] = ip
+                else:
+                    waiting.append(ip)
+            pending = waiting
+            if not running:
+                continue
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                ip = running.pop(future)
+                try:
+                    results[ip] = future.result()
+                except Exception as err:  # pylint: disable=broad-except
+                    logger.warning(
+                        "[-] WHOIS lookup for '%s' failed: %s", ip, err)
+                    continue
+                index.add(results[ip])
+    index.write()
+    return results
+
+
+def myip_http(arg=None, timeout=MYIP_TIMEOUT):
+    """Use an HTTP service that only returns IP address."""
+    # Return type if no argument for use in Lister.
+    if arg is None:
+        return 'https'
+    page = requests.get(arg, timeout=timeout)
+    if page.status_code != 200:
+        soup = BeautifulSoup(page.text, 'html.parser')
+        raise RuntimeError(
+            f"[-] error: {page.reason}\n{soup.get_text().strip()}")
+    logger.debug('[-] got page: "%s"', page.text)
+    interface = ipaddress.ip_interface(page.text.strip())
+    return interface
+
+
+def _parse_dig_args(arg):
+    """
+    Return the server, port, address family, query type and name from
+    ``dig`` style arguments (e.g., ``dig +short @ns1.google.com TXT
+    o-o.myaddr.l.google.com``).
+    """
+    server = None
+    port = DNS_PORT
+    family = socket.AF_UNSPEC
+    qtype = 'A'
+    qname = None
+    args = iter(arg.split()[1:])
+    for item in args:
+        if item.startswith('@'):
+            server = item[1:]
+        elif item == '-p':
+            port = int(next(args))
+        elif item == '-4':
+            family = socket.AF_INET
+        elif item == '-6':
+            family = socket.AF_INET6
+        elif item.upper() in DNS_TYPES:
+            qtype = item.upper()
+        elif not item.startswith(('+', '-')):
+            qname = item
+    if server is None or qname is None:
+        raise RuntimeError(f"[-] can't parse DNS query '{arg}'")
+    return server, port, family, qtype, qname
+
+
+def _skip_dns_name(message, offset):
+    """Return the offset just past the (possibly compressed) name."""
+    while True:
+        length = message[offset]
+        if length == 0:
+            return offset + 1
+        if length & 0xC0 == 0xC0:
+            return offset + 2
+        offset += length + 1
+
+
+def dns_query(server, qname, qtype='A', port=DNS_PORT,
+              family=socket.AF_UNSPEC, timeout=MYIP_TIMEOUT):
+    """
+    Send a DNS query to ``server`` over UDP and return the data of the
+    ``A``, ``AAAA`` and ``TXT`` records in the answer, as strings.
+    """
+    query_id = secrets.randbelow(0x10000)
+    question = b''.join(
+        bytes([len(label)]) + label.encode('ascii')
+        for label in qname.rstrip('.').split('.')
+    ) + b'\0' + struct.pack('>HH', DNS_TYPES[qtype], 1)
+    query = struct.pack('>HHHHHH', query_id, 0x0100, 1, 0, 0, 0) + question
+    addrinfo = socket.getaddrinfo(
+        server, port, family=family, type=socket.SOCK_DGRAM)[0]
+    with socket.socket(addrinfo[0], socket.SOCK_DGRAM) as sock:
+        sock.settimeout(timeout)
+        sock.sendto(query, addrinfo[4])
+        while True:
+            message, _ = sock.recvfrom(4096)
+            if struct.unpack('>H', message[:2])[0] == query_id:
+                break
+    _, flags, qdcount, ancount, _, _ = struct.unpack(
+        '>HHHHHH', message[:12])
+    if flags & 0x000F:
+        raise RuntimeError(
+            f"[-] DNS query for '{qname}' failed (rcode {flags & 0x000F})")
+    offset = 12
+    for _ in range(qdcount):
+        offset = _skip_dns_name(message, offset) + 4
+    answers = []
+    for _ in range(ancount):
+        offset = _skip_dns_name(message, offset)
+        rtype, _, _, rdlength = struct.unpack(
+            '>HHIH', message[offset:offset + 10])
+        offset += 10
+        rdata = message[offset:offset + rdlength]
+        offset += rdlength
+        if rtype == DNS_TYPES['A'] and rdlength == 4:
+            answers.append(socket.inet_ntop(socket.AF_INET, rdata))
+        elif rtype == DNS_TYPES['AAAA'] and rdlength == 16:
+            answers.append(socket.inet_ntop(socket.AF_INET6, rdata))
+        elif rtype == DNS_TYPES['TXT'] and rdlength > 0:
+            answers.append(rdata[1:1 + rdata[0]].decode('ascii', 'replace'))
+    return answers
+
+
+def myip_resolver(arg=None, timeout=MYIP_TIMEOUT):
+    """Use DNS resolver to get IP address."""
+    # Return type if no argument for use in Lister.
+    if arg is None:
+        return 'dns'
+    server, port, family, qtype, qname = _parse_dig_args(arg)
+    for answer in dns_query(server, qname, qtype=qtype, port=port,
+                            family=family, timeout=timeout):
+        try:
+            return ipaddress.ip_interface(answer.replace('"', ''))
+        except ValueError:
+            continue
+    return None
+
+
+# Function map. (See epilog help text for MyIP.)
+myip_methods = {
+    'akamai': {
+        'arg': 'dig +short @ns1-1.akamaitech.net ANY whoami.akamai.net',
+        'func': myip_resolver
+    },
+    'amazon': {
+        'arg': 'https://checkip.amazonaws.com',
+        'func': myip_http,
+    },
+    'google': {
+        'arg': 'dig +short @ns1.google.com TXT o-o.myaddr.l.google.com',
+        'func': myip_resolver,
+    },
+    'opendns_h': {
+        'arg': 'https://diagnostic.opendns.com/myip',
+        'func': myip_http,
+    },
+    'opendns_r': {
+        'arg': 'dig +short @resolver1.opendns.com myip.opendns.com -4',
+        'func': myip_resolver,
+    },
+    'icanhazip': {
+        'arg': 'https://icanhazip.com/',
+        'func': myip_http,
+    },
+    'infoip': {
+        'arg': 'https://api.infoip.io/ip',
+        'func': myip_http,
+    },
+    'tnx': {
+        'arg': 'https://tnx.nl/ip',
+        'func': myip_http,
+    }
+}
+
+
+def get_myip_methods(include_random=False):
+    """Return list of available method ids for getting IP address."""
+    methods = list(myip_methods.keys())
+    # For argparse choices, set True
+    if include_random:
+        methods.extend(['random', 'race'])
+    return methods
+
+
+def race_myip(methods=None, count=MYIP_RACE_COUNT, timeout=MYIP_TIMEOUT):
+    """
+    Try ``count`` randomly chosen methods at the same time and return the
+    method and IP address of the first to succeed.
+
+    Args:
+      methods (dict): Methods to choose from (default: ``myip_methods``)
+      count (int): Number of methods to try at once
+      timeout (float): Seconds to wait for each method
+
+    Returns:
+      tuple: The method name and IP address
+    """
+    if methods is None:
+        methods = myip_methods
+    chosen = random.sample(  # nosec
+        sorted(methods), min(count, len(methods)))
+    results = queue.Queue()
+
+    def attempt(method):
+        try:
+            ip = methods[method]['func'](
+                arg=methods[method]['arg'],
+                timeout=timeout,
+            )
+        except Exception as err:  # pylint: disable=broad-except
+            logger.debug("[-] method '%s' failed: %s", method, err)
+            ip = None
+        results.put((method, None if ip is None else str(ip)))
+
+    # Daemon threads, so that slower methods are abandoned (rather than
+    # waited for) once one of them succeeds.
+    for method in chosen:
+        logger.debug("[+] determining IP address using '%s'", method)
+        threading.Thread(target=attempt, args=(method,), daemon=True).start()
+    deadline = time.monotonic() + timeout + 1
+    for _ in chosen:
+        try:
+            method, ip = results.get(
+                timeout=max(0, deadline - time.monotonic()))
+        except queue.Empty:
+            break
+        if ip:
+            return method, ip
+    raise RuntimeError(
+        f"[-] methods {', '.join(chosen)} failed to get an IP address")
+
+
+def read_myip_cache(cache_path, ttl=MYIP_CACHE_TTL):
+    """
+    Return the IP address saved in ``cache_path`` if it is younger than
+    ``ttl`` seconds, else ``None``.
+    """
+    try:
+        with open(cache_path, 'r') as f:
+            cache = json.load(f)
+        if 0 <= time.time() - cache['time'] < ttl:
+            return cache['ip']
+    except (OSError, ValueError, KeyError, TypeError):
+        pass
+    return None
+
+
+def write_myip_cache(cache_path, ip, method):
+    """Save an IP address (mode ``0600``) in ``cache_path``."""
+    try:
+        atomic_write(
+            cache_path,
+            json.dumps({'ip': ip, 'method': method, 'time': time.time()}),
+            fsync=False,
+        )
+    except OSError as err:
+        logger.debug("[-] could not write '%s': %s", cache_path, err)
+
+
+def get_myip(method='random', cache_path=None, cache_ttl=MYIP_CACHE_TTL,
+             count=MYIP_RACE_COUNT):
+    """
+    Return current routable source IP address.
+
+    With method ``race``, ``count`` randomly chosen methods are tried at
+    the same time and the first address found is used. An address saved
+    (by the ``race`` method) in ``cache_path`` less than ``cache_ttl``
+    seconds ago is used, if there is one, and new addresses are saved
+    there. Other methods always look up the current address.
+    """
+    methods = get_myip_methods()
+    use_cache = (
+        cache_path is not None
+        and cache_ttl > 0
+        and method == 'race'
+    )
+    if use_cache:
+        ip = read_myip_cache(cache_path, ttl=cache_ttl)
+        if ip is not None:
+            logger.debug("[+] using cached IP address from '%s'", cache_path)
+            return ip
+    if method == 'race':
+        method, ip = race_myip(count=count)
+    else:
+        if method == 'random':
+            method = random.choice(methods)  # nosec
+        elif method not in methods:
+            raise RuntimeError(
+                f"[-] method '{method}' for obtaining IP address is "
+                "not implemented")
+        func = myip_methods[method].get('func')
+        logger.debug("[+] determining IP address using '%s'", method)
+        arg = myip_methods[method].get('arg')
+        ip = func(arg=arg)
+        if ip is None or len(str(ip)) == 0:
+            raise RuntimeError(
+                f"[-] method '{method}' failed to get an IP address")
+        ip = str(ip)
+    if use_cache:
+        write_myip_cache(cache_path, ip, method)
+    return ip
+
+
+# vim: set fileencoding=utf-8 ts=4 sw=4 tw=0 et :
@@ -0,0 +1,139 @@
+# -*- coding: utf-8 -*-
+
+"""
+Interactive prompting utility functions.
+"""
+
+# Standard imports
+import logging
+
+# External imports
+# Workaround until bullet has Windows missing 'termios' fix.
+# TODO(dittrich): https://github.com/Mckinsey666/bullet/issues/2
+try:
+    from bullet import (
+        Bullet,
+        YesNo,  # noqa: F401
+    )
+except ModuleNotFoundError:
+    pass
+
+# Local imports
+from psec.utils import find
+
+
+logger = logging.getLogger(__name__)
+
+
+def prompt_options_list(options=None,
+                        default=None,
+                        prompt="Select from the following options"):
+    """Prompt the user for a string using a list of options.
+
+    The options will be one of the following:
+
+    '*' - Any user input
+    'A,*' - 'A', or any user input.
+    'A,B' - Only choices are 'A' or 'B'.
+
+    """
+    if 'Bullet' not in globals():
+        raise RuntimeError("[-] can't use Bullet on Windows")
+    if (
+        len(options) == 0
+        or not isinstance(options[0], str)
+    ):
+        raise RuntimeError('[-] a list of options is required')
+    cancel = '<CANCEL>'
+    if default is None:
+        default = cancel
+    else:
+        # Remove the default from the list because it will
+        # be added back as the first item.
+        options = [i for i in options if i != default]
+    choices = [default] + options
+    cli = Bullet(prompt=f'\n{prompt}',
+                 choices=choices,
+                 indent=0,
+                 align=2,
+                 margin=1,
+                 shift=0,
+                 bullet="→",
+                 pad_right=5)
+    choice = cli.launch()
+    if default == cancel and choice == cancel:
+        logger.info('[-] cancelled selection of choice')
+        return None
+    return choice
+
+
+def prompt_options_dict(options=None,
+                        by_descr=True,
+                        prompt="Select from the following options"):
+    """
+    Prompt the user for a string using option dictionaries.
+
+    These dictionaries map a descriptive name to an identifier::
+
+        {'descr': 'DigitalOcean', 'ident': 'digitalocean'}
+
+
+    """
+    if 'Bullet' not in globals():
+        raise RuntimeError("[-] can't use Bullet on Windows")
+    if options is None:
+        raise RuntimeError('[-] no options specified')
+    if not isinstance(options[0], dict):
+        raise RuntimeError('[-] options is not a list of dictionaries')
+    choices = ['<CANCEL>'] + [
+                                opt['descr']
+                                if by_descr
+                                else opt['ident']
+                                for opt in options
+                             ]
+    cli = Bullet(prompt=f'\n{prompt}',
+                 choices=choices,
+                 indent=0,
+                 align=2,
+                 margin=1,
+                 shift=0,
+                 bullet="→",
+                 pad_right=5)
+    choice = cli.launch()
+    if choice == "<CANCEL>":
+        logger.info('[-] cancelled selection of choice')
+        return None
+    selected = find(options,
+                    'descr' if by_descr else 'ident',
+                    choice)
+    try:
+        return options[selected]['ident']
+    except Exception as exc:  # noqa
+        return None
+
+
+# >> Issue: [B322:blacklist] The input method in Python 2 will read from
+# standard input, evaluate and run the resulting string as python source code.
+# This is similar, though in many ways worse, then using eval. On Python 2, use
+# raw_input instead, input is safe in Python 3.
+#    Severity: High   Confidence: High Location: psec/utils/__init__.py:200
+#    More Info:
+#    https://bandit.readthedocs.io/en/latest/blacklists/blacklist_calls.html#b322-input  # noqa
+
+def prompt_string(prompt="Enter a value",
+                  default=None):
+    """Prompt the user for a string and return it"""
+    _new = None
+    while True:
+        try:
+            _new = str(input(f"{prompt}? [{str(default)}]: "))  # nosec
+            break
+        except ValueError:
+            print("Sorry, I didn't understand that.")
+            continue
+        except KeyboardInterrupt:
+            break
+    return default if _new in [None, ''] else _new
+
+
+# vim: set fileencoding=utf-8 ts=4 sw=4 tw=0 et :
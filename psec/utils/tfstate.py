@@ -0,0 +1,231 @@
+# -*- coding: utf-8 -*-
+
+"""
+Terraform state file output reader.
+
+Reads the outputs from a local ``terraform.tfstate`` file without running
+``terraform output``. The state file is memory-mapped and scanned by an
+incremental tokenizer that only decodes the ``outputs`` object (at the
+top level in version 4 state files, or in the root module in version 3
+state files). Scanning stops as soon as the outputs are found, so large
+``resources`` sections that follow are never read or decoded.
+
+Running ``terraform output -json`` remains available as a fallback.
+"""
+
+# Standard imports
+import json
+import logging
+import mmap
+import os
+import re
+import shutil
+import subprocess  # nosec
+
+
+logger = logging.getLogger(__name__)
+
+TFSTATE_FILE = 'terraform.tfstate'
+TFSTATE_VERSIONS = [3, 4]
+TERRAFORM = 'terraform'
+
+# JSON strings (keys are followed by a colon) and structural characters.
+# Everything else (numbers, literals, commas, whitespace) is skipped.
+_TOKEN = re.compile(rb'"(?:[^"\\]|\\.)*"(\s*:)?|[{}\[\]]', re.S)
+_SCALAR = re.compile(
+    rb'\s*("(?:[^"\\]|\\.)*"|-?[0-9][0-9.eE+-]*|true|false|null)',
+    re.S,
+)
+_SPACE = re.compile(rb'\s*')
+
+
+def _skip_container(buf, pos):
+    """
+    Return the offset following the JSON object or array starting at
+    offset ``pos``.
+    """
+    depth = 0
+    while True:
+        match = _TOKEN.search(buf, pos)
+        if match is None:
+            raise RuntimeError('[-] state file is truncated')
+        pos = match.end()
+        token = buf[match.start():match.start() + 1]
+        if token in (b'{', b'['):
+            depth += 1
+        elif token in (b'}', b']'):
+            depth -= 1
+            if depth == 0:
+                return pos
+
+
+def _read_value(buf, pos):
+    """
+    Decode the JSON value starting at (or after whitespace at) offset
+    ``pos``, returning the value and the offset following it.
+    """
+    pos = _SPACE.match(buf, pos).end()
+    if buf[pos:pos + 1] in (b'{', b'['):
+        end = _skip_container(buf, pos)
+        return json.loads(buf[pos:end]), end
+    match = _SCALAR.match(buf, pos)
+    if match is None:
+        raise RuntimeError(f'[-] invalid JSON at offset {pos}')
+    return json.loads(match.group(1)), match.end()
+
+
+def scan_tfstate(buf):
+    """
+    Return the format version and the root module outputs from the
+    contents of a state file (``bytes`` or ``mmap``).
+
+    Only the values of the top-level ``version`` and ``outputs`` keys
+    (or the ``path`` and ``outputs`` keys of the modules in version 3
+    state files) are decoded.
+    """
+    version = None
+    outputs = None
+    # One [opening character, current key] entry per open container.
+    stack = []
+    module = {}
+    pos = 0
+    while True:
+        if version is not None and outputs is not None:
+            break
+        match = _TOKEN.search(buf, pos)
+        if match is None:
+            if stack:
+                raise RuntimeError('[-] state file is truncated')
+            break
+        pos = match.end()
+        token = buf[match.start():match.start() + 1]
+        if token == b'"':
+            if match.group(1) is None:
+                # A string value.
+                continue
+            key = json.loads(buf[match.start():match.start(1)])
+            if not stack:
+                raise RuntimeError('[-] state file is not a JSON object')
+            stack[-1][1] = key
+            depth = len(stack)
+            if depth == 1 and key in ['version', 'outputs']:
+                value, pos = _read_value(buf, pos)
+                if key == 'version':
+                    version = value
+                else:
+                    outputs = value
+            elif (
+                depth == 3
+                and stack[0][1] == 'modules'
+                and stack[1][0] == b'['
+                and key in ['path', 'outputs']
+            ):
+                module[key], pos = _read_value(buf, pos)
+                if module.get('path') == ['root'] and 'outputs' in module:
+                    outputs = module['outputs']
+        elif token in (b'{', b'['):
+            stack.append([token, None])
+        else:
+            stack.pop()
+            if len(stack) == 2 and stack[0][1] == 'modules':
+                # The end of a (version 3) module.
+                if module.get('path') == ['root']:
+                    outputs = {}
+                module = {}
+            elif not stack:
+                break
+    if version is None:
+        raise RuntimeError('[-] state file has no format version')
+    return version, {} if outputs is None else outputs
+
+
+def read_tfstate_outputs(tfstate):
+    """
+    Return the outputs in Terraform state file ``tfstate`` as a
+    dictionary shaped like the output of ``terraform output -json``.
+    """
+    with open(tfstate, 'rb') as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            raise RuntimeError(f"[-] state file '{tfstate}' is empty")
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as buf:
+            try:
+                version, outputs = scan_tfstate(buf)
+            except ValueError as err:
+                raise RuntimeError(
+                    f"[-] can't parse state file '{tfstate}': {err}")
+    if version not in TFSTATE_VERSIONS:
+        raise RuntimeError(
+            f"[-] state file '{tfstate}' has unsupported format "
+            f"version {version}"
+        )
+    return {
+        name: {
+            'sensitive': output.get('sensitive', False),
+            'type': output.get('type'),
+            'value': output.get('value'),
+        }
+        for name, output in outputs.items()
+    }
+
+
+def terraform_outputs(tfstate, terraform=TERRAFORM):
+    """
+    Return the outputs in Terraform state file ``tfstate`` by running
+    ``terraform output -json``.
+    """
+    program = shutil.which(terraform)
+    if program is None:
+        raise RuntimeError(f"[-] '{terraform}' not found")
+    cmd = [program, 'output', f'-state={tfstate}', '-json']
+    logger.debug('[+] running: %s', ' '.join(cmd))
+    p = subprocess.run(  # nosec
+        cmd,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+        shell=False,
+        check=False,
+    )
+    if p.returncode != 0:
+        raise RuntimeError(
+            f"[-] '{' '.join(cmd)}' failed: "
+            f"{p.stderr.decode('utf-8', errors='replace').strip()}"
+        )
+    return json.loads(p.stdout.decode('utf-8'))
+
+
+def get_tfstate_outputs(tfstate, use_terraform=False):
+    """
+    Return the outputs in Terraform state file ``tfstate``, reading the
+    file directly unless ``use_terraform`` is True. If the file can't be
+    read directly (e.g., it has an unsupported format version), fall back
+    to running ``terraform output`` if ``terraform`` is installed.
+    """
+    if use_terraform:
+        return terraform_outputs(tfstate)
+    try:
+        return read_tfstate_outputs(tfstate)
+    except RuntimeError as err:
+        if shutil.which(TERRAFORM) is None:
+            raise
+        logger.info('%s: trying terraform', err)
+    return terraform_outputs(tfstate)
+
+
+def get_output_variables(outputs):
+    """
+    Return ``[variable, value]`` pairs for Terraform outputs, naming
+    the items of map outputs ``<output>_<key>``.
+    """
+    variables = []
+    for name, output in outputs.items():
+        value = output['value']
+        if isinstance(value, dict):
+            variables.extend(
+                [f'{name}_{k}', v] for k, v in value.items()
+            )
+        else:
+            variables.append([name, value])
+    return variables
+
+
+# vim: set fileencoding=utf-8 ts=4 sw=4 tw=0 et :
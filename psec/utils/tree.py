@@ -0,0 +1,94 @@
+# -*- coding: utf-8 -*-
+
+"""
+Tree rendering utility functions.
+"""
+
+# Standard imports
+import os
+
+# External imports
+from anytree import (
+    Node,
+    RenderTree,
+)
+
+
+def atree(dir,
+          print_files=True,
+          outfile=None):
+    """
+    Produces the tree structure for the path specified on the command
+    line. If output is specified (e.g., as sys.stdout) it will be used,
+    otherwise a list of strings is returned.
+
+    Uses anytree: https://anytree.readthedocs.io/en/latest/
+
+    :param dir:
+    :param print_files:
+    :param outfile:
+    :return: str
+    """
+
+    nodes = dict()
+    nodes[dir] = Node(dir)
+    root_node = nodes[dir]
+    for root, dirs, files in os.walk(dir, topdown=True):
+        if root not in nodes:
+            nodes[root] = Node(root)
+        for name in files:
+            if print_files:
+                nodes[os.path.join(root, name)] = \
+                    Node(name, parent=nodes[root])
+        for name in dirs:
+            nodes[os.path.join(root, name)] = Node(name, parent=nodes[root])
+
+    output = []
+    for pre, fill, node in RenderTree(root_node):
+        output.append((f'{ pre }{ node.name }'))
+    if outfile is not None:
+        for line in output:
+            print(line, file=outfile)
+    else:
+        return output
+
+
+def secrets_tree(
+    env=None,
+    outfile=None
+):
+    """
+    Produces the tree structure for groups and secrets in an environment.
+
+    If output is specified (e.g., as sys.stdout) it will be used,
+    otherwise a list of strings is returned.
+
+    Uses anytree: https://anytree.readthedocs.io/en/latest/
+
+    :param environment_dir:
+    :param outfile:
+    :return: str
+    """
+
+    nodes = dict()
+    env_name = str(env)
+    nodes[env_name] = Node(env_name)
+    root_node = nodes[env_name]
+    for group in sorted(env.get_groups()):
+        group_name = os.path.join(env_name, group)
+        nodes[group_name] = Node(group, parent=root_node)
+        for variable in sorted(env.get_items_from_group(group)):
+            nodes[os.path.join(group_name, variable)] = \
+                Node(variable, parent=nodes[group_name])
+
+    output = []
+    for pre, fill, node in RenderTree(root_node):
+        output.append((f'{ pre }{ node.name }'))
+    if outfile is not None:
+        for line in output:
+            print(line, file=outfile)
+    else:
+        return output
+
+
+# vim: set fileencoding=utf-8 ts=4 sw=4 tw=0 et :
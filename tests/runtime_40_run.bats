@@ -25,12 +25,12 @@ teardown() {
 }
 
 @test "'psec --umask 0o007 succeeds'" {
-    run $PSEC -e testenv --umask 0o007 run umask 1>&2
+    run $PSEC -e testenv --umask 0o007 run --shell umask 1>&2
     assert_output "0007"
 }
 
 @test "'psec --umask 0o777 succeeds'" {
-    run $PSEC -e testenv --umask 0o777 run umask 1>&2
+    run $PSEC -e testenv --umask 0o777 run --shell umask 1>&2
     assert_output "0777"
 }
 
@@ -41,6 +41,26 @@ teardown() {
     assert_output --partial PYTHON_SECRETS_ENVIRONMENT
 }
 
+@test "'psec -E run -- env' exports secrets by name and export name" {
+    run $PSEC secrets set myapp_pi_password="it's a secret" 1>&2
+    run $PSEC -E run -- env
+    assert_success
+    assert_output --partial "myapp_pi_password=it's a secret"
+    assert_output --partial "DEMO_pi_password=it's a secret"
+}
+
+@test "'psec run umask' fails without '--shell'" {
+    run $PSEC run umask 2>&1
+    assert_failure
+    assert_output --partial "can't run 'umask'"
+}
+
+@test "'psec -E run --shell' runs command line in a sub-shell" {
+    run $PSEC -E run --shell -- 'echo $PYTHON_SECRETS_ENVIRONMENT | tr a-z A-Z'
+    assert_success
+    assert_output --partial BATSTEST
+}
+
 @test "'psec -E run sleep 1' succeeds" {
     run $PSEC -E run sleep 1 2>&1
     assert_success
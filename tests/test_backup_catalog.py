@@ -0,0 +1,181 @@
+#!/usr/bin/env python
+
+"""
+test_backup_catalog
+-------------------
+
+Tests for `psec.backup_catalog` module.
+"""
+
+import datetime
+import io
+import json
+import os
+import shutil
+import stat
+import sys
+import tarfile
+import tempfile
+import unittest
+
+from pathlib import Path
+from unittest.mock import (
+    MagicMock,
+    patch,
+)
+
+from psec.backup_catalog import (
+    BackupCatalog,
+    CATALOG_FILE,
+)
+from psec.backup_store import BackupStore
+from psec.cli.secrets.restore import SecretsRestore
+
+
+SECRETS_D = Path(__file__).parent / 'secrets.d'
+PATHS = ['secrets.json', 'secrets.d']
+
+
+class Test_BackupCatalog(unittest.TestCase):
+
+    def setUp(self):
+        self.env_path = Path(tempfile.mkdtemp())
+        shutil.copytree(SECRETS_D, self.env_path / 'secrets.d')
+        self.secrets_file = self.env_path / 'secrets.json'
+        self.write_secrets({'consul_key': 'one', 'myapp_pi_password': 'x'})
+        self.store = BackupStore(self.env_path)
+        self.old = self.snapshot(days=2)
+        self.write_secrets({'myapp_pi_password': 'y'})
+        self.new = self.snapshot(days=1)
+
+    def tearDown(self):
+        shutil.rmtree(self.env_path)
+
+    def write_secrets(self, secrets):
+        self.secrets_file.write_text(json.dumps(secrets))
+
+    def snapshot(self, days):
+        created = (
+            datetime.datetime.now(datetime.timezone.utc)
+            - datetime.timedelta(days=days)
+        )
+        snapshot, _ = self.store.create_snapshot(
+            environment='pytest',
+            paths=PATHS,
+            created=created,
+        )
+        return snapshot['id']
+
+    def catalog(self):
+        return BackupCatalog(self.store, paths=PATHS).refresh()
+
+    def test_entries(self):
+        catalog = self.catalog()
+        self.assertEqual(
+            [entry['name'] for entry in catalog.entries()],
+            [self.new, self.old],
+        )
+        entry = catalog.get(self.old)
+        self.assertEqual(entry['variables'],
+                         ['consul_key', 'myapp_pi_password'])
+        self.assertIn('secrets.d/myapp.json', entry['files'])
+        path = self.env_path / 'backups' / CATALOG_FILE
+        self.assertEqual(stat.S_IMODE(path.stat().st_mode), 0o600)
+        self.assertRaises(RuntimeError, catalog.get, 'nosuch')
+
+    def test_find_variable(self):
+        catalog = self.catalog()
+        self.assertEqual(
+            [entry['name'] for entry in catalog.find_variable('consul_*')],
+            [self.old],
+        )
+        self.assertEqual(catalog.find_variable('nosuch'), [])
+
+    def test_refresh_reads_new_backups_only(self):
+        self.catalog()
+        with patch.object(
+            BackupCatalog,
+            'catalog_snapshot',
+            wraps=BackupCatalog(self.store, paths=PATHS).catalog_snapshot,
+        ) as catalog_snapshot:
+            self.catalog()
+            catalog_snapshot.assert_not_called()
+            newest = self.snapshot(days=0)
+            self.catalog()
+            self.assertEqual(
+                [c.args[0] for c in catalog_snapshot.call_args_list],
+                [newest],
+            )
+        self.store.prune(keep_last=1)
+        self.assertEqual(
+            [entry['name'] for entry in self.catalog().entries()],
+            [newest],
+        )
+
+    def test_restore_list_output(self):
+        app = MagicMock()
+        app.stdout = io.StringIO()
+        se = app.secrets
+        se.get_environment_path.return_value = self.env_path
+        se.get_secrets_file_path.return_value = self.secrets_file
+        se.get_descriptions_path.return_value = self.env_path / 'secrets.d'
+        command = SecretsRestore(app, None)
+        parsed_args = command.get_parser('restore').parse_args(
+            ['--variable', 'consul_*'])
+        with patch('sys.stdout', new_callable=io.StringIO) as stdout:
+            command.take_action(parsed_args)
+        self.assertEqual(stdout.getvalue(), '')
+        lines = app.stdout.getvalue().splitlines()
+        self.assertEqual(len(lines), 1)
+        self.assertTrue(lines[0].startswith(f'{self.old}  '))
+        self.assertTrue(lines[0].endswith('  2 variables'))
+
+    def test_diff(self):
+        (self.env_path / 'secrets.d' / 'extra.json').write_text('[]')
+        catalog = self.catalog()
+        self.assertEqual(
+            catalog.diff(self.old),
+            [
+                ['M', 'secrets.json'],
+                ['-', 'secrets.d/extra.json'],
+                ['+', 'variable consul_key'],
+            ],
+        )
+        (self.env_path / 'secrets.d' / 'extra.json').unlink()
+        self.assertEqual(catalog.diff(self.new), [])
+
+    def test_restore_tarball(self):
+        tarball = self.env_path / 'backups' / 'pytest_old.tgz'
+        with tarfile.open(tarball, 'w:gz') as tf:
+            for path in PATHS:
+                tf.add(self.env_path / path, arcname=path)
+        self.write_secrets({'consul_key': 'two'})
+        catalog = self.catalog()
+        self.assertEqual(
+            catalog.find_variable('myapp_*')[0]['name'],
+            'pytest_old.tgz',
+        )
+        self.assertEqual(
+            catalog.diff('pytest_old.tgz'),
+            [
+                ['M', 'secrets.json'],
+                ['+', 'variable myapp_pi_password'],
+                ['-', 'variable consul_key'],
+            ],
+        )
+        before = os.stat(self.env_path / 'secrets.d' / 'myapp.json')
+        self.assertEqual(catalog.restore_tarball('pytest_old.tgz'),
+                         ['secrets.json'])
+        self.assertEqual(
+            json.loads(self.secrets_file.read_text()),
+            {'myapp_pi_password': 'y'},
+        )
+        after = os.stat(self.env_path / 'secrets.d' / 'myapp.json')
+        self.assertEqual(before.st_ino, after.st_ino)
+        self.assertEqual(catalog.restore_tarball('pytest_old.tgz'), [])
+
+
+if __name__ == '__main__':
+    sys.exit(unittest.main())
+
+# vim: set fileencoding=utf-8 ts=4 sw=4 tw=0 et :
@@ -0,0 +1,180 @@
+#!/usr/bin/env python
+
+"""
+test_backup_store
+-----------------
+
+Tests for `psec.backup_store` module.
+"""
+
+import datetime
+import os
+import shutil
+import stat
+import sys
+import tempfile
+import unittest
+
+from pathlib import Path
+
+from psec.backup_store import (
+    BackupStore,
+    CHUNK_SIZE,
+)
+
+
+SECRETS_D = Path(__file__).parent / 'secrets.d'
+PATHS = ['secrets.json', 'secrets.d']
+
+
+def days_ago(days, hour=12):
+    """Return an aware UTC datetime ``days`` days ago at ``hour``."""
+    today = datetime.datetime.now(datetime.timezone.utc).replace(
+        hour=hour, minute=0, second=0, microsecond=0)
+    return today - datetime.timedelta(days=days)
+
+
+class Test_BackupStore(unittest.TestCase):
+
+    def setUp(self):
+        self.env_path = Path(tempfile.mkdtemp())
+        shutil.copytree(SECRETS_D, self.env_path / 'secrets.d')
+        (self.env_path / 'secrets.d' / '.cache').write_text('{}')
+        self.secrets_file = self.env_path / 'secrets.json'
+        self.secrets_file.write_text('{"myapp_pi_password": "one"}')
+        os.chmod(self.secrets_file, 0o600)
+        self.store = BackupStore(self.env_path, exclude=['.cache'])
+
+    def tearDown(self):
+        shutil.rmtree(self.env_path)
+
+    def snapshot(self, created=None):
+        snapshot, added = self.store.create_snapshot(
+            environment='pytest',
+            paths=PATHS,
+            created=created,
+        )
+        return snapshot['id'], added
+
+    def count_objects(self):
+        return sum(
+            len(files)
+            for _, _, files in os.walk(self.store.objects_path)
+        )
+
+    def test_deduplicates(self):
+        _, added = self.snapshot()
+        # All description files (but not the cache) and secrets.json.
+        files = len(os.listdir(SECRETS_D)) + 1
+        self.assertEqual(added, files)
+        _, added = self.snapshot()
+        self.assertEqual(added, 0)
+        self.secrets_file.write_text('{"myapp_pi_password": "two"}')
+        _, added = self.snapshot()
+        self.assertEqual(added, 1)
+        self.assertEqual(self.count_objects(), files + 1)
+        self.assertEqual(len(self.store.list_snapshots()), 3)
+
+    def test_excluded(self):
+        snapshot_id, _ = self.snapshot()
+        paths = [
+            f['path']
+            for f in self.store.read_snapshot(snapshot_id)['files']
+        ]
+        self.assertIn('secrets.json', paths)
+        self.assertIn('secrets.d/myapp.json', paths)
+        self.assertNotIn('secrets.d/.cache', paths)
+
+    def test_large_file_chunks(self):
+        data = os.urandom(CHUNK_SIZE * 2 + 1)
+        (self.env_path / 'secrets.d' / 'large.bin').write_bytes(data)
+        snapshot_id, _ = self.snapshot()
+        entry = [
+            f for f in self.store.read_snapshot(snapshot_id)['files']
+            if f['path'] == 'secrets.d/large.bin'
+        ][0]
+        self.assertEqual(len(entry['chunks']), 3)
+        (self.env_path / 'secrets.d' / 'large.bin').unlink()
+        self.store.restore_snapshot(snapshot_id)
+        self.assertEqual(
+            (self.env_path / 'secrets.d' / 'large.bin').read_bytes(),
+            data,
+        )
+
+    def test_restore(self):
+        snapshot_id, _ = self.snapshot()
+        self.secrets_file.write_text('{"myapp_pi_password": "two"}')
+        (self.env_path / 'secrets.d' / 'myapp.json').unlink()
+        (self.env_path / 'secrets.d' / 'extra.json').write_text('[]')
+        self.store.restore_snapshot(snapshot_id)
+        self.assertEqual(
+            self.secrets_file.read_text(),
+            '{"myapp_pi_password": "one"}',
+        )
+        self.assertEqual(stat.S_IMODE(self.secrets_file.stat().st_mode),
+                         0o600)
+        self.assertTrue((self.env_path / 'secrets.d' / 'myapp.json').exists())
+        self.assertFalse(
+            (self.env_path / 'secrets.d' / 'extra.json').exists()
+        )
+        self.assertTrue((self.env_path / 'secrets.d' / '.cache').exists())
+
+    def test_restore_corrupt(self):
+        snapshot_id, _ = self.snapshot()
+        entry = self.store.read_snapshot(snapshot_id)['files'][0]
+        self.store.get_object_path(entry['chunks'][0]).write_bytes(b'bad')
+        self.secrets_file.write_text('{"myapp_pi_password": "two"}')
+        self.assertRaises(
+            RuntimeError,
+            self.store.restore_snapshot,
+            snapshot_id,
+        )
+        # Nothing was restored.
+        self.assertEqual(
+            self.secrets_file.read_text(),
+            '{"myapp_pi_password": "two"}',
+        )
+
+    def test_restore_unknown(self):
+        self.assertRaises(RuntimeError, self.store.restore_snapshot, 'nosuch')
+        self.assertRaises(RuntimeError, self.store.restore_snapshot, '../x')
+
+    def test_keep_last(self):
+        for value in range(5):
+            self.secrets_file.write_text(f'{{"value": {value}}}')
+            self.snapshot(created=days_ago(5 - value))
+        snapshots = self.store.list_snapshots()
+        removed, objects_removed = self.store.prune(keep_last=2)
+        self.assertEqual(removed, snapshots[:3])
+        self.assertEqual(self.store.list_snapshots(), snapshots[3:])
+        self.assertEqual(objects_removed, 3)
+        self.store.restore_snapshot(snapshots[3])
+        self.assertEqual(self.secrets_file.read_text(), '{"value": 3}')
+
+    def test_keep_daily(self):
+        created = [
+            days_ago(3, hour=1),
+            days_ago(3, hour=2),
+            days_ago(1, hour=1),
+            days_ago(1, hour=2),
+            days_ago(0, hour=1),
+        ]
+        ids = [self.snapshot(created=c)[0] for c in created]
+        removed, _ = self.store.prune(keep_daily=2)
+        self.assertEqual(self.store.list_snapshots(), [ids[3], ids[4]])
+        self.assertEqual(removed, ids[:3])
+
+    def test_keep_last_and_daily(self):
+        created = [days_ago(2), days_ago(1, hour=1), days_ago(1, hour=2)]
+        ids = [self.snapshot(created=c)[0] for c in created]
+        self.store.prune(keep_last=1, keep_daily=2)
+        self.assertEqual(self.store.list_snapshots(), [ids[0], ids[2]])
+
+    def test_prune_requires_policy(self):
+        self.assertRaises(RuntimeError, self.store.prune)
+
+
+if __name__ == '__main__':
+    sys.exit(unittest.main())
+
+# vim: set fileencoding=utf-8 ts=4 sw=4 tw=0 et :
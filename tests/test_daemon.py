@@ -0,0 +1,127 @@
+#!/usr/bin/env python
+
+"""
+test_daemon
+-----------
+
+Tests for `psec.daemon` module.
+"""
+
+import json
+import os
+import shutil
+import stat
+import sys
+import tempfile
+import threading
+import time
+import unittest
+
+from pathlib import Path
+
+from psec.daemon import (
+    PsecdServer,
+    psecd_request,
+)
+from psec.exceptions import PsecdUnavailableError
+from psec.utils import (
+    secrets_basedir_create,
+    SECRETS_DESCRIPTIONS_DIR,
+    SECRETS_FILE,
+)
+
+
+TESTENV = 'pytest'
+DESCRIPTIONS = Path(__file__).parent / 'secrets.d' / 'myapp.json'
+
+
+@unittest.skipIf(sys.platform.startswith("win"), "not for Windows")
+class Test_Psecd(unittest.TestCase):
+
+    def setUp(self):
+        self.basedir = Path(tempfile.mkdtemp())
+        secrets_basedir_create(basedir=self.basedir)
+        self.env_path = self.basedir / TESTENV
+        (self.env_path / SECRETS_DESCRIPTIONS_DIR).mkdir(parents=True)
+        shutil.copy(DESCRIPTIONS, self.env_path / SECRETS_DESCRIPTIONS_DIR)
+        self.write_secrets({'myapp_pi_password': 'first'})
+        self.socket_path = self.basedir / 'psecd.sock'
+        self.server = PsecdServer(self.socket_path, self.basedir)
+        self.thread = threading.Thread(
+            target=self.server.serve_forever,
+            kwargs={'poll_interval': 0.05},
+        )
+        self.thread.start()
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        self.thread.join()
+        shutil.rmtree(self.basedir)
+
+    def write_secrets(self, secrets):
+        secrets_file = self.env_path / SECRETS_FILE
+        secrets_file.write_text(json.dumps(secrets))
+        # Ensure the modification time changes on coarse clocks.
+        mtime = time.time_ns() + 1000000000
+        os.utime(secrets_file, ns=(mtime, mtime))
+
+    def request(self, op, **kwargs):
+        return psecd_request(
+            op,
+            socket_path=self.socket_path,
+            environment=TESTENV,
+            **kwargs,
+        )
+
+    def test_socket_mode(self):
+        mode = stat.S_IMODE(os.stat(self.socket_path).st_mode)
+        self.assertEqual(mode, 0o600)
+
+    def test_ping(self):
+        self.assertEqual(self.request('ping'), 'pong')
+
+    def test_get(self):
+        self.assertEqual(
+            self.request('get', variables=['myapp_pi_password']),
+            {'myapp_pi_password': 'first'},
+        )
+
+    def test_get_reloads_changed_secrets(self):
+        self.request('get', variables=['myapp_pi_password'])
+        self.write_secrets({'myapp_pi_password': 'second'})
+        self.assertEqual(
+            self.request('get', variables=['myapp_pi_password']),
+            {'myapp_pi_password': 'second'},
+        )
+
+    def test_export(self):
+        self.assertEqual(
+            self.request('export', variables=['myapp_pi_password']),
+            {'myapp_pi_password': 'first', 'DEMO_pi_password': 'first'},
+        )
+
+    def test_show_missing_variable(self):
+        with self.assertRaises(RuntimeError):
+            self.request('show', variables=['no_such_variable'])
+
+    def test_invalid_environment(self):
+        with self.assertRaises(RuntimeError):
+            psecd_request(
+                'get',
+                socket_path=self.socket_path,
+                environment='..',
+            )
+
+    def test_unavailable(self):
+        with self.assertRaises(PsecdUnavailableError):
+            psecd_request(
+                'ping',
+                socket_path=self.basedir / 'no-such.sock',
+            )
+
+
+if __name__ == '__main__':
+    sys.exit(unittest.main())
+
+# vim: set fileencoding=utf-8 ts=4 sw=4 tw=0 et :
@@ -29,7 +29,7 @@ exceptions = (
     environment_exceptions
     + basedir_exceptions
     + secret_exceptions
-    + [exc.DescriptionsError]
+    + [exc.DescriptionsError, exc.PsecdUnavailableError]
 )
 
 
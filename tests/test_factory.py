@@ -0,0 +1,233 @@
+#!/usr/bin/env python
+
+"""
+test_factory
+------------
+
+Tests for `psec.secrets_environment.factory` module.
+"""
+
+import os
+import subprocess  # nosec
+import sys
+import tempfile
+import time
+import unittest
+
+from collections import OrderedDict
+from unittest.mock import patch
+
+from psec.secrets_environment.factory import SecretFactory
+from psec.secrets_environment.handlers.password import (
+    get_word_index,
+    WordIndex,
+    XKCD_Password_c,
+)
+from psec.secrets_environment.handlers import HANDLER_MODULES
+
+
+class Test_SecretFactory(unittest.TestCase):
+
+    def test_import_does_not_load_handlers(self):
+        """Importing the secrets environment defers handler imports"""
+        code = (
+            'import sys; import psec.secrets_environment; '
+            'print(sorted(m for m in sys.modules '
+            "if m.startswith('psec.secrets_environment.handlers.') "
+            "or m.startswith('xkcdpass')))"
+        )
+        output = subprocess.check_output(  # nosec
+            [sys.executable, '-c', code],
+        ).decode('UTF-8').strip()
+        self.assertEqual(output, '[]')
+
+    def test_import_time_benchmark(self):
+        """Deferring handler imports makes importing faster"""
+
+        def best_import_time(statement):
+            # Best of several runs, each in a fresh interpreter.
+            code = (
+                'import time; start = time.perf_counter(); '
+                f'{statement}; print(time.perf_counter() - start)'
+            )
+            return min(
+                float(subprocess.check_output(  # nosec
+                    [sys.executable, '-c', code],
+                ))
+                for _ in range(10)
+            )
+
+        lazy = best_import_time('import psec.secrets_environment')
+        eager = best_import_time(
+            'import psec.secrets_environment; '
+            + '; '.join(
+                f"import {module.split(':')[0]}"
+                for module in HANDLER_MODULES.values()
+            )
+        )
+        self.assertLess(lazy, eager)
+
+    def test_secret_types_match_handler_table(self):
+        self.assertEqual(
+            SecretFactory.get_secret_types(),
+            sorted(HANDLER_MODULES),
+        )
+        self.assertEqual(
+            [
+                item['Type']
+                for item in SecretFactory.describe_secret_classes()
+            ],
+            SecretFactory.get_secret_types(),
+        )
+
+    def test_declared_generable(self):
+        """Declared generability matches trial generation"""
+        for secret_class in SecretFactory.get_handler_classes():
+            handler = secret_class()
+            try:
+                result = handler.generate_secret()
+            except RuntimeError:
+                result = True
+            self.assertEqual(
+                handler.is_generable(),
+                result not in ['', None],
+                msg=secret_class.__name__,
+            )
+
+    def test_unsupported_type(self):
+        self.assertRaises(
+            RuntimeError,
+            SecretFactory.get_handler,
+            'no_such_type',
+        )
+
+
+class Test_SecretFactory_generate_secrets(unittest.TestCase):
+
+    def setUp(self):
+        self.variables = OrderedDict([
+            ('hex_one', 'token_hex'),
+            ('uuid_one', 'uuid4'),
+            ('text', 'string'),
+            ('hex_two', 'token_hex'),
+            ('flag', 'boolean'),
+            ('uuid_two', 'uuid4'),
+            ('url_one', 'token_urlsafe'),
+            ('b64_one', 'token_base64'),
+        ])
+
+    def test_not_generable(self):
+        generated = SecretFactory.generate_secrets(self.variables)
+        self.assertEqual(
+            list(generated),
+            [v for v in self.variables if v != 'flag'],
+        )
+        # Strings are set to an empty string, as when generated singly.
+        self.assertEqual(generated['text'], '')
+
+    def test_shared_values(self):
+        generated = SecretFactory.generate_secrets(self.variables)
+        self.assertEqual(generated['hex_one'], generated['hex_two'])
+        self.assertEqual(generated['uuid_one'], generated['uuid_two'])
+
+    def test_unique_values(self):
+        generated = SecretFactory.generate_secrets(
+            self.variables, unique=True
+        )
+        self.assertNotEqual(generated['hex_one'], generated['hex_two'])
+        self.assertNotEqual(generated['uuid_one'], generated['uuid_two'])
+
+    def test_batch_formats_match_single(self):
+        generated = SecretFactory.generate_secrets(
+            self.variables, unique=True
+        )
+        for variable, value in generated.items():
+            single = SecretFactory.get_handler(
+                self.variables[variable]
+            ).generate_secret()
+            self.assertEqual(len(value), len(single), msg=variable)
+
+    def test_one_handler_per_type(self):
+        with patch.object(
+            SecretFactory,
+            'get_handler',
+            wraps=SecretFactory.get_handler,
+        ) as get_handler:
+            SecretFactory.generate_secrets(self.variables, unique=True)
+        self.assertEqual(
+            sorted(c.args[0] for c in get_handler.call_args_list),
+            sorted(set(self.variables.values())),
+        )
+
+    def test_generate_10k_benchmark(self):
+        """Generating 10,000 unique tokens takes well under a second"""
+        variables = OrderedDict(
+            (f'variable{i}', ['token_hex', 'uuid4'][i % 2])
+            for i in range(10000)
+        )
+        start = time.perf_counter()
+        generated = SecretFactory.generate_secrets(variables, unique=True)
+        elapsed = time.perf_counter() - start
+        self.assertEqual(len(set(generated.values())), 10000)
+        self.assertLess(elapsed, 1.0)
+
+
+class Test_WordIndex(unittest.TestCase):
+
+    def setUp(self):
+        fd, self.wordfile = tempfile.mkstemp()
+        with os.fdopen(fd, 'w') as f:
+            f.write('\n'.join([
+                'cat', 'act', 'act', 'tact', 'acorn', 'tiger', 'cobra',
+                'apple', 'toad', 'aardvark', '',
+            ]))
+
+    def tearDown(self):
+        os.unlink(self.wordfile)
+
+    def test_counts(self):
+        index = WordIndex.from_wordfile(self.wordfile)
+        self.assertEqual(len(index), 9)
+        self.assertEqual(index.count(3, 3), 2)
+        self.assertEqual(index.count(3, 5), 8)
+        self.assertEqual(index.count(3, 5, 'a'), 3)
+        self.assertEqual(index.count(4, 4, 'c'), 0)
+
+    def test_choice(self):
+        index = WordIndex.from_wordfile(self.wordfile)
+        for _ in range(50):
+            word = index.choice(4, 5, 'c')
+            self.assertEqual(word, 'cobra')
+            word = index.choice(3, 5, 't')
+            self.assertIn(word, ['tact', 'tiger', 'toad'])
+        self.assertRaises(RuntimeError, index.choice, 4, 4, 'c')
+
+    def test_index_built_once(self):
+        handler = XKCD_Password_c()
+        with patch.object(
+            WordIndex,
+            'from_wordfile',
+            wraps=WordIndex.from_wordfile,
+        ) as from_wordfile:
+            passwords = handler.generate_secrets(
+                100,
+                wordfile=self.wordfile,
+                numwords=3,
+                case='lower',
+            )
+            handler.generate_secret(wordfile=self.wordfile, acrostic='cat')
+        from_wordfile.assert_called_once()
+        self.assertIs(
+            get_word_index(self.wordfile),
+            get_word_index(self.wordfile),
+        )
+        for password in passwords:
+            words = password.split('.')
+            acrostic = ''.join(word[0] for word in words)
+            self.assertIn(acrostic, ['cat', 'act'])
+
+
+if __name__ == '__main__':
+    sys.exit(unittest.main())
+
+# vim: set fileencoding=utf-8 ts=4 sw=4 tw=0 et :
@@ -0,0 +1,227 @@
+#!/usr/bin/env python
+
+"""
+test_google_oauth2
+------------------
+
+Tests for `psec.google_oauth2` module, using a local stand-in SMTP
+server.
+"""
+
+import socketserver
+import sys
+import threading
+import unittest
+
+from unittest.mock import (
+    MagicMock,
+    patch,
+)
+
+from psec.google_oauth2 import GoogleSMTP
+
+
+KEYS = [
+    {'keyid': 'AAAA', 'uids': ['Alice <alice@example.com>']},
+    {'keyid': 'BBBB', 'uids': ['Bob <bob@example.com>', 'bob@example.org']},
+    {'keyid': 'CCCC', 'uids': ['Carol Shared <ops@example.com>']},
+    {'keyid': 'DDDD', 'uids': ['Dave Shared <ops@example.com>']},
+]
+
+
+class StandInSMTPHandler(socketserver.StreamRequestHandler):
+    """Accept mail like an SMTP server (without STARTTLS)."""
+
+    def reply(self, line):
+        self.wfile.write(f'{line}\r\n'.encode())
+
+    def handle(self):
+        server = self.server
+        with server.lock:
+            server.connections += 1
+        self.reply('220 stand-in ESMTP')
+        while True:
+            line = self.rfile.readline().decode().rstrip('\r\n')
+            if not line:
+                return
+            verb = line.split(' ', 1)[0].upper()
+            if verb == 'EHLO':
+                self.reply('250-stand-in')
+                self.reply('250 AUTH XOAUTH2')
+            elif verb == 'AUTH':
+                with server.lock:
+                    server.auths += 1
+                self.reply('235 2.7.0 Accepted')
+            elif verb == 'DATA':
+                self.reply('354 Go ahead')
+                while self.rfile.readline() not in [b'.\r\n', b'']:
+                    pass
+                with server.lock:
+                    server.delivered.append(server.recipient)
+                    drop = len(server.delivered) in server.drop_after
+                if drop:
+                    # Accept the message, then drop the connection.
+                    self.reply('250 OK')
+                    return
+                self.reply('250 OK')
+            elif verb == 'RCPT':
+                server.recipient = line.split(':', 1)[1].strip('<> ')
+                if server.recipient in server.refused:
+                    self.reply('550 5.1.1 No such user')
+                else:
+                    self.reply('250 OK')
+            elif verb == 'QUIT':
+                self.reply('221 Bye')
+                return
+            else:
+                self.reply('250 OK')
+
+
+class Test_GoogleSMTP(unittest.TestCase):
+
+    def setUp(self):
+        self.server = socketserver.ThreadingTCPServer(
+            ('127.0.0.1', 0), StandInSMTPHandler)
+        self.server.daemon_threads = True
+        self.server.lock = threading.Lock()
+        self.server.connections = 0
+        self.server.auths = 0
+        self.server.delivered = []
+        self.server.drop_after = []
+        self.server.refused = []
+        threading.Thread(
+            target=self.server.serve_forever, daemon=True).start()
+        self.googlesmtp = GoogleSMTP(
+            username='sender@example.com',
+            client_id='client',
+            client_secret='secret',
+            refresh_token='refresh',
+            smtp_host='127.0.0.1',
+            smtp_port=self.server.server_address[1],
+            starttls=False,
+        )
+        self.googlesmtp.gpg = MagicMock()
+        self.googlesmtp.gpg.list_keys.return_value = KEYS
+        self.googlesmtp.gpg.encrypt.return_value.ok = True
+        self.googlesmtp.gpg.encrypt.return_value.__str__.return_value = (
+            '-----BEGIN PGP MESSAGE-----'
+        )
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def messages(self, count):
+        return [
+            (
+                f'user{i}@example.com',
+                self.googlesmtp.create_msg(
+                    'sender@example.com',
+                    'alice@example.com',
+                    'test',
+                    text_message='secret',
+                ),
+            )
+            for i in range(count)
+        ]
+
+    def test_find_keyid(self):
+        googlesmtp = self.googlesmtp
+        self.assertEqual(googlesmtp.find_keyid('alice@example.com'), 'AAAA')
+        self.assertEqual(googlesmtp.find_keyid('BOB@example.com'), 'BBBB')
+        self.assertEqual(googlesmtp.find_keyid('bob@example.org'), 'BBBB')
+        self.assertEqual(googlesmtp.find_keyid('Alice'), 'AAAA')
+        self.assertEqual(
+            googlesmtp.find_keyid('bob@example.com', keyid='BBBB'), 'BBBB')
+        self.assertIsNone(
+            googlesmtp.find_keyid('bob@example.com', keyid='AAAA'))
+        self.assertIsNone(googlesmtp.find_keyid('eve@example.com'))
+        with self.assertRaisesRegex(RuntimeError, 'CCCC,DDDD'):
+            googlesmtp.find_keyid('ops@example.com')
+        googlesmtp.gpg.list_keys.assert_called_once()
+
+    def test_send_mails_one_session(self):
+        with patch.object(
+            GoogleSMTP,
+            'generate_refresh_token',
+            return_value={'access_token': 'token', 'expires_in': 3600},
+        ) as refresh:
+            results = list(self.googlesmtp.send_mails(
+                'sender@example.com', self.messages(40)))
+            refresh.assert_called_once()
+        sent = [toaddr for toaddr, error in results if error is None]
+        self.assertEqual(len(sent), 40)
+        self.assertEqual(self.server.delivered, sent)
+        self.assertEqual(self.server.connections, 1)
+        self.assertEqual(self.server.auths, 1)
+        self.googlesmtp.gpg.list_keys.assert_called_once()
+
+    def test_send_mails_reconnect(self):
+        self.server.drop_after = [3, 7]
+        with patch.object(
+            GoogleSMTP,
+            'generate_refresh_token',
+            return_value={'access_token': 'token', 'expires_in': 3600},
+        ) as refresh:
+            results = list(self.googlesmtp.send_mails(
+                'sender@example.com', self.messages(10)))
+            refresh.assert_called_once()
+        self.assertEqual([error for _, error in results], [None] * 10)
+        self.assertEqual(self.server.connections, 3)
+        self.assertEqual(self.server.auths, 3)
+
+    def test_send_mails_refused(self):
+        self.server.refused = ['user1@example.com', 'user3@example.com']
+        with patch.object(
+            GoogleSMTP,
+            'generate_refresh_token',
+            return_value={'access_token': 'token', 'expires_in': 3600},
+        ):
+            results = list(self.googlesmtp.send_mails(
+                'sender@example.com', self.messages(5)))
+        self.assertEqual(
+            [toaddr for toaddr, error in results if error is not None],
+            self.server.refused,
+        )
+        self.assertEqual(
+            self.server.delivered,
+            [toaddr for toaddr, error in results if error is None],
+        )
+        self.assertEqual(len(self.server.delivered), 3)
+        self.assertEqual(self.server.connections, 1)
+        with self.assertRaisesRegex(RuntimeError, 'user1@example.com'):
+            self.googlesmtp.send_mail(
+                'sender@example.com', *self.messages(2)[1])
+
+    def test_send_mails_no_session(self):
+        self.server.shutdown()
+        self.server.server_close()
+        with patch.object(
+            GoogleSMTP,
+            'generate_refresh_token',
+            return_value={'access_token': 'token', 'expires_in': 3600},
+        ):
+            results = list(self.googlesmtp.send_mails(
+                'sender@example.com', self.messages(3)))
+        self.assertEqual(len(results), 3)
+        for _, error in results:
+            self.assertIsInstance(error, OSError)
+
+    def test_expired_token_refreshed(self):
+        with patch.object(
+            GoogleSMTP,
+            'generate_refresh_token',
+            return_value={'access_token': 'token', 'expires_in': 30},
+        ) as refresh:
+            self.googlesmtp.send_mail(
+                'sender@example.com', *self.messages(1)[0])
+            self.googlesmtp.send_mail(
+                'sender@example.com', *self.messages(1)[0])
+            # Tokens expiring within a minute are not reused.
+            self.assertEqual(refresh.call_count, 2)
+
+
+if __name__ == '__main__':
+    sys.exit(unittest.main())
+
+# vim: set fileencoding=utf-8 ts=4 sw=4 tw=0 et :
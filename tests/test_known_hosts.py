@@ -0,0 +1,136 @@
+#!/usr/bin/env python
+
+"""
+test_known_hosts
+----------------
+
+Tests for `psec.utils.known_hosts` module.
+"""
+
+import base64
+import hashlib
+import hmac
+import os
+import stat
+import sys
+import tempfile
+import unittest
+
+from pathlib import Path
+
+from psec.utils.known_hosts import KnownHostsFile
+
+
+RED_KEY = 'AAAAC3NzaC1lZDI1NTE5AAAAIA69uuX+ItFoAAe+xE9c+XggGw7Z2Z7t3YVRJxSHMupv'  # noqa
+BLUE_KEY = 'AAAAC3NzaC1lZDI1NTE5AAAAIBlue000000000000000000000000000000000000000'  # noqa
+
+
+def hashed(host, salt=b'0123456789abcdefghij'):
+    """Return a hashed known_hosts host name field for ``host``."""
+    digest = hmac.new(salt, host.encode('utf-8'), hashlib.sha1).digest()
+    return (
+        f'|1|{base64.b64encode(salt).decode()}'
+        f'|{base64.b64encode(digest).decode()}'
+    )
+
+
+class Test_KnownHostsFile(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.path = Path(self.tmpdir.name) / 'known_hosts'
+        self.path.write_text(
+            '# comment\n'
+            f'red.example.com,192.0.2.1 ssh-ed25519 {RED_KEY}\n'
+            f'{hashed("blue.example.com")} ssh-ed25519 {BLUE_KEY}\n'
+            f'@revoked red.example.com ssh-ed25519 {BLUE_KEY}\n'
+        )
+        os.chmod(self.path, 0o644)
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def lines(self):
+        return self.path.read_text().splitlines()
+
+    def test_remove(self):
+        known_hosts = KnownHostsFile(self.path)
+        self.assertEqual(
+            known_hosts.remove(['192.0.2.1', 'blue.example.com']),
+            2,
+        )
+        self.assertTrue(known_hosts.write())
+        self.assertEqual(
+            self.lines(),
+            [
+                '# comment',
+                f'@revoked red.example.com ssh-ed25519 {BLUE_KEY}',
+            ],
+        )
+        self.assertEqual(stat.S_IMODE(self.path.stat().st_mode), 0o644)
+
+    def test_ports(self):
+        self.path.write_text(
+            f'[red.example.com]:22 ssh-ed25519 {RED_KEY}\n'
+            f'[red.example.com]:2222 ssh-ed25519 {RED_KEY}\n'
+            f'{hashed("[blue.example.com]:2222")} ssh-ed25519 {BLUE_KEY}\n'
+        )
+        known_hosts = KnownHostsFile(self.path)
+        # The default port is the same as no port.
+        self.assertEqual(
+            known_hosts.add([f'red.example.com ssh-ed25519 {RED_KEY}']), 0)
+        # Other ports are different hosts.
+        self.assertEqual(
+            known_hosts.add([f'[red.example.com]:2200 ssh-ed25519 {RED_KEY}']),
+            1,
+        )
+        self.assertEqual(known_hosts.remove(['[red.example.com]:2200']), 1)
+        self.assertEqual(known_hosts.remove(['blue.example.com']), 0)
+        self.assertEqual(known_hosts.remove(['[blue.example.com]:2222']), 1)
+        # A plain host name removes the entries for all of its ports.
+        self.assertEqual(known_hosts.remove(['red.example.com']), 2)
+        self.assertEqual(known_hosts.entries, [])
+
+    def test_add_replaces_same_type(self):
+        known_hosts = KnownHostsFile(self.path)
+        line = f'red.example.com,192.0.2.1 ssh-ed25519 {BLUE_KEY}'
+        self.assertEqual(known_hosts.add([line]), 1)
+        known_hosts.write()
+        lines = self.lines()
+        self.assertNotIn(
+            f'red.example.com,192.0.2.1 ssh-ed25519 {RED_KEY}', lines)
+        self.assertEqual(lines[-1], line)
+        self.assertEqual(len(lines), 4)
+
+    def test_add_existing_unchanged(self):
+        known_hosts = KnownHostsFile(self.path)
+        before = self.path.stat().st_ino
+        self.assertEqual(
+            known_hosts.add([f'blue.example.com ssh-ed25519 {BLUE_KEY}']),
+            0,
+        )
+        self.assertFalse(known_hosts.write())
+        self.assertEqual(self.path.stat().st_ino, before)
+
+    def test_add_invalid(self):
+        known_hosts = KnownHostsFile(self.path)
+        self.assertRaises(RuntimeError, known_hosts.add, ['nonsense'])
+
+    def test_new_file(self):
+        path = Path(self.tmpdir.name) / 'new_known_hosts'
+        known_hosts = KnownHostsFile(path)
+        self.assertTrue(known_hosts.is_writable())
+        known_hosts.add([f'red.example.com ssh-ed25519 {RED_KEY}'])
+        known_hosts.write()
+        self.assertEqual(stat.S_IMODE(path.stat().st_mode), 0o644)
+
+    @unittest.skipIf(os.getuid() == 0, 'root can write to any file')
+    def test_not_writable(self):
+        os.chmod(self.path, 0o444)
+        self.assertFalse(KnownHostsFile(self.path).is_writable())
+
+
+if __name__ == '__main__':
+    sys.exit(unittest.main())
+
+# vim: set fileencoding=utf-8 ts=4 sw=4 tw=0 et :
@@ -0,0 +1,337 @@
+#!/usr/bin/env python
+
+"""
+test_network
+------------
+
+Tests for `psec.utils.network` module, using local stand-in HTTP and
+DNS responders.
+"""
+
+import http.server
+import json
+import os
+import socket
+import struct
+import sys
+import tempfile
+import threading
+import time
+import unittest
+
+from pathlib import Path
+from unittest.mock import patch
+
+from psec.cli.utils.netblock import format_netblocks
+from psec.utils import network
+from psec.utils.network import (
+    dns_query,
+    get_myip,
+    get_netblocks,
+    myip_http,
+    myip_resolver,
+    race_myip,
+    NetblockIndex,
+)
+
+
+MYIP = '192.0.2.45'
+
+
+class StandInHTTPHandler(http.server.BaseHTTPRequestHandler):
+    """Answer like an "IP address only" web service."""
+
+    def do_GET(self):
+        delay, status = {
+            '/slow': (2, 200),
+            '/error': (0, 500),
+        }.get(self.path, (0, 200))
+        time.sleep(delay)
+        body = f'{MYIP}\n'.encode() if status == 200 else b'<p>oops</p>'
+        self.send_response(status)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+def stand_in_dns(sock):
+    """Answer DNS queries with A and TXT records for ``MYIP``."""
+    while True:
+        try:
+            query, client = sock.recvfrom(512)
+        except OSError:
+            return
+        offset = 12
+        while query[offset] != 0:
+            offset += query[offset] + 1
+        qtype = struct.unpack('>H', query[offset + 1:offset + 3])[0]
+        question = query[12:offset + 5]
+        if qtype == 16:
+            txt = f'"{MYIP}"'.encode()
+            rdata = bytes([len(txt)]) + txt
+        else:
+            qtype = 1
+            rdata = socket.inet_aton(MYIP)
+        answer = (
+            b'\xc0\x0c'
+            + struct.pack('>HHIH', qtype, 1, 60, len(rdata))
+            + rdata
+        )
+        header = query[:2] + struct.pack('>HHHHH', 0x8180, 1, 1, 0, 0)
+        sock.sendto(header + question + answer, client)
+
+
+class Test_myip(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.httpd = http.server.ThreadingHTTPServer(
+            ('127.0.0.1', 0), StandInHTTPHandler)
+        cls.httpd.daemon_threads = True
+        threading.Thread(target=cls.httpd.serve_forever, daemon=True).start()
+        cls.url = f'http://127.0.0.1:{cls.httpd.server_address[1]}'
+        cls.dns = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        cls.dns.bind(('127.0.0.1', 0))
+        threading.Thread(
+            target=stand_in_dns, args=(cls.dns,), daemon=True).start()
+        cls.dig = f'dig +short @127.0.0.1 -p {cls.dns.getsockname()[1]}'
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.httpd.shutdown()
+        cls.httpd.server_close()
+        cls.dns.close()
+
+    def methods(self, *names):
+        available = {
+            'http': {'arg': f'{self.url}/', 'func': myip_http},
+            'slow': {'arg': f'{self.url}/slow', 'func': myip_http},
+            'error': {'arg': f'{self.url}/error', 'func': myip_http},
+            'dns_txt': {
+                'arg': f'{self.dig} TXT o-o.myaddr.l.google.com',
+                'func': myip_resolver,
+            },
+            'dns_a': {
+                'arg': f'{self.dig} myip.opendns.com -4',
+                'func': myip_resolver,
+            },
+        }
+        return {name: available[name] for name in names}
+
+    def test_dns_query(self):
+        port = self.dns.getsockname()[1]
+        self.assertEqual(
+            dns_query('127.0.0.1', 'myip.opendns.com', port=port),
+            [MYIP],
+        )
+        self.assertEqual(
+            dns_query('127.0.0.1', 'o-o.myaddr.l.google.com',
+                      qtype='TXT', port=port),
+            [f'"{MYIP}"'],
+        )
+
+    def test_methods(self):
+        for method in self.methods('http', 'dns_txt', 'dns_a').values():
+            self.assertEqual(
+                str(method['func'](arg=method['arg']).ip),
+                MYIP,
+            )
+        self.assertRaises(
+            RuntimeError,
+            myip_http,
+            arg=f'{self.url}/error',
+        )
+
+    def test_race_first_wins(self):
+        start = time.monotonic()
+        method, ip = race_myip(
+            methods=self.methods('slow', 'error', 'dns_a'),
+            count=3,
+        )
+        self.assertLess(time.monotonic() - start, 1.5)
+        self.assertEqual((method, ip), ('dns_a', f'{MYIP}/32'))
+
+    def test_race_all_fail(self):
+        self.assertRaises(
+            RuntimeError,
+            race_myip,
+            methods=self.methods('error'),
+        )
+
+
+class Test_myip_cache(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.cache_path = Path(self.tmpdir.name) / 'myip.json'
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def test_cache(self):
+        with patch.object(
+            network, 'race_myip', return_value=('dns_a', MYIP)
+        ) as race:
+            for _ in range(2):
+                self.assertEqual(
+                    get_myip(method='race', cache_path=self.cache_path),
+                    MYIP,
+                )
+            race.assert_called_once()
+            self.assertEqual(
+                oct(os.stat(self.cache_path).st_mode & 0o777), '0o600')
+            cache = json.loads(self.cache_path.read_text())
+            cache['time'] -= 60
+            self.cache_path.write_text(json.dumps(cache))
+            get_myip(method='race', cache_path=self.cache_path,
+                     cache_ttl=30)
+            self.assertEqual(race.call_count, 2)
+            get_myip(method='race', cache_path=self.cache_path,
+                     cache_ttl=0)
+            self.assertEqual(race.call_count, 3)
+
+    def test_random_not_cached(self):
+        with patch.object(
+            network, 'race_myip', return_value=('dns_a', MYIP)
+        ):
+            get_myip(method='race', cache_path=self.cache_path)
+        with patch.dict(
+            network.myip_methods,
+            {
+                name: {'func': lambda arg=None: '192.0.2.99', 'arg': None}
+                for name in network.myip_methods
+            },
+        ):
+            self.assertEqual(
+                get_myip(method='random', cache_path=self.cache_path),
+                '192.0.2.99',
+            )
+        self.assertEqual(
+            json.loads(self.cache_path.read_text())['ip'], MYIP)
+
+
+# Stand-in WHOIS results, by the first two octets of the address.
+NETBLOCKS = {
+    '198.51': '198.51.100.0/24',
+    '203.0': '203.0.113.0/24, 203.0.112.0/24',
+}
+
+
+def stand_in_whois(ip=None):
+    time.sleep(0.05)
+    try:
+        return NETBLOCKS['.'.join(ip.split('.')[:2])]
+    except KeyError:
+        raise ValueError(f'no WHOIS data for {ip}')
+
+
+class Test_netblocks(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.cache_path = Path(self.tmpdir.name) / 'netblocks.json'
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def test_index_longest_prefix(self):
+        index = NetblockIndex()
+        index.add('10.0.0.0/8')
+        index.add('10.1.0.0/16')
+        index.add('2001:db8::/32')
+        self.assertEqual(index.lookup('10.1.2.3'), '10.1.0.0/16')
+        self.assertEqual(index.lookup('10.2.0.1'), '10.0.0.0/8')
+        self.assertEqual(index.lookup('2001:db8::1'), '2001:db8::/32')
+        self.assertIsNone(index.lookup('192.0.2.1'))
+        self.assertIsNone(index.lookup('::ffff:10.1.2.3'))
+
+    def test_batch(self):
+        ips = [f'198.51.100.{i}' for i in range(50)]
+        ips[10:10] = ['203.0.112.7', '203.0.113.9/32', '198.51.100.3']
+        with patch.object(
+            network, 'get_netblock', side_effect=stand_in_whois
+        ) as whois:
+            netblocks = get_netblocks(ips, max_workers=1)
+            # Addresses in netblocks already learned are not looked up.
+            self.assertEqual(whois.call_count, 2)
+        self.assertEqual(len(netblocks), 52)
+        self.assertEqual(list(netblocks)[10], '203.0.112.7')
+        self.assertEqual(netblocks['198.51.100.49'], '198.51.100.0/24')
+        self.assertEqual(
+            netblocks['203.0.113.9'], '203.0.113.0/24, 203.0.112.0/24')
+
+    def test_bounded_concurrency(self):
+        running = []
+        peak = []
+        lock = threading.Lock()
+
+        def whois(ip=None):
+            with lock:
+                running.append(ip)
+                peak.append(len(running))
+            time.sleep(0.05)
+            with lock:
+                running.remove(ip)
+            return f'{ip}/32'
+
+        with patch.object(network, 'get_netblock', side_effect=whois):
+            get_netblocks(
+                [f'192.0.2.{i}' for i in range(12)], max_workers=3)
+        self.assertEqual(max(peak), 3)
+
+    def test_failures(self):
+        with patch.object(
+            network, 'get_netblock', side_effect=stand_in_whois
+        ):
+            netblocks = get_netblocks(['192.0.2.1', '198.51.100.1'])
+        self.assertEqual(
+            netblocks,
+            {'192.0.2.1': None, '198.51.100.1': '198.51.100.0/24'},
+        )
+        with self.assertRaises(RuntimeError):
+            get_netblocks(['not-an-address'])
+
+    def test_format_netblocks(self):
+        ips = ['198.51.100.1', '192.0.2.1', '198.51.100.1/32', '198.51.100.1']
+        with patch.object(
+            network, 'get_netblock', side_effect=stand_in_whois
+        ):
+            netblocks = get_netblocks(ips)
+        self.assertEqual(
+            format_netblocks(ips, netblocks),
+            [
+                '198.51.100.1 198.51.100.0/24',
+                '192.0.2.1 -',
+                '198.51.100.1/32 198.51.100.0/24',
+                '198.51.100.1 198.51.100.0/24',
+            ],
+        )
+
+    def test_cache(self):
+        with patch.object(
+            network, 'get_netblock', side_effect=stand_in_whois
+        ) as whois:
+            get_netblocks(['198.51.100.1'], cache_path=self.cache_path)
+            self.assertEqual(
+                oct(os.stat(self.cache_path).st_mode & 0o777), '0o600')
+            get_netblocks(['198.51.100.2'], cache_path=self.cache_path)
+            self.assertEqual(whois.call_count, 1)
+            get_netblocks(['198.51.100.3'], cache_path=self.cache_path,
+                          cache_ttl=0)
+            self.assertEqual(whois.call_count, 2)
+            cache = json.loads(self.cache_path.read_text())
+            for entry in cache['netblocks'].values():
+                entry[1] -= 60
+            self.cache_path.write_text(json.dumps(cache))
+            get_netblocks(['198.51.100.4'], cache_path=self.cache_path,
+                          cache_ttl=30)
+            self.assertEqual(whois.call_count, 3)
+
+
+if __name__ == '__main__':
+    sys.exit(unittest.main())
+
+# vim: set fileencoding=utf-8 ts=4 sw=4 tw=0 et :
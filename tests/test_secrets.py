@@ -8,9 +8,14 @@ test_secrets_environment
 Tests for `psec.secrets_environment` module.
 """
 
+import json
 import unittest
 import os
+import shutil
+import stat
 import sys
+import tempfile
+import time
 
 from pathlib import Path
 from unittest.mock import patch
@@ -19,6 +24,8 @@ from psec.secrets_environment import SecretsEnvironment
 from psec.utils import (
     get_default_environment,
     get_local_default_file,
+    secrets_basedir_create,
+    SECRETS_DESCRIPTIONS_DIR,
 )
 
 
@@ -300,6 +307,219 @@ class Test_SecretsEnvironment_defaults(unittest.TestCase):
         self.assertEqual(default_env, TESTENV)
 
 
+def make_environment(basedir, env, groups=1, variables=1):
+    """
+    Create an environment with ``groups`` description files each
+    describing ``variables`` variables and return a SecretsEnvironment
+    object for it.
+    """
+    descriptions_dir = Path(basedir) / env / SECRETS_DESCRIPTIONS_DIR
+    descriptions_dir.mkdir(parents=True)
+    for g in range(groups):
+        (descriptions_dir / f'group{g}.json').write_text(json.dumps([
+            {
+                'Variable': f'group{g}_variable{v}',
+                'Type': 'token_hex' if v % 2 else 'string',
+                'Prompt': f'Variable {v} in group {g}',
+            }
+            for v in range(variables)
+        ]))
+    return SecretsEnvironment(environment=env, secrets_basedir=basedir)
+
+
+class Test_SecretsEnvironment_index(unittest.TestCase):
+
+    def setUp(self):
+        self.basedir = Path(tempfile.mkdtemp())
+        secrets_basedir_create(basedir=self.basedir)
+
+    def tearDown(self):
+        shutil.rmtree(self.basedir)
+
+    def test_lookups(self):
+        se = make_environment(self.basedir, TESTENV, groups=2, variables=3)
+        se.read_secrets_and_descriptions()
+        self.assertEqual(se.get_secret_type('group1_variable1'), 'token_hex')
+        self.assertEqual(se.get_secret_type('group1_variable2'), 'string')
+        self.assertIsNone(se.get_secret_type('no_such_variable'))
+        self.assertEqual(se.get_secret_arguments('group0_variable0'), {})
+        self.assertTrue(se.is_item_in_group('group0_variable0', 'group0'))
+        self.assertFalse(se.is_item_in_group('group0_variable0', 'group1'))
+        self.assertEqual(
+            se.get_description('group1_variable0')['Prompt'],
+            'Variable 0 in group 1',
+        )
+
+    def test_variable_in_several_groups(self):
+        se = make_environment(self.basedir, TESTENV, groups=2, variables=2)
+        descriptions_dir = self.basedir / TESTENV / SECRETS_DESCRIPTIONS_DIR
+        group1 = descriptions_dir / 'group1.json'
+        group1.write_text(json.dumps(
+            json.loads(group1.read_text())
+            + [{'Variable': 'group0_variable0', 'Type': 'token_hex'}]
+        ))
+        se.read_secrets_descriptions()
+        self.assertTrue(se.is_item_in_group('group0_variable0', 'group0'))
+        self.assertTrue(se.is_item_in_group('group0_variable0', 'group1'))
+        self.assertFalse(se.is_item_in_group('group1_variable0', 'group0'))
+        # The first group to describe a variable provides its description.
+        self.assertEqual(se.get_secret_type('group0_variable0'), 'string')
+        with self.assertRaises(KeyError):
+            se.is_item_in_group('group0_variable0', 'no_such_group')
+
+    def test_lookups_scale_linearly(self):
+        """Looking up every variable scales linearly with their number"""
+        elapsed = {}
+        for size in [500, 2000]:
+            best = None
+            for run in range(3):
+                env = f'{TESTENV}_{size}_{run}'
+                se = make_environment(
+                    self.basedir, env, groups=4, variables=size // 4
+                )
+                start = time.perf_counter()
+                se.read_secrets_descriptions()
+                for variable in se.Type:
+                    se.get_secret_type(variable)
+                    se.get_secret_arguments(variable)
+                    se.is_item_in_group(variable, se.get_group(variable))
+                duration = time.perf_counter() - start
+                best = duration if best is None else min(best, duration)
+            elapsed[size] = best
+        # Quadratic behavior would be 16x slower for 4x the variables.
+        self.assertLess(elapsed[2000], elapsed[500] * 8)
+
+
+class Test_SecretsEnvironment_write_secrets(unittest.TestCase):
+
+    def setUp(self):
+        self.basedir = Path(tempfile.mkdtemp())
+        secrets_basedir_create(basedir=self.basedir)
+        se = make_environment(self.basedir, TESTENV, groups=1, variables=3)
+        se.read_secrets_and_descriptions()
+        se.write_secrets()
+        self.secrets_file = se.get_secrets_file_path()
+
+    def tearDown(self):
+        shutil.rmtree(self.basedir)
+
+    def load(self):
+        se = SecretsEnvironment(
+            environment=TESTENV,
+            secrets_basedir=self.basedir,
+        )
+        se.read_secrets_and_descriptions()
+        return se
+
+    def test_file_mode(self):
+        self.assertEqual(
+            stat.S_IMODE(self.secrets_file.stat().st_mode), 0o600
+        )
+        self.assertEqual(
+            [p.name for p in self.secrets_file.parent.glob('.secrets.json.*')],
+            ['.secrets.json.lock'],
+        )
+
+    def test_concurrent_writers_merge(self):
+        first, second = self.load(), self.load()
+        first.set_secret('group0_variable0', 'one')
+        second.set_secret('group0_variable1', 'two')
+        first.write_secrets()
+        second.write_secrets()
+        self.assertEqual(
+            json.loads(self.secrets_file.read_text()),
+            {
+                'group0_variable0': 'one',
+                'group0_variable1': 'two',
+                'group0_variable2': None,
+            },
+        )
+        # The later writer also sees the earlier writer's change.
+        self.assertEqual(second.get_secret('group0_variable0'), 'one')
+
+    def test_unchanged_secret_does_not_revert(self):
+        first, second = self.load(), self.load()
+        first.set_secret('group0_variable0', 'one')
+        first.write_secrets()
+        second.delete_secret('group0_variable2')
+        second.write_secrets()
+        self.assertEqual(
+            json.loads(self.secrets_file.read_text()),
+            {'group0_variable0': 'one', 'group0_variable1': None},
+        )
+
+    def test_conflicting_change_last_writer_wins(self):
+        first, second = self.load(), self.load()
+        first.set_secret('group0_variable0', 'one')
+        second.set_secret('group0_variable0', 'two')
+        first.write_secrets()
+        second.write_secrets()
+        self.assertEqual(
+            self.load().get_secret('group0_variable0'), 'two'
+        )
+
+
+class Test_SecretsEnvironment_descriptions_cache(unittest.TestCase):
+
+    def setUp(self):
+        self.basedir = Path(tempfile.mkdtemp())
+        secrets_basedir_create(basedir=self.basedir)
+        self.se = make_environment(
+            self.basedir, TESTENV, groups=2, variables=3
+        )
+        self.cache_path = self.se.get_descriptions_cache_path()
+        self.age_descriptions()
+
+    def tearDown(self):
+        shutil.rmtree(self.basedir)
+
+    def age_descriptions(self, seconds=60):
+        """Make description files old enough to be cached."""
+        mtime = time.time_ns() - seconds * 1000000000
+        for path in self.se.get_descriptions_path().glob('*.json'):
+            os.utime(path, ns=(mtime, mtime))
+
+    def reread(self):
+        se = SecretsEnvironment(
+            environment=TESTENV,
+            secrets_basedir=self.basedir,
+        )
+        se.read_secrets_descriptions()
+        return se
+
+    def test_cache_written(self):
+        self.se.read_secrets_descriptions()
+        self.assertTrue(self.cache_path.exists())
+        self.assertEqual(stat.S_IMODE(self.cache_path.stat().st_mode), 0o600)
+
+    def test_cache_used(self):
+        self.se.read_secrets_descriptions()
+        with patch.object(SecretsEnvironment, 'read_descriptions') as read:
+            se = self.reread()
+            read.assert_not_called()
+        self.assertEqual(se.get_secret_type('group0_variable1'), 'token_hex')
+        self.assertEqual(se.get_groups(), ['group0', 'group1'])
+
+    def test_cache_rebuilt_on_change(self):
+        self.se.read_secrets_descriptions()
+        group_file = self.se.get_descriptions_path(group='group0')
+        group_file.write_text(json.dumps([
+            {'Variable': 'changed', 'Type': 'uuid4', 'Prompt': 'Changed'},
+        ]))
+        self.age_descriptions(seconds=30)
+        se = self.reread()
+        self.assertEqual(se.get_secret_type('changed'), 'uuid4')
+        self.assertIsNone(se.get_secret_type('group0_variable1'))
+        with patch.object(SecretsEnvironment, 'read_descriptions') as read:
+            self.reread()
+            read.assert_not_called()
+
+    def test_cache_not_written_for_recent_changes(self):
+        self.age_descriptions(seconds=0)
+        self.se.read_secrets_descriptions()
+        self.assertFalse(self.cache_path.exists())
+
+
 if __name__ == '__main__':
     import sys
     sys.exit(unittest.main())
@@ -0,0 +1,192 @@
+#!/usr/bin/env python
+
+"""
+test_secrets_get
+----------------
+
+Tests for `psec.cli.secrets.get` module.
+"""
+
+import json
+import os
+import shutil
+import subprocess  # nosec
+import sys
+import tempfile
+import time
+import unittest
+
+from collections import OrderedDict
+from importlib.metadata import entry_points
+from pathlib import Path
+
+from psec.cli.secrets.get import (
+    format_values,
+    SecretsGet,
+)
+from psec.exceptions import SecretNotFoundError
+from psec.secrets_environment import SecretsEnvironment
+from psec.utils import secrets_basedir_create
+
+
+TESTENV = 'pytest'
+SECRETS_D = Path(__file__).parent / 'secrets.d'
+# Number of variables for the single invocation vs. separate invocations
+# benchmark.
+BENCHMARK_VARIABLES = 10
+
+
+def psec_commands_installed():
+    """Check whether the ``psec`` subcommand entry points are installed."""
+    return any(
+        ep.name == 'secrets_get'
+        for ep in entry_points(group='psec')
+    )
+
+
+class Test_format_values(unittest.TestCase):
+
+    def setUp(self):
+        self.values = OrderedDict([
+            ('plain', 'value'),
+            ('quoted', 'it\'s "$HOME"'),
+            ('unset', None),
+        ])
+
+    def test_value(self):
+        self.assertEqual(
+            format_values(self.values, 'value'),
+            'value\nit\'s "$HOME"\n\n',
+        )
+
+    def test_export(self):
+        self.assertEqual(
+            format_values(self.values, 'export'),
+            "export plain=value\n"
+            "export quoted='it'\"'\"'s \"$HOME\"'\n"
+            "export unset=''\n",
+        )
+
+    def test_export_round_trip(self):
+        output = subprocess.check_output(  # nosec
+            [
+                'sh', '-c',
+                format_values(self.values, 'export') + 'echo "$quoted"',
+            ],
+        ).decode('UTF-8')
+        self.assertEqual(output, 'it\'s "$HOME"\n')
+
+    def test_dotenv(self):
+        self.assertEqual(
+            format_values(self.values, 'dotenv'),
+            'plain="value"\n'
+            'quoted="it\'s \\"\\$HOME\\""\n'
+            'unset=""\n',
+        )
+
+    def test_json(self):
+        self.assertEqual(
+            json.loads(format_values(self.values, 'json')),
+            dict(self.values),
+        )
+
+    def test_nul(self):
+        self.assertEqual(
+            format_values(self.values, 'nul'),
+            'plain=value\0quoted=it\'s "$HOME"\0unset=\0',
+        )
+
+
+class Test_select_variables(unittest.TestCase):
+
+    def setUp(self):
+        self.basedir = Path(tempfile.mkdtemp())
+        secrets_basedir_create(basedir=self.basedir)
+        shutil.copytree(SECRETS_D, self.basedir / TESTENV / 'secrets.d')
+        self.se = SecretsEnvironment(
+            environment=TESTENV,
+            secrets_basedir=self.basedir,
+        )
+        self.se.read_secrets_and_descriptions()
+
+    def tearDown(self):
+        shutil.rmtree(self.basedir)
+
+    def select(self, names, groups=None):
+        return SecretsGet.select_variables(self.se, names, groups or [])
+
+    def test_names_and_patterns(self):
+        selected = self.select(['consul_key', 'myapp_pi_*', 'consul_*'])
+        self.assertEqual(
+            selected,
+            ['consul_key', 'myapp_pi_password'],
+        )
+
+    def test_groups(self):
+        selected = self.select(['myapp_pi_password'], groups=['myapp'])
+        self.assertEqual(selected, self.se.get_items_from_group('myapp'))
+
+    def test_unknown(self):
+        self.assertRaises(SecretNotFoundError, self.select, ['nosuch'])
+        self.assertRaises(RuntimeError, self.select, ['nosuch_*'])
+        self.assertRaises(RuntimeError, self.select, [], ['nosuch'])
+
+
+@unittest.skipUnless(
+    psec_commands_installed(),
+    "psec subcommands are not installed"
+)
+class Test_secrets_get_benchmark(unittest.TestCase):
+
+    def setUp(self):
+        self.basedir = Path(tempfile.mkdtemp())
+        self.psec = [
+            sys.executable, '-m', 'psec',
+            '-d', str(self.basedir),
+            '-e', TESTENV,
+        ]
+        self.run_psec(['--init', 'environments', 'create',
+                       '--clone-from', str(SECRETS_D.parent)])
+        self.run_psec(['secrets', 'generate'])
+        se = SecretsEnvironment(
+            environment=TESTENV,
+            secrets_basedir=self.basedir,
+        )
+        se.read_secrets_and_descriptions()
+        self.variables = list(se.keys())[:BENCHMARK_VARIABLES]
+
+    def tearDown(self):
+        shutil.rmtree(self.basedir)
+
+    def run_psec(self, args):
+        env = dict(os.environ, D2_PSECD_SOCKET=str(self.basedir / 'none'))
+        return subprocess.check_output(  # nosec
+            self.psec + args,
+            env=env,
+            stderr=subprocess.DEVNULL,
+        ).decode('UTF-8')
+
+    def test_single_invocation_vs_separate(self):
+        start = time.perf_counter()
+        separate = OrderedDict(
+            (variable, self.run_psec(['secrets', 'get', variable]).strip())
+            for variable in self.variables
+        )
+        separate_elapsed = time.perf_counter() - start
+        start = time.perf_counter()
+        single = json.loads(
+            self.run_psec(['secrets', 'get', '--format', 'json']
+                          + self.variables)
+        )
+        single_elapsed = time.perf_counter() - start
+        self.assertEqual(
+            {k: '' if v is None else v for k, v in single.items()},
+            {k: '' if v == 'None' else v for k, v in separate.items()},
+        )
+        self.assertLess(single_elapsed * 3, separate_elapsed)
+
+
+if __name__ == '__main__':
+    sys.exit(unittest.main())
+
+# vim: set fileencoding=utf-8 ts=4 sw=4 tw=0 et :
@@ -0,0 +1,181 @@
+#!/usr/bin/env python
+
+"""
+test_secrets_index
+------------------
+
+Tests for `psec.secrets_index` module.
+"""
+
+import json
+import os
+import shutil
+import stat
+import sys
+import tempfile
+import time
+import unittest
+
+from pathlib import Path
+from unittest.mock import patch
+
+from psec.secrets_index import (
+    SecretsIndex,
+    INDEX_FILE,
+    INDEX_KEY_FILE,
+)
+from psec.utils import (
+    secrets_basedir_create,
+    SECRETS_DESCRIPTIONS_DIR,
+    SECRETS_FILE,
+)
+
+
+SECRETS_D = Path(__file__).parent / 'secrets.d'
+
+
+class Test_SecretsIndex(unittest.TestCase):
+
+    def setUp(self):
+        self.basedir = Path(tempfile.mkdtemp())
+        secrets_basedir_create(basedir=self.basedir)
+        self.make_environment('one', {'myapp_pi_password': 'shared'})
+        self.make_environment('two', {
+            'myapp_pi_password': 'different',
+            'consul_key': 'shared',
+        })
+
+    def tearDown(self):
+        shutil.rmtree(self.basedir)
+
+    def make_environment(self, environment, values):
+        env_path = self.basedir / environment
+        shutil.copytree(SECRETS_D, env_path / SECRETS_DESCRIPTIONS_DIR)
+        self.write_secrets(environment, values)
+
+    def write_secrets(self, environment, values, age=60):
+        env_path = self.basedir / environment
+        secrets_file = env_path / SECRETS_FILE
+        secrets_file.write_text(json.dumps(values))
+        mtime = time.time_ns() - age * 1000000000
+        for path in [
+            secrets_file,
+            *(env_path / SECRETS_DESCRIPTIONS_DIR).iterdir(),
+        ]:
+            os.utime(path, ns=(mtime, mtime))
+
+    def test_files_private(self):
+        SecretsIndex(self.basedir).refresh()
+        for name in [INDEX_FILE, INDEX_KEY_FILE]:
+            path = self.basedir / name
+            self.assertEqual(stat.S_IMODE(path.stat().st_mode), 0o600)
+        self.assertNotIn('shared', (self.basedir / INDEX_FILE).read_text())
+
+    def test_find_names(self):
+        index = SecretsIndex(self.basedir).refresh()
+        self.assertEqual(
+            sorted(index.find_names(['pi_pass', 'consul_k'])),
+            [
+                ['one', 'consul', 'consul_key'],
+                ['one', 'myapp', 'myapp_pi_password'],
+                ['two', 'consul', 'consul_key'],
+                ['two', 'myapp', 'myapp_pi_password'],
+            ],
+        )
+        self.assertEqual(
+            index.find_names(['pi_pass', 'consul_k'], group='consul'),
+            [
+                ['one', 'consul', 'consul_key'],
+                ['two', 'consul', 'consul_key'],
+            ],
+        )
+
+    def test_find_values(self):
+        index = SecretsIndex(self.basedir).refresh()
+        self.assertEqual(
+            index.find_values(['shared']),
+            [
+                ['one', 'myapp', 'myapp_pi_password'],
+                ['two', 'consul', 'consul_key'],
+            ],
+        )
+        self.assertEqual(index.find_values(['nosuch']), [])
+
+    def test_key_per_basedir(self):
+        first = SecretsIndex(self.basedir)
+        second = SecretsIndex(self.basedir)
+        self.assertEqual(first.value_hash('x'), second.value_hash('x'))
+        other = Path(tempfile.mkdtemp())
+        try:
+            self.assertNotEqual(
+                first.value_hash('x'),
+                SecretsIndex(other).value_hash('x'),
+            )
+        finally:
+            shutil.rmtree(other)
+
+    def test_key_creation_race(self):
+        other_key = bytes(range(32))
+        real_link = os.link
+
+        def link(src, dst):
+            # Another process creates the key file first.
+            Path(dst).write_text(other_key.hex() + '\n')
+            real_link(src, dst)
+
+        with patch('psec.secrets_index.os.link', side_effect=link):
+            self.assertEqual(SecretsIndex(self.basedir).get_key(), other_key)
+        self.assertEqual(SecretsIndex(self.basedir).get_key(), other_key)
+        self.assertEqual(
+            [
+                path.name for path in self.basedir.iterdir()
+                if INDEX_KEY_FILE in path.name
+            ],
+            [INDEX_KEY_FILE],
+        )
+
+    def test_incremental_refresh(self):
+        SecretsIndex(self.basedir).refresh()
+        with patch.object(
+            SecretsIndex,
+            'index_environment',
+            wraps=SecretsIndex(self.basedir).index_environment,
+        ) as index_environment:
+            SecretsIndex(self.basedir).refresh()
+            index_environment.assert_not_called()
+            self.write_secrets('two', {'consul_key': 'changed'}, age=30)
+            index = SecretsIndex(self.basedir).refresh()
+            self.assertEqual(
+                [c.args[0] for c in index_environment.call_args_list],
+                ['two'],
+            )
+        self.assertEqual(
+            index.find_values(['changed']),
+            [['two', 'consul', 'consul_key']],
+        )
+
+    def test_removed_environment(self):
+        SecretsIndex(self.basedir).refresh()
+        shutil.rmtree(self.basedir / 'one')
+        index = SecretsIndex(self.basedir).refresh()
+        self.assertEqual(
+            index.find_names(['pi_pass']),
+            [['two', 'myapp', 'myapp_pi_password']],
+        )
+
+    def test_recent_changes_rechecked(self):
+        self.write_secrets('one', {'myapp_pi_password': 'new'}, age=0)
+        SecretsIndex(self.basedir).refresh()
+        with patch.object(SecretsIndex, 'index_environment') as indexer:
+            indexer.return_value = []
+            SecretsIndex(self.basedir).refresh()
+            self.assertEqual(
+                [c.args[0] for c in indexer.call_args_list],
+                ['one'],
+            )
+
+
+if __name__ == '__main__':
+    sys.exit(unittest.main())
+
+# vim: set fileencoding=utf-8 ts=4 sw=4 tw=0 et :
@@ -0,0 +1,229 @@
+#!/usr/bin/env python
+
+"""
+test_ssh
+--------
+
+Tests for `psec.cli.ssh` module.
+"""
+
+import io
+import json
+import sys
+import tempfile
+import time
+import tracemalloc
+import unittest
+
+from pathlib import Path
+from unittest.mock import patch
+
+from psec.cli.ssh import (
+    ConsoleOutputParser,
+    PublicKeys,
+    update_known_hosts,
+)
+
+
+FINGERPRINT = 'SHA256:8v65hZhe0e207BQaoltof+QJv9dDfQAMhXoL4DYfRw0.'
+PUBKEY = 'AAAAC3NzaC1lZDI1NTE5AAAAIA69uuX+ItFoAAe+xE9c+XggGw7Z2Z7t3YVRJxSHMupv'
+# Number of droplets and lines of unrelated output per droplet in the
+# synthetic Terraform log for the benchmark.
+BENCHMARK_HOSTS = 50
+BENCHMARK_NOISE = 4000
+
+
+def droplet_output(name, address, noise=0):
+    """Return the lines of Terraform output for one droplet."""
+    prefix = f'digitalocean_droplet.{name} (remote-exec): '
+    lines = [f'{prefix}  Host: {address}']
+    lines.extend(
+        f'{prefix}\x1b[0m\x1b[1mGet:{i} http://deb.debian.org/debian '
+        f'bookworm/main amd64 package{i} [{i} kB]\x1b[0m'
+        for i in range(noise)
+    )
+    lines.extend([
+        f'{prefix}----- BEGIN SSH HOST KEY FINGERPRINTS -----',
+        f'{prefix}ssh-ed25519 {FINGERPRINT} root@{name}',
+        f'{prefix}----- END SSH HOST KEY FINGERPRINTS -----',
+        f'{prefix}----- BEGIN SSH HOST PUBLIC KEYS -----',
+        f'{prefix}ssh-ed25519 {PUBKEY} root@{name}',
+        f'{prefix}----- END SSH HOST PUBLIC KEYS -----',
+    ])
+    return lines
+
+
+def interleave(*outputs):
+    """Interleave lines of output as Terraform does."""
+    lines = []
+    for i in range(max(len(output) for output in outputs)):
+        lines.extend(output[i] for output in outputs if i < len(output))
+    return lines
+
+
+def host_names(count):
+    """Return ``count`` distinct alphabetic host names."""
+    letters = 'abcdefghijklmnopqrstuvwxyz'
+    return [
+        f'host{letters[i // 26]}{letters[i % 26]}'
+        for i in range(count)
+    ]
+
+
+class Test_ConsoleOutputParser(unittest.TestCase):
+
+    def test_terraform_interleaved(self):
+        lines = interleave(
+            ['Terraform will perform the following actions:'],
+            droplet_output('red', '165.22.163.3', noise=3),
+            droplet_output('blue', '165.22.163.4'),
+        )
+        public_keys = PublicKeys(domain='example.com')
+        hostdict = public_keys.process_saved_console_output(lines)
+        self.assertEqual(sorted(hostdict), ['blue', 'red'])
+        self.assertEqual(
+            hostdict['red'],
+            {
+                'public_ip': '165.22.163.3',
+                'public_dns': 'red.example.com',
+                'fingerprint': [f'ssh-ed25519 {FINGERPRINT} root@red'],
+                'hostkey': [
+                    f'red.example.com,165.22.163.3 ssh-ed25519 {PUBKEY}',
+                ],
+            },
+        )
+
+    def test_aws_console_output(self):
+        lines = [
+            '[+] Host: 192.0.2.10',
+            'ec2: #############################################',
+            'ec2: -----BEGIN SSH HOST KEY FINGERPRINTS-----',
+            f'ec2: 256 {FINGERPRINT} no comment (ED25519)',
+            'ec2: -----END SSH HOST KEY FINGERPRINTS-----',
+            '-----BEGIN SSH HOST PUBLIC KEYS-----',
+            f'ssh-ed25519 {PUBKEY} root@ip-192-0-2-10',
+            '-----END SSH HOST PUBLIC KEYS-----',
+        ]
+        parser = ConsoleOutputParser(resolve=False)
+        self.assertEqual(
+            list(parser.parse(io.StringIO('\n'.join(lines)))),
+            [
+                (
+                    'address',
+                    None,
+                    {'public_ip': '192.0.2.10', 'public_dns': None},
+                ),
+                ('fingerprint', None, f'256 {FINGERPRINT} no comment (ED25519)'),  # noqa
+                ('hostkey', None, f'None,192.0.2.10 ssh-ed25519 {PUBKEY}'),
+            ],
+        )
+
+    def test_unnamed_ignored_with_droplets(self):
+        lines = [
+            '----- BEGIN SSH HOST PUBLIC KEYS -----',
+            f'ssh-ed25519 {PUBKEY} root@nowhere',
+            '----- END SSH HOST PUBLIC KEYS -----',
+        ] + droplet_output('red', '165.22.163.3')
+        hostdict = PublicKeys(domain='example.com') \
+            .process_saved_console_output(lines)
+        self.assertEqual(list(hostdict), ['red'])
+
+    def test_benchmark(self):
+        names = host_names(BENCHMARK_HOSTS)
+        log = '\n'.join(interleave(*[
+            droplet_output(name, f'10.0.{i // 256}.{i % 256}',
+                           noise=BENCHMARK_NOISE)
+            for i, name in enumerate(names)
+        ])) + '\n'
+        source = io.StringIO(log)
+        del log
+        tracemalloc.start()
+        start = time.perf_counter()
+        hostdict = PublicKeys(domain='example.com') \
+            .process_saved_console_output(source)
+        elapsed = time.perf_counter() - start
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        self.assertEqual(sorted(hostdict), sorted(names))
+        # About 27 MB of output (200,000 lines) parses in well under
+        # five seconds.
+        self.assertLess(elapsed, 5.0)
+        # Memory use is bounded by the number of hosts, not lines.
+        self.assertLess(peak, 1000000)
+
+
+class Test_update_known_hosts(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.path = Path(self.tmpdir.name) / 'known_hosts'
+        self.hostkeys = [
+            f'{name}.example.com,10.0.0.{i} ssh-ed25519 {PUBKEY}'
+            for i, name in enumerate(host_names(20))
+        ]
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def test_native(self):
+        with patch('psec.cli.ssh.pexpect.spawnu') as spawnu:
+            update_known_hosts(add=self.hostkeys, known_hosts_file=self.path)
+            self.assertEqual(
+                self.path.read_text().splitlines(),
+                self.hostkeys,
+            )
+            update_known_hosts(
+                remove=['hostaa.example.com', '10.0.0.1'],
+                known_hosts_file=self.path,
+            )
+            spawnu.assert_not_called()
+        self.assertEqual(
+            self.path.read_text().splitlines(),
+            self.hostkeys[2:],
+        )
+
+    def test_ansible_single_run(self):
+        payloads = []
+
+        def interact():
+            args = spawnu.call_args.kwargs['args']
+            hostkeys = args[args.index('-e') + 1][1:]
+            payloads.append(json.loads(Path(hostkeys).read_text()))
+
+        with patch('psec.cli.ssh.pexpect.spawnu') as spawnu:
+            spawnu.return_value.interact.side_effect = interact
+            spawnu.return_value.exitstatus = 0
+            update_known_hosts(
+                add=self.hostkeys,
+                remove=['hostaa.example.com'],
+                known_hosts_file=self.path,
+                use_ansible=True,
+            )
+        spawnu.assert_called_once()
+        self.assertEqual(spawnu.call_args.args[0], 'ansible-playbook')
+        self.assertEqual(
+            payloads,
+            [{
+                'ssh_hosts': ['hostaa.example.com'],
+                'ssh_host_public_keys': self.hostkeys,
+                'known_hosts_file': str(self.path),
+            }],
+        )
+        self.assertFalse(self.path.exists())
+
+    def test_ansible_failure(self):
+        with patch('psec.cli.ssh.pexpect.spawnu') as spawnu:
+            spawnu.return_value.exitstatus = 2
+            self.assertRaises(
+                RuntimeError,
+                update_known_hosts,
+                add=self.hostkeys,
+                known_hosts_file=self.path,
+                use_ansible=True,
+            )
+
+
+if __name__ == '__main__':
+    sys.exit(unittest.main())
+
+# vim: set fileencoding=utf-8 ts=4 sw=4 tw=0 et :
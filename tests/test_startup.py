@@ -0,0 +1,89 @@
+#!/usr/bin/env python
+
+"""
+test_startup
+------------
+
+Regression tests for ``psec`` start up (import) cost.
+
+These run ``python -X importtime`` in a fresh interpreter on the modules
+needed to run ``psec secrets get``, which is the command most often run
+from shell prompt hooks and scripts.
+"""
+
+import subprocess  # nosec
+import sys
+import unittest
+
+
+# Modules loaded to run ``psec secrets get``.
+SECRETS_GET_MODULES = ['psec.__main__', 'psec.cli.secrets.get']
+# Packages that only specific subcommands should load.
+DEFERRED_PACKAGES = [
+    'anytree',
+    'bs4',
+    'bullet',
+    'ipwhois',
+    'requests',
+    'xkcdpass',
+]
+# Cumulative import time budget in microseconds.
+IMPORT_BUDGET_US = 250000
+
+
+def importtime(modules):
+    """
+    Return a dictionary mapping the names of the modules imported
+    by importing ``modules`` to their cumulative import times (in
+    microseconds), along with the total for all top-level imports.
+    """
+    result = subprocess.run(  # nosec
+        [
+            sys.executable,
+            '-X', 'importtime',
+            '-c', f"import {', '.join(modules)}",
+        ],
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+        check=True,
+    )
+    times = {}
+    total = 0
+    for line in result.stderr.decode('UTF-8').splitlines():
+        if not line.startswith('import time:'):
+            continue
+        _, cumulative, name = line.split('|')
+        if not cumulative.strip().isdigit():
+            # Header line.
+            continue
+        # Nested imports are indented beyond a single space.
+        if not name.startswith('  '):
+            total += int(cumulative)
+        times[name.strip()] = int(cumulative)
+    return times, total
+
+
+class Test_Startup(unittest.TestCase):
+
+    def setUp(self):
+        self.times, self.total = importtime(SECRETS_GET_MODULES)
+
+    def test_deferred_packages_not_imported(self):
+        loaded = [
+            name for name in self.times
+            if name.split('.')[0] in DEFERRED_PACKAGES
+        ]
+        self.assertEqual(loaded, [])
+
+    def test_import_time_budget(self):
+        self.assertLess(
+            self.total,
+            IMPORT_BUDGET_US,
+            msg=f'importing {SECRETS_GET_MODULES} took {self.total}us',
+        )
+
+
+if __name__ == '__main__':
+    sys.exit(unittest.main())
+
+# vim: set fileencoding=utf-8 ts=4 sw=4 tw=0 et :
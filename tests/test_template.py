@@ -0,0 +1,209 @@
+#!/usr/bin/env python
+
+"""
+test_template
+-------------
+
+Tests for `psec.cli.template` module.
+"""
+
+import json
+import os
+import shutil
+import stat
+import sys
+import tempfile
+import unittest
+
+from pathlib import Path
+from unittest.mock import patch
+
+from psec.cli.template import (
+    find_template_variables,
+    get_directory_templates,
+    get_template_cache_dir,
+    get_template_env,
+    get_template_vars,
+    read_manifest,
+    render_templates,
+    TemplateVariablesCache,
+    TEMPLATE_VARIABLES_FILE,
+)
+from psec.secrets_environment import SecretsEnvironment
+from psec.utils import (
+    secrets_basedir_create,
+    SECRETS_DESCRIPTIONS_DIR,
+    SECRETS_FILE,
+)
+
+
+SECRETS_D = Path(__file__).parent / 'secrets.d'
+
+
+class Test_Template(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = Path(tempfile.mkdtemp())
+        self.basedir = self.tmpdir / 'secrets'
+        secrets_basedir_create(basedir=self.basedir)
+        env_path = self.basedir / 'test'
+        shutil.copytree(SECRETS_D, env_path / SECRETS_DESCRIPTIONS_DIR)
+        (env_path / SECRETS_FILE).write_text(json.dumps({
+            'hypriot_user': 'pirate',
+            'hypriot_password': 'hypriot',
+            'consul_key': None,
+            'jenkins_admin_password': 'unused',
+        }))
+        self.se = SecretsEnvironment(
+            environment='test',
+            secrets_basedir=self.basedir,
+        )
+        self.templates = self.tmpdir / 'templates'
+        self.templates.mkdir()
+        for name, text in [
+            ('main.j2', (
+                '{% extends "base.j2" %}'
+                '{% block body %}{% set local = 1 %}'
+                '{{ hypriot_user }}{{ local }}{% endblock %}'
+            )),
+            ('base.j2', (
+                '{% include "part.j2" %}{% block body %}{% endblock %}'
+            )),
+            ('part.j2', '{{ hypriot_password }}:{{ consul_key }}'),
+            ('dynamic.j2', '{% include hypriot_user ~ ".j2" %}'),
+        ]:
+            (self.templates / name).write_text(text)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_find_template_variables(self):
+        template_env = get_template_env(self.templates)
+        self.assertEqual(
+            find_template_variables(template_env, 'main.j2'),
+            {'hypriot_user', 'hypriot_password', 'consul_key'},
+        )
+        self.assertIsNone(
+            find_template_variables(template_env, 'dynamic.j2'))
+
+    def test_variables_cache(self):
+        cache_path = self.tmpdir / TEMPLATE_VARIABLES_FILE
+        template_env = get_template_env(self.templates)
+        cache = TemplateVariablesCache(cache_path)
+        find_template_variables(template_env, 'main.j2', cache=cache)
+        cache.write()
+        self.assertEqual(stat.S_IMODE(cache_path.stat().st_mode), 0o600)
+        with patch.object(template_env, 'parse') as parse:
+            self.assertEqual(
+                find_template_variables(
+                    template_env,
+                    'main.j2',
+                    cache=TemplateVariablesCache(cache_path),
+                ),
+                {'hypriot_user', 'hypriot_password', 'consul_key'},
+            )
+            parse.assert_not_called()
+
+    def test_get_template_vars(self):
+        self.assertEqual(
+            get_template_vars(
+                self.se,
+                {'hypriot_user', 'consul_key', 'nosuch'},
+            ),
+            {'hypriot_user': 'pirate', 'consul_key': None},
+        )
+
+    def test_render_unset(self):
+        template_env = get_template_env(self.templates)
+        variables = find_template_variables(template_env, 'main.j2')
+        template = template_env.get_template('main.j2')
+        self.assertEqual(
+            template.render(get_template_vars(self.se, variables)),
+            'hypriot:Nonepirate1',
+        )
+
+    def test_bytecode_cache(self):
+        cache_dir = get_template_cache_dir(self.se)
+        self.assertEqual(stat.S_IMODE(cache_dir.stat().st_mode), 0o700)
+        get_template_env(
+            self.templates, cache_dir=cache_dir).get_template('main.j2')
+        cached = list(cache_dir.iterdir())
+        self.assertEqual(len(cached), 1)
+        for path in cached:
+            self.assertEqual(stat.S_IMODE(path.stat().st_mode), 0o600)
+        template_env = get_template_env(self.templates, cache_dir=cache_dir)
+        with patch.object(template_env, 'compile') as compile_:
+            template_env.get_template('main.j2')
+            compile_.assert_not_called()
+
+    def test_render_directory(self):
+        source = self.tmpdir / 'configs'
+        (source / 'app').mkdir(parents=True)
+        for i in range(20):
+            (source / 'app' / f'{i:02d}.conf.j2').write_text(
+                f'{i} {{{{ hypriot_user }}}}\n{{% include "common" %}}')
+        (source / 'common').write_text('{{ hypriot_password }}')
+        dest = self.tmpdir / 'rendered'
+        templates = get_directory_templates(source, dest)
+        self.assertEqual(len(templates), 21)
+        self.assertEqual(
+            templates[1], ['app/00.conf.j2', dest / 'app' / '00.conf'])
+        template_env = get_template_env(source)
+        variables = set()
+        for name, _ in templates:
+            variables.update(find_template_variables(template_env, name))
+        template_vars = get_template_vars(self.se, variables)
+        old_umask = os.umask(0o022)
+        try:
+            changed, failed = render_templates(
+                template_env, templates, template_vars, jobs=4)
+        finally:
+            os.umask(old_umask)
+        self.assertEqual((len(changed), failed), (21, []))
+        output = dest / 'app' / '07.conf'
+        self.assertEqual(output.read_text(), '7 pirate\nhypriot')
+        # New files get the same permissions as with open().
+        self.assertEqual(stat.S_IMODE(output.stat().st_mode), 0o644)
+        self.assertEqual(
+            stat.S_IMODE(output.parent.stat().st_mode), 0o755)
+        os.chmod(output, 0o640)
+        os.utime(output, ns=(0, 0))
+        changed, failed = render_templates(
+            template_env, templates, template_vars, jobs=4)
+        self.assertEqual((changed, failed), ([], []))
+        self.assertEqual(output.stat().st_mtime_ns, 0)
+        template_vars['hypriot_password'] = 'changed'
+        changed, failed = render_templates(
+            template_env, templates, template_vars, jobs=4)
+        self.assertEqual(len(changed), 21)
+        self.assertNotEqual(output.stat().st_mtime_ns, 0)
+        self.assertEqual(stat.S_IMODE(output.stat().st_mode), 0o640)
+
+    def test_render_failures(self):
+        template_env = get_template_env(self.templates)
+        dest = self.tmpdir / 'rendered'
+        changed, failed = render_templates(
+            template_env,
+            [['part.j2', dest / 'part'], ['nosuch.j2', dest / 'nosuch']],
+            {'hypriot_password': 'x', 'consul_key': 'y'},
+        )
+        self.assertEqual(changed, [dest / 'part'])
+        self.assertEqual([name for name, _ in failed], ['nosuch.j2'])
+
+    def test_read_manifest(self):
+        manifest = self.tmpdir / 'manifest'
+        manifest.write_text(
+            '# templates\nmain.j2 out/main.conf\n\npart.j2  part  # x\n')
+        self.assertEqual(
+            read_manifest(manifest),
+            [['main.j2', Path('out/main.conf')], ['part.j2', Path('part')]],
+        )
+        manifest.write_text('main.j2\n')
+        with self.assertRaises(RuntimeError):
+            read_manifest(manifest)
+
+
+if __name__ == '__main__':
+    sys.exit(unittest.main())
+
+# vim: set fileencoding=utf-8 ts=4 sw=4 tw=0 et :
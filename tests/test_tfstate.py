@@ -0,0 +1,167 @@
+#!/usr/bin/env python
+
+"""
+test_tfstate
+------------
+
+Tests for `psec.utils.tfstate` module.
+"""
+
+import json
+import sys
+import tempfile
+import unittest
+
+from pathlib import Path
+from unittest.mock import patch
+
+from psec.utils import tfstate
+from psec.utils.tfstate import (
+    get_output_variables,
+    get_tfstate_outputs,
+    read_tfstate_outputs,
+    scan_tfstate,
+)
+
+
+XGT = {
+    'instance_user': 'ec2-user',
+    'public_ip': '52.27.37.238',
+    'spot_instance_id': ['i-06590cf97d79bdfd9'],
+}
+
+TFSTATE_V4 = {
+    'version': 4,
+    'terraform_version': '1.9.8',
+    'serial': 12,
+    'lineage': 'a8a7b4f0-52a2-4ac5-bd02-7b3c7b3c4f55',
+    'outputs': {
+        'xgt': {
+            'value': XGT,
+            'type': ['object', {'instance_user': 'string'}],
+        },
+        'password': {
+            'value': 'p@ss "word" {with} [brackets]',
+            'type': 'string',
+            'sensitive': True,
+        },
+    },
+    'resources': [
+        {
+            'mode': 'managed',
+            'type': 'aws_instance',
+            'name': 'outputs',
+            'instances': [{'attributes': {'outputs': {'value': 'no'}}}],
+        },
+    ],
+}
+
+TFSTATE_V3 = {
+    'version': 3,
+    'terraform_version': '0.11.14',
+    'serial': 3,
+    'modules': [
+        {
+            'path': ['root', 'network'],
+            'outputs': {'vpc_id': {'type': 'string', 'value': 'vpc-1'}},
+            'resources': {},
+        },
+        {
+            'path': ['root'],
+            'outputs': {
+                'xgt': {'sensitive': False, 'type': 'map', 'value': XGT},
+            },
+            'resources': {
+                'aws_instance.xgt': {'primary': {'id': 'i-0659'}},
+            },
+        },
+    ],
+}
+
+
+class Test_tfstate(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.path = Path(self.tmpdir.name) / 'terraform.tfstate'
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def write_state(self, state, trailer=''):
+        self.path.write_text(json.dumps(state, indent=2) + trailer)
+
+    def test_v4(self):
+        self.write_state(TFSTATE_V4)
+        outputs = read_tfstate_outputs(self.path)
+        self.assertEqual(outputs['xgt']['value'], XGT)
+        self.assertEqual(
+            outputs['password'],
+            {
+                'sensitive': True,
+                'type': 'string',
+                'value': 'p@ss "word" {with} [brackets]',
+            },
+        )
+
+    def test_v4_resources_not_read(self):
+        state = json.dumps(TFSTATE_V4)
+        # Anything after the outputs is never decoded.
+        self.path.write_text(
+            state[:state.index('"resources"')] + '"resources": [{{{ ...'
+        )
+        self.assertEqual(
+            read_tfstate_outputs(self.path)['xgt']['value'], XGT)
+
+    def test_v3(self):
+        self.write_state(TFSTATE_V3)
+        self.assertEqual(
+            read_tfstate_outputs(self.path),
+            {'xgt': {'sensitive': False, 'type': 'map', 'value': XGT}},
+        )
+
+    def test_no_outputs(self):
+        self.assertEqual(scan_tfstate(b'{"version": 4, "resources": []}'),
+                         (4, {}))
+        self.assertEqual(
+            scan_tfstate(b'{"version": 3, "modules": [{"path": ["root"]}]}'),
+            (3, {}),
+        )
+
+    def test_invalid(self):
+        for content in ['', '[]', '{"outputs": {}}', '{"version": 4, ']:
+            self.path.write_text(content)
+            with self.assertRaises(RuntimeError):
+                read_tfstate_outputs(self.path)
+
+    def test_fallback(self):
+        self.write_state(dict(TFSTATE_V4, version=5))
+        with patch.object(
+            tfstate, 'terraform_outputs', return_value={}
+        ) as terraform:
+            with patch.object(tfstate.shutil, 'which', return_value=None):
+                with self.assertRaisesRegex(RuntimeError, 'version 5'):
+                    get_tfstate_outputs(self.path)
+            with patch.object(
+                tfstate.shutil, 'which', return_value='/usr/bin/terraform'
+            ):
+                self.assertEqual(get_tfstate_outputs(self.path), {})
+            terraform.assert_called_once_with(self.path)
+
+    def test_get_output_variables(self):
+        self.write_state(TFSTATE_V4)
+        self.assertEqual(
+            get_output_variables(read_tfstate_outputs(self.path)),
+            [
+                ['xgt_instance_user', 'ec2-user'],
+                ['xgt_public_ip', '52.27.37.238'],
+                ['xgt_spot_instance_id', ['i-06590cf97d79bdfd9']],
+                ['password', 'p@ss "word" {with} [brackets]'],
+            ],
+        )
+
+
+if __name__ == '__main__':
+    sys.exit(unittest.main())
+
+# vim: set fileencoding=utf-8 ts=4 sw=4 tw=0 et :
@@ -7,9 +7,19 @@ test_psec.utils
 Tests for `psec.utils` module.
 """
 
-import psec.utils
+import os
+import shutil
+import stat
+import sys
+import tempfile
+import time
 import unittest
 
+from pathlib import Path
+from unittest.mock import patch
+
+import psec.utils
+
 
 class Test_Utils(unittest.TestCase):
 
@@ -39,6 +49,193 @@ class Test_Utils(unittest.TestCase):
                                'something_not_there') is None
 
 
+@unittest.skipIf(sys.platform.startswith("win"), "not for Windows")
+class Test_Permissions(unittest.TestCase):
+
+    def setUp(self):
+        self.root = Path(tempfile.mkdtemp())
+        self.tree = self.root / 'env'
+        (self.tree / 'secrets.d').mkdir(parents=True)
+        (self.tree / 'secrets.json').write_text('{}')
+        (self.tree / 'secrets.d' / 'group.json').write_text('[]')
+        self.outside = self.root / 'outside'
+        self.outside.write_text('')
+        (self.tree / 'link').symlink_to(self.outside)
+        for path in [self.outside, *self.tree.rglob('*'), self.tree]:
+            if not path.is_symlink():
+                path.chmod(0o777 if path.is_dir() else 0o666)
+
+    def tearDown(self):
+        shutil.rmtree(self.root)
+
+    def mode(self, path):
+        return stat.S_IMODE(os.lstat(path).st_mode)
+
+    def test_remove_other_perms(self):
+        with patch('subprocess.check_output') as check_output:
+            psec.utils.remove_other_perms(self.tree)
+            check_output.assert_not_called()
+        self.assertEqual(self.mode(self.tree), 0o770)
+        self.assertEqual(self.mode(self.tree / 'secrets.d'), 0o770)
+        self.assertEqual(self.mode(self.tree / 'secrets.json'), 0o660)
+        self.assertEqual(
+            self.mode(self.tree / 'secrets.d' / 'group.json'), 0o660
+        )
+        # Symbolic links are not followed.
+        self.assertEqual(self.mode(self.outside), 0o666)
+
+    def test_remove_other_perms_skips_fs_without_perms(self):
+        with patch('psec.utils.get_fs_type', return_value='FAT32'):
+            psec.utils.remove_other_perms(self.tree)
+        self.assertEqual(self.mode(self.tree / 'secrets.json'), 0o666)
+
+    def test_fs_type_cached_by_device(self):
+        psec.utils.get_fs_type(self.tree)
+        with patch('psec.utils._lookup_fs_type') as lookup:
+            fs_type = psec.utils.get_fs_type(self.tree / 'secrets.json')
+            lookup.assert_not_called()
+        self.assertEqual(fs_type, psec.utils.get_fs_type(self.root))
+
+    def test_unescape_mount_path(self):
+        self.assertEqual(
+            psec.utils._unescape_mount_path('/mnt/My\\040Drive'),
+            '/mnt/My Drive',
+        )
+
+
+@unittest.skipIf(sys.platform.startswith("win"), "not for Windows")
+class Test_permissions_check(unittest.TestCase):
+
+    def setUp(self):
+        self.old_umask = os.umask(0o077)
+        self.basedir = Path(tempfile.mkdtemp())
+        for env in ['one', 'two']:
+            (self.basedir / env / 'tmp').mkdir(parents=True)
+            (self.basedir / env / 'secrets.json').write_text('{}')
+        self.open_file = self.basedir / 'two' / 'tmp' / 'open'
+        self.open_file.write_text('')
+        self.open_file.chmod(0o644)
+        self.journal = self.basedir / psec.utils.PERMISSIONS_JOURNAL
+
+    def tearDown(self):
+        os.umask(self.old_umask)
+        shutil.rmtree(self.basedir)
+
+    def check(self, verbose_level=1, **kwargs):
+        with patch('sys.stderr'):
+            return psec.utils.permissions_check(
+                str(self.basedir), verbose_level=verbose_level, **kwargs
+            )
+
+    def age(self, seconds=60):
+        """Make directories old enough to be journaled."""
+        mtime = time.time_ns() - seconds * 1000000000
+        for path in [self.basedir, *self.basedir.rglob('*')]:
+            if path.is_dir():
+                os.utime(path, ns=(mtime, mtime))
+
+    def test_environment_scope(self):
+        self.assertEqual(self.check(environment='one'), [])
+        self.assertEqual(
+            self.check(environment='two'),
+            [(str(self.open_file), 0o644)],
+        )
+
+    def test_each_directory_checked_once(self):
+        (self.basedir / 'one' / 'tmp').chmod(0o755)
+        for name in ['a', 'b', 'c']:
+            (self.basedir / 'one' / name).write_text('')
+        found = self.check(environment='one')
+        self.assertEqual(found, [(str(self.basedir / 'one' / 'tmp'), 0o755)])
+
+    def test_quiet(self):
+        self.assertEqual(self.check(environment='two', verbose_level=0), [])
+
+    def test_basedir_journal(self):
+        self.age()
+        self.assertEqual(self.check(), [(str(self.open_file), 0o644)])
+        self.assertTrue(self.journal.exists())
+        self.assertEqual(stat.S_IMODE(self.journal.stat().st_mode), 0o600)
+        with patch('os.scandir', wraps=os.scandir) as scandir:
+            self.assertEqual(self.check(), [(str(self.open_file), 0o644)])
+            # Only the top directory and the directory with a problem
+            # are examined again.
+            self.assertEqual(
+                [str(c.args[0]) for c in scandir.call_args_list],
+                [str(self.basedir), str(self.open_file.parent)],
+            )
+
+    def test_basedir_journal_sees_new_files(self):
+        self.age()
+        self.check()
+        new_file = self.basedir / 'one' / 'tmp' / 'new'
+        new_file.write_text('')
+        new_file.chmod(0o604)
+        found = self.check()
+        self.assertIn((str(new_file), 0o604), found)
+
+
+class Test_discover_environments(unittest.TestCase):
+
+    def setUp(self):
+        self.basedir = Path(tempfile.mkdtemp())
+        (self.basedir / 'valid' / 'secrets.d').mkdir(parents=True)
+        (self.basedir / 'json_only').mkdir()
+        (self.basedir / 'json_only' / 'secrets.json').write_text('{}')
+        (self.basedir / 'old' / 'secrets.d').mkdir(parents=True)
+        (self.basedir / 'old' / 'secrets.d' / 'group.yml').write_text('')
+        (self.basedir / 'old_file').mkdir()
+        (self.basedir / 'old_file' / 'secrets.yml').write_text('')
+        # Only fixed locations count, not files deep in the tree.
+        (self.basedir / 'other' / 'tmp').mkdir(parents=True)
+        (self.basedir / 'other' / 'tmp' / 'secrets.json').write_text('{}')
+        (self.basedir / 'alias').symlink_to(self.basedir / 'valid')
+        (self.basedir / '.psec').write_text('')
+
+    def tearDown(self):
+        shutil.rmtree(self.basedir)
+
+    def test_discover_environments(self):
+        found = {
+            info.path.name: info
+            for info in psec.utils.discover_environments(self.basedir)
+        }
+        self.assertEqual(
+            sorted(found),
+            ['alias', 'json_only', 'old', 'old_file', 'other', 'valid'],
+        )
+        self.assertEqual(
+            sorted(name for name, info in found.items() if info.valid),
+            ['alias', 'json_only', 'valid'],
+        )
+        self.assertEqual(
+            sorted(
+                name for name, info in found.items()
+                if info.needs_conversion
+            ),
+            ['old', 'old_file'],
+        )
+        self.assertEqual(found['alias'].alias_for, 'valid')
+        self.assertIsNone(found['valid'].alias_for)
+
+    def test_get_environment_paths(self):
+        self.assertEqual(
+            [p.name for p in psec.utils.get_environment_paths(self.basedir)],
+            ['alias', 'json_only', 'valid'],
+        )
+
+    def test_is_valid_environment(self):
+        self.assertTrue(
+            psec.utils.is_valid_environment(self.basedir / 'valid')
+        )
+        self.assertFalse(
+            psec.utils.is_valid_environment(self.basedir / 'old')
+        )
+        self.assertFalse(
+            psec.utils.is_valid_environment(self.basedir / 'missing')
+        )
+
+
 if __name__ == '__main__':
     import sys
     sys.exit(unittest.main())
@@ -0,0 +1,103 @@
+#!/usr/bin/env python
+
+"""
+test_yaml_to_json
+-----------------
+
+Tests for `psec.cli.utils.yaml_to_json` module.
+"""
+
+import json
+import os
+import shutil
+import stat
+import sys
+import tempfile
+import unittest
+
+from pathlib import Path
+
+import yaml
+
+from psec.cli.utils.yaml_to_json import (
+    convert_yaml_files,
+    find_yaml_secrets_files,
+)
+
+
+YAML_SECRETS_D = Path(__file__).parent / 'yamlsecrets' / 'secrets.d'
+
+
+class Test_YAMLToJSON(unittest.TestCase):
+
+    def setUp(self):
+        self.basedir = Path(tempfile.mkdtemp())
+        for environment in ['one', 'two', '.hidden']:
+            env_path = self.basedir / environment
+            shutil.copytree(YAML_SECRETS_D, env_path / 'secrets.d')
+            (env_path / 'secrets.yml').write_text(
+                'jenkins_admin_password: secret\n')
+            os.chmod(env_path / 'secrets.yml', 0o600)
+        (self.basedir / 'two' / 'notes.yml').write_text('not: secrets\n')
+
+    def tearDown(self):
+        shutil.rmtree(self.basedir)
+
+    def test_find_yaml_secrets_files(self):
+        found = find_yaml_secrets_files(self.basedir)
+        self.assertEqual(
+            [str(path.relative_to(self.basedir)) for path in found[:5]],
+            [
+                'one/secrets.yml',
+                'one/secrets.d/jenkins.yml',
+                'one/secrets.d/myapp.yml',
+                'one/secrets.d/oauth.yml',
+                'one/secrets.d/trident.yml',
+            ],
+        )
+        self.assertEqual(len(found), 10)
+
+    def test_convert_yaml_files(self):
+        yaml_files = find_yaml_secrets_files(self.basedir)
+        expected = {
+            path.with_suffix('.json'): yaml.safe_load(path.read_text())
+            for path in yaml_files
+        }
+        self.assertEqual(
+            convert_yaml_files(yaml_files, jobs=2, shred_jobs=2), [])
+        for json_file, content in expected.items():
+            self.assertEqual(json.loads(json_file.read_text()), content)
+            self.assertFalse(json_file.with_suffix('.yml').exists())
+        self.assertEqual(
+            stat.S_IMODE(
+                (self.basedir / 'one' / 'secrets.json').stat().st_mode),
+            0o600,
+        )
+
+    def test_keep_original(self):
+        yaml_files = find_yaml_secrets_files(self.basedir)
+        self.assertEqual(
+            convert_yaml_files(yaml_files, keep_original=True, jobs=1), [])
+        for path in yaml_files:
+            self.assertTrue(path.exists())
+            self.assertTrue(path.with_suffix('.json').exists())
+
+    def test_failures_not_removed(self):
+        bad = self.basedir / 'one' / 'secrets.d' / 'bad.yml'
+        bad.write_text('key: [unclosed\n')
+        empty = self.basedir / 'one' / 'secrets.d' / 'empty.yml'
+        empty.write_text('')
+        yaml_files = find_yaml_secrets_files(self.basedir)
+        failed = convert_yaml_files(yaml_files, jobs=2)
+        self.assertEqual([path for path, _ in failed], [bad, empty])
+        for path in [bad, empty]:
+            self.assertTrue(path.exists())
+            self.assertFalse(path.with_suffix('.json').exists())
+        self.assertFalse(
+            (self.basedir / 'one' / 'secrets.d' / 'myapp.yml').exists())
+
+
+if __name__ == '__main__':
+    sys.exit(unittest.main())
+
+# vim: set fileencoding=utf-8 ts=4 sw=4 tw=0 et :